@@ -0,0 +1 @@
+''' Benchmarks which run outside Kodi against recorded or local data '''
@@ -0,0 +1,282 @@
+#! /usr/bin/python
+''' Local stand-in for a build server
+
+Serves synthetic OpenELEC-<arch>-devel-...tar.bz2 builds with an Apache style
+directory listing. Range requests are supported and the transfer can be
+shaped with a fixed latency, a bandwidth limit and injected connection drops.
+
+    python -m benchmarks.buildserver --port 8000 --bandwidth 4 --latency 0.05
+'''
+
+from __future__ import division
+
+import os
+import re
+import bz2
+import time
+import tarfile
+import hashlib
+import threading
+import SocketServer
+import BaseHTTPServer
+from datetime import datetime, timedelta
+from argparse import ArgumentParser
+
+from . import fixtures
+
+
+CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'devupdate-bench')
+
+CHUNK_SIZE = 65536
+
+
+def build_name(arch, index):
+    dt = datetime(2016, 1, 1, 4, 30) + timedelta(days=index)
+    return "OpenELEC-{}-devel-{}-r{}-g{:07x}".format(
+        arch, dt.strftime('%Y%m%d%H%M%S'), 22000 + index, 0xabc000 + index)
+
+
+def _write_image(f, size, hasher):
+    """Write half random, half zero data so the image compresses like a real one."""
+    written = 0
+    while written < size:
+        n = min(CHUNK_SIZE, size - written)
+        data = os.urandom(n // 2) + '\0' * (n - n // 2)
+        f.write(data)
+        hasher.update(data)
+        written += n
+
+
+def _write_checksum(path):
+    """Write the sha256 file which build servers publish next to a build."""
+    hasher = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(CHUNK_SIZE), ''):
+            hasher.update(data)
+    with open(path + '.sha256', 'w') as f:
+        f.write("{}  {}\n".format(hasher.hexdigest(), os.path.basename(path)))
+
+
+def make_build(directory, name, system_size, kernel_size):
+    """Create name.tar.bz2 in directory containing SYSTEM and KERNEL images with
+       their md5 files in the same layout as a real build, and its sha256 file.
+    """
+    bz2_path = os.path.join(directory, name + '.tar.bz2')
+    if os.path.isfile(bz2_path):
+        if not os.path.isfile(bz2_path + '.sha256'):
+            _write_checksum(bz2_path)
+        return bz2_path
+
+    work_dir = os.path.join(directory, name + '.work')
+    target_dir = os.path.join(work_dir, name, 'target')
+    os.makedirs(target_dir)
+
+    for image, size in (('SYSTEM', system_size), ('KERNEL', kernel_size)):
+        hasher = hashlib.md5()
+        with open(os.path.join(target_dir, image), 'wb') as f:
+            _write_image(f, size, hasher)
+        with open(os.path.join(target_dir, image + '.md5'), 'w') as f:
+            f.write("{}  target/{}\n".format(hasher.hexdigest(), image))
+
+    tar_path = os.path.join(directory, name + '.tar')
+    with tarfile.open(tar_path, 'w') as tf:
+        tf.add(os.path.join(work_dir, name), arcname=name)
+
+    with open(tar_path, 'rb') as fin:
+        compressor = bz2.BZ2Compressor()
+        with open(bz2_path + '.tmp', 'wb') as fout:
+            for data in iter(lambda: fin.read(CHUNK_SIZE), ''):
+                fout.write(compressor.compress(data))
+            fout.write(compressor.flush())
+    os.rename(bz2_path + '.tmp', bz2_path)
+    _write_checksum(bz2_path)
+
+    os.remove(tar_path)
+    for root, dirs, files in os.walk(work_dir, topdown=False):
+        for filename in files:
+            os.remove(os.path.join(root, filename))
+        os.rmdir(root)
+
+    return bz2_path
+
+
+def make_builds(arches, count, system_size, kernel_size, cache_dir=CACHE_DIR):
+    """Return the directory holding count builds for each arch, creating them
+       if necessary. Builds of the same size are shared between runs.
+    """
+    directory = os.path.join(cache_dir, "{}-{}".format(system_size, kernel_size))
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    for arch in arches:
+        for index in range(count):
+            make_build(directory, build_name(arch, index), system_size, kernel_size)
+    return directory
+
+
+class Shaping(object):
+    """Transfer shaping applied to every file response."""
+    def __init__(self, latency=0, bandwidth=None, drop_after=None, drops=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.drop_after = drop_after
+        self._drops = drops
+        self._lock = threading.Lock()
+
+    def take_drop(self):
+        """Return True if the current response should be dropped."""
+        with self._lock:
+            if self.drop_after is not None and self._drops > 0:
+                self._drops -= 1
+                return True
+            return False
+
+
+class BuildRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)$")
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body):
+        shaping = self.server.shaping
+        if shaping.latency:
+            time.sleep(shaping.latency)
+
+        filename = self.path.lstrip('/').split('?')[0]
+        if not filename:
+            body = self._listing()
+            self._send_headers(200, len(body), 'text/html')
+            if send_body:
+                self.wfile.write(body)
+            return
+
+        path = os.path.join(self.server.directory, os.path.basename(filename))
+        if not os.path.isfile(path):
+            self._send_headers(404, 0)
+            return
+
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        m = self.RANGE_RE.match(self.headers.get('Range', ''))
+        if m:
+            start = int(m.group(1))
+            if m.group(2):
+                end = min(int(m.group(2)), size - 1)
+            if start >= size:
+                self._send_headers(416, 0, extra={'Content-Range': "bytes */{}".format(size)})
+                return
+            self._send_headers(206, end - start + 1, 'application/x-bzip2',
+                               {'Content-Range': "bytes {}-{}/{}".format(start, end, size)})
+        else:
+            self._send_headers(200, size, 'application/x-bzip2')
+
+        if send_body:
+            self._send_file(path, start, end - start + 1, shaping)
+
+    def _send_headers(self, status, length, content_type='text/plain', extra={}):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        for key, value in extra.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _send_file(self, path, start, length, shaping):
+        drop_at = None
+        if shaping.take_drop():
+            drop_at = int(length * shaping.drop_after)
+
+        sent = 0
+        start_time = time.time()
+        with open(path, 'rb') as f:
+            f.seek(start)
+            while sent < length:
+                n = min(CHUNK_SIZE, length - sent)
+                if drop_at is not None and sent + n > drop_at:
+                    self.wfile.write(f.read(drop_at - sent))
+                    self.server.dropped += 1
+                    self.close_connection = 1
+                    return
+                self.wfile.write(f.read(n))
+                sent += n
+                self.server.bytes_sent += n
+                if shaping.bandwidth:
+                    delay = sent / shaping.bandwidth - (time.time() - start_time)
+                    if delay > 0:
+                        time.sleep(delay)
+
+    def _listing(self):
+        names = sorted(name for name in os.listdir(self.server.directory)
+                       if name.endswith('.tar.bz2'))
+        rows = "\n".join('<tr><td><a href="{0}">{0}</a></td><td align="right">{1}</td></tr>'
+                         .format(name, os.path.getsize(os.path.join(self.server.directory,
+                                                                    name)))
+                         for name in names)
+        return ("<html><head><title>Index of /</title></head><body>"
+                "<h1>Index of /</h1><table>{}</table></body></html>".format(rows))
+
+    def log_message(self, format, *args):
+        pass
+
+
+class BuildServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, directory, shaping=None, port=0):
+        BaseHTTPServer.HTTPServer.__init__(self, ('127.0.0.1', port), BuildRequestHandler)
+        self.directory = directory
+        self.shaping = shaping or Shaping()
+        self.bytes_sent = 0
+        self.dropped = 0
+
+    def handle_error(self, request, client_address):
+        # Clients closing the connection early are expected.
+        pass
+
+    @property
+    def url(self):
+        return "http://127.0.0.1:{}/".format(self.server_address[1])
+
+    def start(self):
+        thread = threading.Thread(target=self.serve_forever)
+        thread.daemon = True
+        thread.start()
+        return self
+
+
+def main():
+    parser = ArgumentParser(description='Serve synthetic OpenELEC builds')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--arch', action='append',
+                        help='build arch, may be repeated (default: {})'.format(fixtures.ARCH))
+    parser.add_argument('--count', type=int, default=3, help='builds per arch')
+    parser.add_argument('--system-mb', type=float, default=32)
+    parser.add_argument('--kernel-mb', type=float, default=4)
+    parser.add_argument('--latency', type=float, default=0, help='seconds per request')
+    parser.add_argument('--bandwidth', type=float, help='MB/s per response')
+    parser.add_argument('--drop-after', type=float,
+                        help='fraction of a response after which the connection is dropped')
+    parser.add_argument('--drops', type=int, default=1,
+                        help='number of responses to drop (default: %(default)s)')
+    args = parser.parse_args()
+
+    directory = make_builds(args.arch or [fixtures.ARCH], args.count,
+                            int(args.system_mb * 1e6), int(args.kernel_mb * 1e6))
+    shaping = Shaping(args.latency, args.bandwidth and args.bandwidth * 1e6,
+                      args.drop_after, args.drops)
+    server = BuildServer(directory, shaping, args.port)
+    print "Serving {} at {}".format(directory, server.url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,249 @@
+''' Fixture pages for the benchmarks
+
+Each fixture is recorded from the live site with --record into
+benchmarks/fixtures, where the recorded pages are committed. When a fixture
+has not been recorded a deterministic page with the same structure and a
+realistic size is generated in GENERATED_DIR instead, so the benchmarks
+always run offline, and the results say which pages were generated.
+'''
+
+import os
+import json
+import random
+from datetime import datetime, timedelta
+from argparse import ArgumentParser
+
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+GENERATED_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'devupdate-bench', 'fixtures')
+
+ARCHES = ('RPi.arm', 'RPi2.arm', 'Generic.x86_64', 'Generic.i386',
+          'imx6.arm', 'WeTek_Play.arm')
+
+# The architecture which the fixtures are parsed for.
+ARCH = 'RPi2.arm'
+
+MILHOUSE_THREAD = 231092
+MILHOUSE_PID = 2200500
+
+
+def _dates(count, start=datetime(2016, 1, 1, 4, 30)):
+    for i in range(count):
+        yield start + timedelta(days=i, minutes=i * 7 % 60)
+
+
+def _sha(rand):
+    return "{:07x}".format(rand.getrandbits(28))
+
+
+def _listing(title, hrefs):
+    rows = "\n".join('<tr><td valign="top"><img src="/icons/compressed.gif" alt="[   ]"></td>'
+                     '<td><a href="{0}">{0}</a></td>'
+                     '<td align="right">01-Jan-2016 04:30  </td>'
+                     '<td align="right">105M</td><td>&nbsp;</td></tr>'.format(href)
+                     for href in hrefs)
+    return ('<!DOCTYPE HTML PUBLIC "-//W3C//DTD HTML 3.2 Final//EN">\n'
+            '<html><head><title>Index of {0}</title></head><body>\n'
+            '<h1>Index of {0}</h1><table>\n'
+            '<tr><th>Name</th><th>Last modified</th><th>Size</th><th>Description</th></tr>\n'
+            '<tr><th colspan="5"><hr></th></tr>\n'
+            '<tr><td><a href="/">Parent Directory</a></td></tr>\n'
+            '{1}\n</table></body></html>\n').format(title, rows)
+
+
+def snapshots():
+    rand = random.Random(1)
+    hrefs = []
+    for dt in _dates(150):
+        revision = 22000 + dt.toordinal() % 1000
+        for arch in ARCHES:
+            hrefs.append("OpenELEC-{}-devel-{}-r{}-g{}.tar.bz2".format(
+                arch, dt.strftime('%Y%m%d%H%M%S'), revision, _sha(rand)))
+    return _listing("/", hrefs)
+
+
+def milhouse():
+    rand = random.Random(2)
+    hrefs = []
+    for i, dt in enumerate(_dates(300)):
+        hrefs.append("OpenELEC-{}-7.0-Milhouse-{}-%23{:04d}{}-g{}.tar".format(
+            ARCH, dt.strftime('%Y%m%d%H%M%S'), 101 + i, 'b' if i % 9 == 0 else '',
+            _sha(rand)))
+    return _listing("/builds/master/RPi2", hrefs)
+
+
+def dropbox():
+    rand = random.Random(3)
+    items = []
+    for dt in _dates(120):
+        name = "OpenELEC-{}-devel-{}-r22{:03d}-g{}.tar.bz2".format(
+            ARCH, dt.strftime('%Y%m%d%H%M%S'), dt.day, _sha(rand))
+        items.append('<li class="sl-grid-cell"><div class="sl-file">'
+                     '<a class="filename-link" href="https://www.dropbox.com/sh/abc123/{0}?dl=0">'
+                     '<div class="sl-grid-filename">{0}</div></a>'
+                     '<span class="sl-size">105 MB</span></div></li>'.format(name))
+    return ('<!DOCTYPE html><html><head><title>Dropbox - OpenELEC</title>'
+            '<script>{}</script></head><body><ol class="sl-grid-body">{}</ol>'
+            '</body></html>').format("var x = 1;" * 2000, "\n".join(items))
+
+
+def releases():
+    hrefs = []
+    for major in range(4, 8):
+        for minor in range(0, 10):
+            for patch in range(0, 9):
+                for arch in ARCHES:
+                    hrefs.append("OpenELEC-{}-{}.{}.{}.tar".format(arch, major, minor, patch))
+    return _listing("/", hrefs)
+
+
+def github_releases():
+    tags = []
+    for i, dt in enumerate(_dates(10, datetime(2015, 1, 1))):
+        version = "7.{}.{}".format(i // 5, i % 5)
+        tags.append('<div class="release label-latest">'
+                    '<div class="release-meta"><p class="release-date">'
+                    '<relative-time datetime="{}Z">{}</relative-time></p>'
+                    '<ul class="tag-references"><li><a href="/OpenELEC/OpenELEC.tv/tree/{}">'
+                    '<span class="tag-name">{}</span></a></li></ul></div>'
+                    '<div class="release-body"><div class="markdown-body">{}</div></div>'
+                    '</div>'.format(dt.isoformat(), dt.strftime('%b %d, %Y'), version,
+                                    version, "<p>Changes in this release.</p>" * 40))
+    versions = ["{}.{}.{}".format(major, minor, patch)
+                for major in range(4, 8) for minor in range(10) for patch in range(9)]
+    for version, dt in zip(versions, _dates(len(versions), datetime(2013, 1, 1))):
+        tags.append('<div class="release-timeline-tags"><span class="date">'
+                    '<relative-time datetime="{}Z">{}</relative-time></span>'
+                    '<span class="tag-name">{}</span></div>'.format(
+                        dt.isoformat(), dt.strftime('%b %d, %Y'), version))
+    return ('<!DOCTYPE html><html><head><title>Releases</title></head><body>'
+            '<div class="header">{}</div><div class="release-timeline">{}</div>'
+            '</body></html>').format('<a href="#">nav</a>' * 300, "\n".join(tags))
+
+
+def github_commits():
+    rand = random.Random(4)
+    commits = []
+    for dt in _dates(100):
+        sha = "{:040x}".format(rand.getrandbits(160))
+        commits.append({
+            'sha': sha,
+            'url': "https://api.github.com/repos/OpenELEC/OpenELEC.tv/commits/" + sha,
+            'commit': {'message': "Merge pull request #{} from someone/branch\n\n"
+                                  "package: update to version {}".format(dt.day, sha[:5]),
+                       'author': {'name': "Someone", 'date': dt.isoformat() + 'Z'},
+                       'committer': {'name': "GitHub", 'date': dt.isoformat() + 'Z'}},
+            'author': {'login': "someone", 'id': 1},
+            'parents': [{'sha': sha[::-1]}]})
+    return json.dumps(commits, indent=2)
+
+
+def _forum_post(pid, body):
+    return ('<div class="post classic" id="post_{0}"><div class="post_author">'
+            '<div class="author_avatar"><img src="avatar.png"></div>'
+            '<div class="author_information"><strong>Milhouse</strong></div></div>'
+            '<div class="post_content"><div class="post_head">Post: #{0}</div>'
+            '<div class="post-body" id="pid_{0}">{1}</div></div>'
+            '<div class="post_controls"><a href="#">Reply</a></div></div>'.format(pid, body))
+
+
+def forum_thread():
+    posts = []
+    build = 700
+    for i in range(20):
+        pid = MILHOUSE_PID + i
+        if i < 3:
+            items = []
+            for j in range(60):
+                build -= 1
+                items.append('<li>#{:04d}: {} ({} - <a href="http://forum.kodi.tv/'
+                             'showthread.php?tid={}&amp;pid={}#pid{}">Release post</a>)'
+                             '</li>'.format(build, "Kodi master, kernel 4.4",
+                                            "Build summary %d" % build,
+                                            MILHOUSE_THREAD, pid, pid))
+            body = "<p>Builds:</p><ul>{}</ul>".format("".join(items))
+        else:
+            body = ("<p><b>Build Highlights:</b></p><ol>{}</ol>"
+                    "<p><b>Build Details:</b></p><ul>{}</ul>").format(
+                        "<li>A highlight of this build</li>" * 10,
+                        "<li>Kodi: pull request merged (<a href=\"#\">link</a>)</li>" * 60)
+        posts.append(_forum_post(pid, body))
+    return ('<!DOCTYPE html><html><head><title>Milhouse builds</title>'
+            '<script>{}</script></head><body><div id="container">{}'
+            '<div id="posts">{}</div>{}</div></body></html>').format(
+                "var x = 1;" * 3000, '<div class="navigation">nav</div>' * 200,
+                "\n".join(posts), '<div class="footer">footer</div>' * 100)
+
+
+# name: (live URL recorded with --record, generator, file extension)
+FIXTURES = {
+    'snapshots': ("http://snapshots.openelec.tv/", snapshots, 'html'),
+    'milhouse': ("http://milhouse.openelec.tv/builds/master/RPi2/", milhouse, 'html'),
+    'dropbox': ("https://www.dropbox.com/sh/xjd0vm0wbqgxt5m/AACzo6I2pGn2wLdjmrNmTzVEa",
+                dropbox, 'html'),
+    'releases': ("http://archive.openelec.tv/", releases, 'html'),
+    'github_releases': ("http://github.com/OpenELEC/OpenELEC.tv/releases",
+                        github_releases, 'html'),
+    'github_commits': ("https://api.github.com/repositories/1093060/commits?per_page=100",
+                       github_commits, 'json'),
+    'forum_thread': ("http://forum.kodi.tv/showthread.php?tid={}".format(MILHOUSE_THREAD),
+                     forum_thread, 'html'),
+}
+
+
+def path(name, fixtures_dir=FIXTURES_DIR):
+    return os.path.join(fixtures_dir, "{}.{}".format(name, FIXTURES[name][2]))
+
+
+def is_recorded(fixture_path):
+    return os.path.dirname(os.path.abspath(fixture_path)) != os.path.abspath(GENERATED_DIR)
+
+
+def ensure(fixtures_dir=FIXTURES_DIR):
+    """Return the paths of the fixtures, generating any which have not been
+       recorded.
+    """
+    if not os.path.isdir(GENERATED_DIR):
+        os.makedirs(GENERATED_DIR)
+
+    paths = {}
+    for name, (url, generator, ext) in FIXTURES.items():
+        paths[name] = path(name, fixtures_dir)
+        if not os.path.isfile(paths[name]):
+            paths[name] = path(name, GENERATED_DIR)
+            if not os.path.isfile(paths[name]):
+                with open(paths[name], 'wb') as f:
+                    f.write(generator())
+    return paths
+
+
+def record(names, fixtures_dir=FIXTURES_DIR):
+    """Download the live pages to replace the generated fixtures."""
+    import requests
+
+    if not os.path.isdir(fixtures_dir):
+        os.makedirs(fixtures_dir)
+
+    for name in names:
+        url = FIXTURES[name][0]
+        print "Recording {} from {}".format(name, url)
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        with open(path(name, fixtures_dir), 'wb') as f:
+            f.write(response.content)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description='Generate or record the benchmark fixtures')
+    parser.add_argument('--record', nargs='*', metavar='NAME', choices=sorted(FIXTURES),
+                        help='record the named fixtures (default: all) from the live sites')
+    parser.add_argument('--dir', default=FIXTURES_DIR,
+                        help='recorded fixtures directory (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.record is not None:
+        record(args.record or sorted(FIXTURES), args.dir)
+    for name, fixture_path in sorted(ensure(args.dir).items()):
+        print "{:16s} {:>9d}  {:9s}  {}".format(
+            name, os.path.getsize(fixture_path),
+            'recorded' if is_recorded(fixture_path) else 'generated', fixture_path)
@@ -0,0 +1,256 @@
+#! /usr/bin/python
+''' End to end benchmarks of the build select dialog and an installation
+
+Each case runs default.py or the dialog in a fresh process against the Kodi
+stubs, with the dialog driven by a script as a user would. Besides the time
+taken, each case reports the GUI and xbmcvfs calls made and, for the
+installations, the time of each phase from the timing log.
+
+    select         open the dialog on the fixture pages, switch sources,
+                   page through and filter the builds and choose one
+    install        install the newest build from a local build server
+    install_smb    the same, archiving the build to an SMB share with a
+                   fixed latency and bandwidth
+
+    python -m benchmarks.flow --output results.json
+'''
+
+from __future__ import division
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import threading
+import subprocess
+from collections import OrderedDict
+from argparse import ArgumentParser, SUPPRESS
+
+from . import buildserver, fixtures, report
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kodistubs')
+
+SKIN_FILE = 'script-devupdate-main.xml'
+
+# name: environment of the case process
+CASES = OrderedDict([
+    ('select', {}),
+    ('install', {}),
+    ('install_smb', {'KODI_VFS_LATENCY': '0.01', 'KODI_VFS_BANDWIDTH': '12.5e6'}),
+])
+
+ARCHIVE_ROOT = 'smb://nas/builds/'
+
+TOP_CALLS = 15
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _routes(paths):
+    from resources.lib import builds
+
+    return {"http://snapshots.openelec.tv": paths['snapshots'],
+            "http://milhouse.openelec.tv/builds/": paths['milhouse'],
+            "http://resources.pichimney.com/": paths['snapshots'],
+            "http://openelec.mirrors.uk2.net": paths['releases'],
+            "http://archive.openelec.tv": paths['releases'],
+            "http://github.com/OpenELEC/OpenELEC.tv/releases": paths['github_releases'],
+            builds.CommitInfoExtractor.url: paths['github_commits'],
+            "http://forum.kodi.tv/": paths['forum_thread']}
+
+
+def select_script(dialog):
+    """Try the next source, go back, page through the builds, filter them
+       and choose the first one left.
+    """
+    import xbmcgui
+
+    dialog.focus(dialog.SOURCE_LIST_ID)
+    dialog.press(xbmcgui.ACTION_MOVE_DOWN)
+    dialog.click()
+    # The builds of a new source are loaded in the background.
+    _join_threads()
+    dialog.focus(dialog.SOURCE_LIST_ID)
+    dialog.press(xbmcgui.ACTION_MOVE_UP)
+    dialog.click()
+
+    dialog.focus(dialog.BUILD_LIST_ID)
+    for i in range(5):
+        dialog.press(xbmcgui.ACTION_PAGE_DOWN)
+
+    # Type the start of the version of the selected build.
+    text = dialog.getControl(dialog.BUILD_LIST_ID).getSelectedItem().getLabel()[:2]
+    dialog.focus(dialog.FILTER_EDIT_ID)
+    dialog.getControl(dialog.FILTER_EDIT_ID).setText(text)
+    dialog.click()
+
+    dialog.focus(dialog.BUILD_LIST_ID)
+    dialog.click()
+
+
+def install_script(dialog):
+    """Choose the newest build."""
+    dialog.click(dialog.BUILD_LIST_ID)
+
+
+def _settings(case, url):
+    settings = {'set_arch': 'true',
+                'arch': fixtures.ARCH,
+                'backup': '0',
+                'confirm_reboot': 'true',
+                'check': 'false'}
+    if case != 'select':
+        settings.update(custom_source_enable='true',
+                        build_type='0',
+                        custom_source='Benchmark',
+                        custom_url=url,
+                        source_name='Benchmark',
+                        verify_files='true')
+    if case == 'install_smb':
+        settings.update(archive='true', archive_root=ARCHIVE_ROOT)
+    return settings
+
+
+def _join_threads():
+    """Wait for the background threads of the dialog to finish."""
+    for thread in threading.enumerate():
+        if thread is not threading.current_thread() and not thread.daemon:
+            thread.join()
+
+
+def _run_select():
+    from resources.lib.funcs import add_deps_to_path
+    add_deps_to_path()
+    from resources.lib import builds, utils, gui
+    from . import replay
+
+    adapter = replay.mount(builds.get_session(), _routes(fixtures.ensure()))
+    builds.arch = utils.get_arch()
+
+    dialog = gui.BuildSelectDialog(builds.get_installed_build())
+    dialog.doModal()
+    _join_threads()
+
+    return OrderedDict([('selected', str(dialog.selected_build)),
+                        ('requests', adapter.requests),
+                        ('bytes', adapter.bytes)])
+
+
+def _run_install():
+    from resources.lib import timing
+
+    sys.argv = ['default.py']
+    try:
+        execfile(os.path.join(ROOT_DIR, 'default.py'), {'__name__': '__main__'})
+    except SystemExit:
+        pass
+    _join_threads()
+
+    phases = OrderedDict()
+    for record in timing.read_records():
+        if record['parent'] == 'install':
+            phases[record['span']] = round(record['seconds'], 3)
+    return OrderedDict([('phases', phases)])
+
+
+def _run_case(case, url):
+    sys.path.insert(0, STUBS_DIR)
+    sys.path.insert(0, ROOT_DIR)
+    os.chdir(ROOT_DIR)
+
+    import xbmc, xbmcgui, xbmcvfs, xbmcaddon
+
+    addon = xbmcaddon.Addon()
+    for setting, value in _settings(case, url).items():
+        addon.setSetting(setting, value)
+    if case == 'install_smb':
+        os.makedirs(os.path.join(xbmcvfs.network_root('smb'), 'nas', 'builds'))
+    xbmcgui.modal_scripts[SKIN_FILE] = select_script if case == 'select' else install_script
+
+    cpu_start = _cpu_seconds()
+    start = time.time()
+    result = _run_select() if case == 'select' else _run_install()
+    result['seconds'] = time.time() - start
+    result['cpu_seconds'] = _cpu_seconds() - cpu_start
+
+    result['gui_calls'] = sum(xbmcgui.calls.values())
+    result['top_gui_calls'] = OrderedDict(xbmcgui.calls.most_common(TOP_CALLS))
+    result['vfs_calls'] = OrderedDict(sorted(xbmcvfs.calls.items()))
+    result['builtins'] = xbmc.builtins
+    print json.dumps(result)
+
+
+def run_case(case, url, timeout):
+    home = tempfile.mkdtemp(prefix='devupdate-home-')
+    env = dict(os.environ, HOME=home, KODI_HOME=os.path.join(home, 'kodi'))
+    env.update(CASES[case])
+    try:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'benchmarks.flow', '--run-case', case, '--url', url],
+            cwd=ROOT_DIR, env=env, stdout=subprocess.PIPE)
+        timer = threading.Timer(timeout, process.kill)
+        timer.start()
+        output = process.communicate()[0]
+        timer.cancel()
+    finally:
+        shutil.rmtree(home)
+    if process.returncode != 0:
+        return {'error': "exit code {}".format(process.returncode)}
+    return json.loads(output.splitlines()[-1], object_pairs_hook=OrderedDict)
+
+
+def run(cases, directory, timeout):
+    results = OrderedDict()
+    server = buildserver.BuildServer(directory).start()
+    try:
+        for case in cases:
+            results[case] = run_case(case, server.url, timeout)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the build select dialog and '
+                                        'installations end to end')
+    parser.add_argument('cases', nargs='*', metavar='CASE',
+                        help='cases to run (default: all): {}'.format(", ".join(CASES)))
+    parser.add_argument('--system-mb', type=float, default=32,
+                        help='size of the SYSTEM image (default: %(default)s)')
+    parser.add_argument('--kernel-mb', type=float, default=4,
+                        help='size of the KERNEL image (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=300,
+                        help='seconds before a stalled case is stopped (default: %(default)s)')
+    parser.add_argument('--run-case', help=SUPPRESS)
+    parser.add_argument('--url', help=SUPPRESS)
+    report.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.run_case:
+        _run_case(args.run_case, args.url)
+        return
+
+    cases = args.cases or list(CASES)
+    for case in cases:
+        if case not in CASES:
+            parser.error('unknown case "{}"'.format(case))
+
+    directory = buildserver.make_builds([fixtures.ARCH], 3, int(args.system_mb * 1e6),
+                                        int(args.kernel_mb * 1e6))
+
+    results = run(cases, directory, args.timeout)
+    report.output(report.make('flow', results), args.output, args.baseline,
+                  'seconds', args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+#! /usr/bin/python
+''' Start-up cost of each entry point mode
+
+Each mode runs in a fresh process against the Kodi stubs and reports the
+time to import and run it, how many modules it loaded and which of the
+modules which are slow to import on a Raspberry Pi were loaded.
+
+    confirm          service start-up check with no new installation
+    checkperiodic    periodic check with an update already pending
+    checkonboot      boot check of a source which was checked recently
+    service          the imports of service.py
+
+    python -m benchmarks.imports --output results.json
+'''
+
+from __future__ import division
+
+import os
+import sys
+import json
+import time
+import shutil
+import resource
+import tempfile
+import subprocess
+from collections import OrderedDict
+from argparse import ArgumentParser, SUPPRESS
+
+from . import report
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kodistubs')
+
+MODES = ('confirm', 'checkperiodic', 'checkonboot', 'service')
+
+HEAVY_MODULES = ('requests', 'bs4', 'html2text', 'tarfile', 'sqlite3',
+                 'BaseHTTPServer', 'resources.lib.gui', 'resources.lib.peers')
+
+
+def _prepare(mode):
+    """Set up the state the mode needs using only the stubs."""
+    import xbmc, xbmcaddon
+
+    addon = xbmcaddon.Addon()
+    if mode == 'checkperiodic':
+        open(xbmc.translatePath("special://temp/update.tar"), 'w').close()
+    elif mode == 'checkonboot':
+        state_file = os.path.join(xbmc.translatePath(addon.getAddonInfo('profile')),
+                                  'build_check.json')
+        with open(state_file, 'w') as f:
+            json.dump({addon.getSetting('source_name'): {'not_before': time.time() + 3600}},
+                      f)
+
+
+def _run_mode(mode):
+    sys.path.insert(0, STUBS_DIR)
+    sys.path.insert(0, ROOT_DIR)
+    os.chdir(ROOT_DIR)
+    _prepare(mode)
+
+    modules_before = set(sys.modules)
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    cpu_start = usage.ru_utime + usage.ru_stime
+    start = time.time()
+
+    if mode == 'service':
+        from resources.lib import utils, rpi, funcs, log, scheduler, boot
+    else:
+        sys.argv = ['default.py', mode]
+        try:
+            execfile(os.path.join(ROOT_DIR, 'default.py'), {'__name__': '__main__'})
+        except SystemExit:
+            pass
+
+    seconds = time.time() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    loaded = set(name for name, module in sys.modules.items()
+                 if module is not None) - modules_before
+    print json.dumps({'seconds': seconds,
+                      'cpu_seconds': usage.ru_utime + usage.ru_stime - cpu_start,
+                      'modules_loaded': len(loaded),
+                      'heavy_modules': sorted(m for m in HEAVY_MODULES if m in loaded)})
+
+
+def run_mode(mode):
+    home = tempfile.mkdtemp(prefix='devupdate-home-')
+    env = dict(os.environ, HOME=home, KODI_HOME=os.path.join(home, 'kodi'))
+    try:
+        output = subprocess.check_output(
+            [sys.executable, '-m', 'benchmarks.imports', '--run-mode', mode],
+            cwd=ROOT_DIR, env=env)
+    finally:
+        shutil.rmtree(home)
+    return json.loads(output.splitlines()[-1])
+
+
+def run(modes, repeat):
+    results = OrderedDict()
+    for mode in modes:
+        runs = [run_mode(mode) for i in range(repeat)]
+        seconds = sorted(r['seconds'] for r in runs)
+        results[mode] = OrderedDict([
+            ('seconds', seconds[len(seconds) // 2]),
+            ('min_seconds', seconds[0]),
+            ('cpu_seconds', sorted(r['cpu_seconds'] for r in runs)[len(runs) // 2]),
+            ('modules_loaded', runs[-1]['modules_loaded']),
+            ('heavy_modules', runs[-1]['heavy_modules'])])
+    return results
+
+
+def main():
+    parser = ArgumentParser(description='Measure the start-up cost of each entry point mode')
+    parser.add_argument('modes', nargs='*', metavar='MODE',
+                        help='modes to run (default: all): {}'.format(", ".join(MODES)))
+    parser.add_argument('--repeat', type=int, default=5,
+                        help='runs of each mode, the median is reported '
+                             '(default: %(default)s)')
+    parser.add_argument('--run-mode', help=SUPPRESS)
+    report.add_arguments(parser)
+    args = parser.parse_args()
+
+    if args.run_mode:
+        _run_mode(args.run_mode)
+        return
+
+    modes = args.modes or list(MODES)
+    for mode in modes:
+        if mode not in MODES:
+            parser.error('unknown mode "{}"'.format(mode))
+
+    # Compile the modules first so that every run loads them the same way.
+    subprocess.check_call([sys.executable, '-m', 'compileall', '-q',
+                           os.path.join(ROOT_DIR, 'resources'), STUBS_DIR])
+
+    results = run(modes, args.repeat)
+    report.output(report.make('imports', results), args.output, args.baseline,
+                  'seconds', args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+''' Stand-in for the Kodi xbmc module so the add-on can run outside Kodi
+
+The special:// paths are mapped below the directory in the KODI_HOME
+environment variable, or a temporary directory if it is not set.
+
+Kodi exits when abort() is called, which ends every Monitor.waitForAbort.
+The idle time and network address reported to the add-on can be set with
+the idle_time and ip_address module variables.
+'''
+
+import os
+import time
+import tempfile
+import threading
+
+LOGDEBUG = 0
+LOGINFO = 1
+LOGNOTICE = 2
+LOGWARNING = 3
+LOGERROR = 4
+
+HOME = os.environ.get('KODI_HOME') or tempfile.mkdtemp(prefix='kodi-')
+
+_SPECIAL = {'temp': os.path.join(HOME, 'temp'),
+            'profile': os.path.join(HOME, 'userdata'),
+            'home': HOME}
+
+# Every builtin passed to executebuiltin in the order they were executed.
+builtins = []
+
+# Every message passed to log as a (level, message) tuple.
+messages = []
+
+idle_time = 0
+ip_address = "192.168.1.2"
+
+_abort = threading.Event()
+
+
+def translatePath(path):
+    if not path.startswith('special://'):
+        return path
+    root, _, rest = path[len('special://'):].partition('/')
+    translated = os.path.join(_SPECIAL[root], rest)
+    directory = translated if translated.endswith('/') else os.path.dirname(translated)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    return translated
+
+
+def log(msg, level=LOGDEBUG):
+    messages.append((level, msg))
+
+
+def sleep(ms):
+    time.sleep(ms / 1000.0)
+
+
+def executebuiltin(function, wait=False):
+    builtins.append(function)
+
+
+def getRegion(id):
+    return {'dateshort': '%d/%m/%Y', 'datelong': '%A, %d %B %Y',
+            'time': '%H:%M:%S'}[id]
+
+
+def getCondVisibility(condition):
+    return False
+
+
+def getInfoLabel(label):
+    return ""
+
+
+def getIPAddress():
+    return ip_address
+
+
+def getGlobalIdleTime():
+    return idle_time
+
+
+def restart():
+    builtins.append('Restart')
+
+
+def abort():
+    """Make Kodi exit, which ends the waits of all monitors."""
+    _abort.set()
+
+
+class Player(object):
+    playing_video = False
+
+    def isPlaying(self):
+        return Player.playing_video
+
+    def isPlayingVideo(self):
+        return Player.playing_video
+
+
+class Monitor(object):
+    def abortRequested(self):
+        return _abort.is_set()
+
+    def waitForAbort(self, timeout=None):
+        return _abort.wait(timeout) or _abort.is_set()
@@ -0,0 +1,89 @@
+''' Stand-in for the Kodi xbmcaddon module
+
+Add-on information comes from addon.xml, setting defaults from
+resources/settings.xml and localized strings from the English strings.po.
+
+Changed settings are saved in settings.xml in the add-on profile directory,
+like Kodi does, so they are kept between runs with the same KODI_HOME.
+'''
+
+import os
+import re
+import xml.etree.ElementTree as ET
+
+import xbmc
+
+
+ADDON_PATH = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _load_strings(path):
+    strings = {}
+    with open(path) as f:
+        text = f.read().decode('utf-8')
+    for m in re.finditer(r'msgctxt "#(\d+)"\s*\nmsgid "(.*)"', text):
+        strings[int(m.group(1))] = m.group(2).replace('\\"', '"')
+    return strings
+
+
+def _load_defaults(path):
+    tree = ET.parse(path)
+    return dict((setting.get('id'), setting.get('default', ""))
+                for setting in tree.iter('setting') if setting.get('id'))
+
+
+def _load_settings(path):
+    try:
+        tree = ET.parse(path)
+    except (IOError, ET.ParseError):
+        return {}
+    return dict((setting.get('id'), setting.get('value', ""))
+                for setting in tree.iter('setting'))
+
+
+def _save_settings(path, settings):
+    root = ET.Element('settings')
+    for id, value in sorted(settings.iteritems()):
+        ET.SubElement(root, 'setting', id=id, value=value)
+    ET.ElementTree(root).write(path, encoding='utf-8')
+
+
+class Addon(object):
+    _settings = {}
+
+    def __init__(self, id=None):
+        tree = ET.parse(os.path.join(ADDON_PATH, 'addon.xml'))
+        root = tree.getroot()
+        self._id = id or root.get('id')
+        self._info = {'id': self._id,
+                      'name': root.get('name'),
+                      'version': root.get('version'),
+                      'author': root.get('provider-name'),
+                      'path': ADDON_PATH,
+                      'icon': os.path.join(ADDON_PATH, 'icon.png'),
+                      'profile': "special://profile/addon_data/{}/".format(self._id)}
+        self._settings_path = os.path.join(xbmc.translatePath(self._info['profile']),
+                                           'settings.xml')
+        if not Addon._settings:
+            Addon._settings.update(
+                _load_defaults(os.path.join(ADDON_PATH, 'resources', 'settings.xml')))
+            Addon._settings.update(_load_settings(self._settings_path))
+        self._strings = _load_strings(os.path.join(ADDON_PATH, 'resources', 'language',
+                                                   'English', 'strings.po'))
+
+    def getAddonInfo(self, id):
+        return self._info[id]
+
+    def getSetting(self, id):
+        return Addon._settings.get(id, "")
+
+    def setSetting(self, id, value):
+        if Addon._settings.get(id) != value:
+            Addon._settings[id] = value
+            _save_settings(self._settings_path, Addon._settings)
+
+    def getLocalizedString(self, id):
+        return self._strings.get(id, "")
+
+    def openSettings(self):
+        xbmc.builtins.append('Addon.OpenSettings({})'.format(self._id))
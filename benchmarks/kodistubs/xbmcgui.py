@@ -0,0 +1,441 @@
+''' Stand-in for the Kodi xbmcgui module
+
+Dialogs never block: yes/no questions answer with the value of Dialog.answer,
+selections with the next index in Dialog.selections or the first item if
+there is none left, and progress dialogs are only cancelled after DialogProgress.cancel_after
+updates, if it is set.
+
+Every call of a public method of these classes is counted in calls, e.g.
+calls['ControlList.addItems'], so that benchmarks can report how much work
+the add-on asks of the GUI.
+
+The controls of a WindowXMLDialog are created from its skin file. doModal
+calls onInit and then the function in modal_scripts for the skin file, if
+there is one, which drives the dialog like a user would with the focus,
+press and click methods and should close it. The dialog is closed after
+the function returns if it did not close it:
+
+    def choose_first_build(dialog):
+        dialog.focus(20)
+        dialog.press(ACTION_MOVE_DOWN)
+        dialog.click()
+
+    xbmcgui.modal_scripts['script-devupdate-main.xml'] = choose_first_build
+'''
+
+import os
+import functools
+from collections import Counter
+import xml.etree.ElementTree as ET
+
+ACTION_MOVE_LEFT = 1
+ACTION_MOVE_RIGHT = 2
+ACTION_MOVE_UP = 3
+ACTION_MOVE_DOWN = 4
+ACTION_PAGE_UP = 5
+ACTION_PAGE_DOWN = 6
+ACTION_SELECT_ITEM = 7
+ACTION_PREVIOUS_MENU = 10
+ACTION_SHOW_INFO = 11
+ACTION_NAV_BACK = 92
+ACTION_MOUSE_MOVE = 107
+ACTION_CONTEXT_MENU = 117
+
+NOTIFICATION_INFO = 'info'
+
+# Number of calls of each method, keyed on "Class.method".
+calls = Counter()
+
+# Functions which drive a dialog from doModal, keyed on the skin file name.
+modal_scripts = {}
+
+# Items moved by a page up or down in a list.
+PAGE_SIZE = 10
+
+
+def _stub_class_name(cls):
+    """Return the name of the class in this module which cls is or extends."""
+    for base in cls.__mro__:
+        if base.__module__ == __name__:
+            return base.__name__
+
+
+def _counted(name, func):
+    @functools.wraps(func)
+    def counted_call(self, *args, **kwargs):
+        calls["{}.{}".format(_stub_class_name(type(self)), name)] += 1
+        return func(self, *args, **kwargs)
+    return counted_call
+
+
+class _Counted(type):
+    """Metaclass which counts the calls of the public methods defined in this
+       module, under the name of the class in this module that the instance
+       is or extends, e.g. ControlEdit.setLabel.
+    """
+    def __new__(mcs, name, bases, attrs):
+        if attrs.get('__module__') == __name__:
+            for attr, value in attrs.items():
+                if callable(value) and not attr.startswith('_'):
+                    attrs[attr] = _counted(attr, value)
+        return type.__new__(mcs, name, bases, attrs)
+
+
+class Dialog(object):
+    __metaclass__ = _Counted
+    answer = True
+    selections = []
+
+    def ok(self, heading, line1="", line2="", line3=""):
+        return True
+
+    def yesno(self, heading, line1="", line2="", line3="", nolabel="", yeslabel="",
+              autoclose=0):
+        return Dialog.answer
+
+    def select(self, heading, list, autoclose=0):
+        return Dialog.selections.pop(0) if Dialog.selections else 0
+
+    def numeric(self, type, heading, defaultt=""):
+        return defaultt
+
+    def notification(self, heading, message, icon=NOTIFICATION_INFO, time=5000,
+                     sound=True):
+        pass
+
+
+class DialogProgress(object):
+    __metaclass__ = _Counted
+    # Number of updates after which the dialog is cancelled, or None.
+    cancel_after = None
+
+    def create(self, heading, line1="", line2="", line3=""):
+        self.percent = 0
+        self.updates = 0
+
+    def update(self, percent, line1="", line2="", line3=""):
+        self.percent = percent
+        self.updates += 1
+
+    def iscanceled(self):
+        return (DialogProgress.cancel_after is not None and
+                self.updates >= DialogProgress.cancel_after)
+
+    def close(self):
+        pass
+
+
+class DialogProgressBG(object):
+    __metaclass__ = _Counted
+
+    def create(self, heading, message=""):
+        self.percent = 0
+        self.updates = 0
+
+    def update(self, percent=0, heading="", message=""):
+        self.percent = percent
+        self.updates += 1
+
+    def isFinished(self):
+        return False
+
+    def close(self):
+        pass
+
+
+class ListItem(object):
+    __metaclass__ = _Counted
+
+    def __init__(self, label="", label2="", iconImage="", thumbnailImage="", path=""):
+        self._label = label
+        self._label2 = label2
+        self._icon = iconImage
+        self._properties = {}
+
+    def getLabel(self):
+        return self._label
+
+    def setLabel(self, label):
+        self._label = label
+
+    def getLabel2(self):
+        return self._label2
+
+    def setLabel2(self, label):
+        self._label2 = label
+
+    def setIconImage(self, icon):
+        self._icon = icon
+
+    def getProperty(self, key):
+        return self._properties.get(key.lower(), "")
+
+    def setProperty(self, key, value):
+        self._properties[key.lower()] = value
+
+
+class Action(object):
+    __metaclass__ = _Counted
+
+    def __init__(self, id):
+        self._id = id
+
+    def getId(self):
+        return self._id
+
+
+class Control(object):
+    __metaclass__ = _Counted
+
+    def __init__(self, id):
+        self._id = id
+        self._visible = True
+        self._enabled = True
+
+    def getId(self):
+        return self._id
+
+    def setVisible(self, visible):
+        self._visible = visible
+
+    def isVisible(self):
+        return self._visible
+
+    def setEnabled(self, enabled):
+        self._enabled = enabled
+
+
+class ControlLabel(Control):
+    def __init__(self, id):
+        super(ControlLabel, self).__init__(id)
+        self._label = ""
+
+    def getLabel(self):
+        return self._label
+
+    def setLabel(self, label):
+        self._label = label
+
+
+class ControlButton(ControlLabel):
+    pass
+
+
+class ControlEdit(ControlLabel):
+    def __init__(self, id):
+        super(ControlEdit, self).__init__(id)
+        self._text = ""
+
+    def getText(self):
+        return self._text
+
+    def setText(self, text):
+        self._text = text
+
+
+class ControlTextBox(Control):
+    def __init__(self, id):
+        super(ControlTextBox, self).__init__(id)
+        self._text = ""
+
+    def getText(self):
+        return self._text
+
+    def setText(self, text):
+        self._text = text
+
+    def reset(self):
+        self._text = ""
+
+
+class ControlImage(Control):
+    def setImage(self, filename):
+        pass
+
+
+class ControlGroup(Control):
+    pass
+
+
+class ControlList(Control):
+    def __init__(self, id):
+        super(ControlList, self).__init__(id)
+        self._items = []
+        self._selected = 0
+
+    @staticmethod
+    def _item(item):
+        return item if isinstance(item, ListItem) else ListItem(item)
+
+    def addItem(self, item):
+        self._items.append(self._item(item))
+
+    def addItems(self, items):
+        self._items.extend(self._item(item) for item in items)
+
+    def removeItem(self, index):
+        del self._items[index]
+        self._selected = max(0, min(self._selected, len(self._items) - 1))
+
+    def reset(self):
+        self._items = []
+        self._selected = 0
+
+    def size(self):
+        return len(self._items)
+
+    def getListItem(self, index):
+        if not 0 <= index < len(self._items):
+            raise RuntimeError("Index out of range")
+        return self._items[index]
+
+    def getSelectedItem(self):
+        return self._items[self._selected] if self._items else None
+
+    def getSelectedPosition(self):
+        return self._selected if self._items else -1
+
+    def selectItem(self, item):
+        if 0 <= item < len(self._items):
+            self._selected = item
+
+
+# Control classes for the control types in skin files.
+_CONTROL_TYPES = {'label': ControlLabel,
+                  'fadelabel': ControlLabel,
+                  'button': ControlButton,
+                  'radiobutton': ControlButton,
+                  'edit': ControlEdit,
+                  'textbox': ControlTextBox,
+                  'image': ControlImage,
+                  'group': ControlGroup,
+                  'grouplist': ControlGroup,
+                  'list': ControlList,
+                  'panel': ControlList,
+                  'wraplist': ControlList,
+                  'fixedlist': ControlList}
+
+# Actions which move the selection of a list by the number of items.
+_LIST_MOVES = {ACTION_MOVE_UP: -1,
+               ACTION_MOVE_DOWN: 1,
+               ACTION_PAGE_UP: -PAGE_SIZE,
+               ACTION_PAGE_DOWN: PAGE_SIZE}
+
+
+class Window(object):
+    __metaclass__ = _Counted
+    _properties = {}
+
+    def __init__(self, existingWindowId=-1):
+        self._id = existingWindowId
+
+    def getProperty(self, key):
+        return Window._properties.get((self._id, key), "")
+
+    def setProperty(self, key, value):
+        Window._properties[(self._id, key)] = value
+
+    def clearProperty(self, key):
+        Window._properties.pop((self._id, key), None)
+
+
+class WindowXMLDialog(Window):
+    def __new__(cls, xmlFilename, scriptPath, defaultSkin='Default', defaultRes='720p',
+                *args, **kwargs):
+        self = super(WindowXMLDialog, cls).__new__(cls)
+        self._id = -1
+        self._xml_filename = xmlFilename
+        self._controls = {}
+        self._focus_id = 0
+        self._closed = True
+        self._load_skin(os.path.join(scriptPath, 'resources', 'skins', defaultSkin),
+                        defaultRes)
+        return self
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def _load_skin(self, skin_dir, res):
+        resolutions = [res] + sorted(d for d in os.listdir(skin_dir) if d != res)
+        for res_dir in resolutions:
+            path = os.path.join(skin_dir, res_dir, self._xml_filename)
+            if os.path.isfile(path):
+                break
+        else:
+            raise RuntimeError("XML File for Window is missing")
+
+        root = ET.parse(path).getroot()
+        for element in root.iter('control'):
+            if element.get('id'):
+                control_class = _CONTROL_TYPES.get(element.get('type'), Control)
+                self._controls[int(element.get('id'))] = control_class(int(element.get('id')))
+        default = root.find('defaultcontrol')
+        if default is not None and default.text:
+            self._focus_id = int(default.text)
+
+    def doModal(self):
+        self._closed = False
+        self.onInit()
+        script = modal_scripts.get(self._xml_filename)
+        if script is not None and not self._closed:
+            script(self)
+        self._closed = True
+
+    def show(self):
+        self._closed = False
+        self.onInit()
+
+    def close(self):
+        self._closed = True
+
+    def getControl(self, iControlId):
+        try:
+            return self._controls[iControlId]
+        except KeyError:
+            raise RuntimeError("Non-Existent Control {}".format(iControlId))
+
+    def getFocusId(self):
+        return self._focus_id
+
+    def setFocusId(self, iControlId):
+        self._focus_id = iControlId
+
+    def setFocus(self, pControl):
+        self._focus_id = pControl.getId()
+
+    def onInit(self):
+        pass
+
+    def onAction(self, action):
+        pass
+
+    def onClick(self, controlId):
+        pass
+
+    def onFocus(self, controlId):
+        pass
+
+    # The methods below are not in Kodi and drive the dialog from a script.
+
+    def focus(self, control_id):
+        """Move the focus to a control, as the user would."""
+        self.setFocusId(control_id)
+        self.onFocus(control_id)
+
+    def press(self, action_id):
+        """Send an action, moving the selection first if a list has the focus."""
+        control = self._controls.get(self._focus_id)
+        if isinstance(control, ControlList) and action_id in _LIST_MOVES and control.size():
+            position = control.getSelectedPosition() + _LIST_MOVES[action_id]
+            control.selectItem(max(0, min(position, control.size() - 1)))
+        self.onAction(Action(action_id))
+
+    def click(self, control_id=None):
+        """Click the focused control, or focus and click control_id."""
+        if control_id is not None and control_id != self._focus_id:
+            self.focus(control_id)
+        self.onClick(self._focus_id)
+
+    @property
+    def closed(self):
+        return self._closed
@@ -0,0 +1,192 @@
+''' Stand-in for the Kodi xbmcvfs module which works on local paths
+
+Network paths such as smb://server/share/dir are mapped to a directory of
+the same name below the Kodi home directory, e.g. <home>/smb/server/share.
+Each operation on a network path, including each read or write of a file,
+waits for the latency in seconds and each read or write also for the number
+of bytes divided by the bandwidth in bytes per second, to model a share on a
+slow network. Both are taken from the
+KODI_VFS_LATENCY and KODI_VFS_BANDWIDTH environment variables and can be
+changed with set_network.
+
+Every call is counted in calls, e.g. calls['File.read'].
+'''
+
+import os
+import time
+import shutil
+from collections import Counter
+
+import xbmc
+
+
+calls = Counter()
+
+latency = float(os.environ.get('KODI_VFS_LATENCY') or 0)
+bandwidth = float(os.environ.get('KODI_VFS_BANDWIDTH') or 0) or None
+
+
+def set_network(seconds=0, bytes_per_second=None):
+    """Set the latency and bandwidth of the operations on network paths."""
+    global latency, bandwidth
+    latency = seconds
+    bandwidth = bytes_per_second
+
+
+def network_root(scheme):
+    """Return the local directory of the network paths with the scheme."""
+    return os.path.join(xbmc.HOME, scheme)
+
+
+def _local(path, name=None):
+    """Return the local path for path, waiting for the latency of a network path."""
+    if name is not None:
+        calls[name] += 1
+    path = xbmc.translatePath(path)
+    scheme, sep, rest = path.partition('://')
+    if not sep:
+        return path
+    if latency:
+        time.sleep(latency)
+    return os.path.join(network_root(scheme), rest)
+
+
+def _is_network(path):
+    return '://' in path and not path.startswith('special://')
+
+
+def _transfer(size):
+    if latency:
+        time.sleep(latency)
+    if bandwidth:
+        time.sleep(size / bandwidth)
+
+
+class File(object):
+    def __init__(self, path, mode='r'):
+        self._network = _is_network(path)
+        self._f = open(_local(path, 'File'), 'wb' if mode == 'w' else 'rb')
+
+    def read(self, bytes=-1):
+        calls['File.read'] += 1
+        data = self._f.read() if bytes < 0 else self._f.read(bytes)
+        if self._network:
+            _transfer(len(data))
+        return data
+
+    def readBytes(self, numbytes=-1):
+        return bytearray(self.read(numbytes))
+
+    def write(self, buffer):
+        calls['File.write'] += 1
+        self._f.write(buffer)
+        if self._network:
+            _transfer(len(buffer))
+        return True
+
+    def size(self):
+        return os.fstat(self._f.fileno()).st_size
+
+    def seek(self, seekBytes, iWhence=0):
+        self._f.seek(seekBytes, iWhence)
+        return self._f.tell()
+
+    def tell(self):
+        return self._f.tell()
+
+    def close(self):
+        self._f.close()
+
+
+class Stat(object):
+    def __init__(self, path):
+        self._st = os.stat(_local(path, 'Stat'))
+
+    def st_size(self):
+        return self._st.st_size
+
+    def st_mtime(self):
+        return self._st.st_mtime
+
+    def st_atime(self):
+        return self._st.st_atime
+
+    def st_ctime(self):
+        return self._st.st_ctime
+
+    def st_mode(self):
+        return self._st.st_mode
+
+
+def exists(path):
+    return os.path.exists(_local(path, 'exists'))
+
+
+def listdir(path):
+    """Return the lists of (directories, files) in path."""
+    path = _local(path, 'listdir')
+    dirs, files = [], []
+    try:
+        names = os.listdir(path)
+    except OSError:
+        return dirs, files
+    for name in names:
+        (dirs if os.path.isdir(os.path.join(path, name)) else files).append(name)
+    return dirs, files
+
+
+def mkdir(path):
+    path = _local(path, 'mkdir')
+    if not os.path.isdir(path):
+        try:
+            os.mkdir(path)
+        except OSError:
+            return False
+    return True
+
+
+def mkdirs(path):
+    path = _local(path, 'mkdirs')
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError:
+            return False
+    return True
+
+
+def rmdir(path):
+    try:
+        os.rmdir(_local(path, 'rmdir'))
+    except OSError:
+        return False
+    return True
+
+
+def delete(path):
+    try:
+        os.remove(_local(path, 'delete'))
+    except OSError:
+        return False
+    return True
+
+
+def copy(source, destination):
+    network = _is_network(source) or _is_network(destination)
+    source = _local(source, 'copy')
+    destination = _local(destination)
+    try:
+        shutil.copyfile(source, destination)
+    except IOError:
+        return False
+    if network:
+        _transfer(os.path.getsize(destination))
+    return True
+
+
+def rename(source, destination):
+    try:
+        os.rename(_local(source, 'rename'), _local(destination))
+    except OSError:
+        return False
+    return True
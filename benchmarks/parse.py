@@ -0,0 +1,196 @@
+#! /usr/bin/python
+''' Offline parse benchmarks for the build link and build info extractors
+
+All requests are replayed from the fixture pages so the results only depend
+on the parsing code. Each case runs in a separate process so that the peak
+memory of one case does not hide the next.
+
+    python -m benchmarks.parse --output results.json
+    python -m benchmarks.parse --baseline results.json
+'''
+
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import multiprocessing
+from collections import OrderedDict
+from argparse import ArgumentParser
+
+from . import fixtures, replay, report
+
+from resources.lib.funcs import add_deps_to_path
+add_deps_to_path()
+
+from resources.lib import builds
+
+
+SNAPSHOTS_URL = "http://snapshots.openelec.tv/"
+MILHOUSE_URL = "http://milhouse.openelec.tv/builds/master/RPi2/"
+DROPBOX_URL = "https://www.dropbox.com/sh/abc123/OpenELEC"
+RELEASES_URL = "http://archive.openelec.tv/"
+FORUM_URL = "http://forum.kodi.tv/showthread.php?tid={}".format(fixtures.MILHOUSE_THREAD)
+DETAILS_URL = "{}&pid={}".format(FORUM_URL, fixtures.MILHOUSE_PID + 5)
+
+
+def _routes(paths):
+    return {SNAPSHOTS_URL: paths['snapshots'],
+            MILHOUSE_URL: paths['milhouse'],
+            DROPBOX_URL: paths['dropbox'],
+            RELEASES_URL: paths['releases'],
+            "http://github.com/OpenELEC/OpenELEC.tv/releases": paths['github_releases'],
+            builds.CommitInfoExtractor.url: paths['github_commits'],
+            FORUM_URL: paths['forum_thread']}
+
+
+def build_links():
+    return list(builds.BuildLinkExtractor(SNAPSHOTS_URL))
+
+
+def dropbox_build_links():
+    return list(builds.DropboxBuildLinkExtractor(DROPBOX_URL))
+
+
+def milhouse_build_links():
+    return list(builds.MilhouseBuildLinkExtractor(MILHOUSE_URL))
+
+
+def release_links():
+    return list(builds.ReleaseLinkExtractor(RELEASES_URL))
+
+
+def release_tags(html):
+    return builds.Release.get_tags_page_dict(html)
+
+
+def commit_info():
+    # Start from an empty commit cache every time.
+    builds.CommitInfoExtractor._commits = None
+    try:
+        os.remove(builds.CommitInfoExtractor.CACHE_FILE)
+    except OSError:
+        pass
+    return builds.CommitInfoExtractor().get_info()
+
+
+def milhouse_build_info():
+    return builds.MilhouseBuildInfoExtractor(FORUM_URL).get_info()
+
+
+def milhouse_build_details():
+    # The items are the entries of the highlights and details.
+    extractor = builds.MilhouseBuildDetailsExtractor(DETAILS_URL)
+    return extractor.ITEM_RE.findall(extractor.get_text())
+
+
+# name: (fixture, function, whether the function takes the fixture text)
+CASES = OrderedDict([
+    ('BuildLinkExtractor', ('snapshots', build_links, False)),
+    ('DropboxBuildLinkExtractor', ('dropbox', dropbox_build_links, False)),
+    ('MilhouseBuildLinkExtractor', ('milhouse', milhouse_build_links, False)),
+    ('ReleaseLinkExtractor', ('releases', release_links, False)),
+    ('Release.get_tags_page_dict', ('github_releases', release_tags, True)),
+    ('CommitInfoExtractor', ('github_commits', commit_info, False)),
+    ('MilhouseBuildInfoExtractor', ('forum_thread', milhouse_build_info, False)),
+    ('MilhouseBuildDetailsExtractor', ('forum_thread', milhouse_build_details, False)),
+])
+
+
+def _max_rss_kb():
+    # ru_maxrss is in kilobytes on Linux.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _run_case(name, paths, min_time, max_iterations, queue):
+    fixture, func, takes_text = CASES[name]
+    adapter = replay.mount(builds.get_session(), _routes(paths))
+    builds.arch = fixtures.ARCH
+    cache_dir = tempfile.mkdtemp()
+    replay.use_cache_dir(cache_dir)
+
+    # Release links need the tags which are only fetched once per process.
+    builds.Release.maybe_get_tags()
+
+    with open(paths[fixture], 'rb') as f:
+        text = f.read().decode('utf-8')
+    args = (text,) if takes_text else ()
+
+    rss_before = _max_rss_kb()
+    adapter.bytes = 0
+    iterations = 0
+    cpu_start = time.clock()
+    start = time.time()
+    while True:
+        result = func(*args)
+        iterations += 1
+        elapsed = time.time() - start
+        if elapsed >= min_time or iterations >= max_iterations:
+            break
+    cpu = time.clock() - cpu_start
+
+    shutil.rmtree(cache_dir)
+
+    size = os.path.getsize(paths[fixture])
+    queue.put({
+        'fixture': fixture,
+        'fixture_bytes': size,
+        'recorded': fixtures.is_recorded(paths[fixture]),
+        'iterations': iterations,
+        'items': len(result),
+        'seconds_per_iteration': elapsed / iterations,
+        'cpu_seconds_per_iteration': cpu / iterations,
+        'mb_per_second': size * iterations / elapsed / 1e6,
+        'items_per_second': len(result) * iterations / elapsed,
+        'peak_rss_increase_kb': _max_rss_kb() - rss_before,
+    })
+
+
+def run(names, paths, min_time=1.0, max_iterations=1000):
+    results = OrderedDict()
+    for name in names:
+        queue = multiprocessing.Queue()
+        process = multiprocessing.Process(target=_run_case,
+                                          args=(name, paths, min_time, max_iterations, queue))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            results[name] = {'error': "exit code {}".format(process.exitcode)}
+        else:
+            results[name] = queue.get()
+    return results
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark the extractors against the fixture pages')
+    parser.add_argument('cases', nargs='*', metavar='CASE',
+                        help='cases to run (default: all): {}'.format(", ".join(CASES)))
+    parser.add_argument('--fixtures', default=fixtures.FIXTURES_DIR,
+                        help='recorded fixtures directory (default: %(default)s)')
+    parser.add_argument('--min-time', type=float, default=1.0,
+                        help='minimum seconds to run each case (default: %(default)s)')
+    parser.add_argument('--max-iterations', type=int, default=1000,
+                        help='maximum iterations of each case (default: %(default)s)')
+    report.add_arguments(parser)
+    args = parser.parse_args()
+
+    names = args.cases or list(CASES)
+    for name in names:
+        if name not in CASES:
+            parser.error('unknown case "{}"'.format(name))
+
+    paths = fixtures.ensure(args.fixtures)
+    generated = sorted(name for name, fixture_path in paths.items()
+                       if not fixtures.is_recorded(fixture_path))
+    if generated:
+        sys.stderr.write("Using generated pages, which have not been recorded, for: {}\n"
+                         .format(", ".join(generated)))
+    results = run(names, paths, args.min_time, args.max_iterations)
+
+    report.output(report.make('parse', results), args.output, args.baseline,
+                  'seconds_per_iteration', args.threshold)
+
+
+if __name__ == "__main__":
+    main()
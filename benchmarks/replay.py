@@ -0,0 +1,76 @@
+''' Requests transport adapter which serves responses from fixture files '''
+
+import os
+import mimetypes
+from StringIO import StringIO
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+
+class FixtureAdapter(BaseAdapter):
+    """Serves every request from a local file.
+
+       The routes map a URL prefix to a fixture path. The longest matching
+       prefix wins so that more specific URLs can override a site-wide page.
+    """
+    def __init__(self, routes):
+        super(FixtureAdapter, self).__init__()
+        self._routes = sorted(routes.items(), key=lambda route: len(route[0]),
+                              reverse=True)
+        self.requests = 0
+        self.bytes = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True,
+             cert=None, proxies=None):
+        for prefix, path in self._routes:
+            if request.url.startswith(prefix):
+                break
+        else:
+            return self._response(request, 404, "")
+
+        with open(path, 'rb') as f:
+            body = f.read()
+        self.requests += 1
+        self.bytes += len(body)
+        content_type = mimetypes.guess_type(path)[0] or 'text/html'
+        return self._response(request, 200, body, content_type)
+
+    def _response(self, request, status, body, content_type='text/html'):
+        response = Response()
+        response.status_code = status
+        response.headers = CaseInsensitiveDict({
+            'Content-Type': "{}; charset=utf-8".format(content_type),
+            'Content-Length': str(len(body))})
+        response.raw = StringIO(body)
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def use_cache_dir(directory):
+    """Keep the state which the add-on shares between runs, e.g. the host
+       health and source metrics, in directory instead of the user's cache.
+    """
+    from resources.lib import builds, funcs, health, metrics
+
+    funcs.CACHE_DIR = directory
+    health.STATE_FILE = os.path.join(directory, 'host_health.json')
+    health.LOCK_FILE = health.STATE_FILE + '.lock'
+    metrics.STATE_FILE = os.path.join(directory, 'source_metrics.json')
+    builds.ManifestBuildLinkExtractor.CACHE_FILE = os.path.join(directory, 'manifests.json')
+    builds.CommitInfoExtractor.CACHE_FILE = os.path.join(directory, 'commits.json')
+
+
+def mount(session, routes):
+    """Route all HTTP(S) requests made with session to the fixture files."""
+    adapter = FixtureAdapter(routes)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return adapter
@@ -0,0 +1,68 @@
+''' Machine readable benchmark results and regression checks '''
+
+import sys
+import json
+import time
+import platform
+from collections import OrderedDict
+
+
+def make(benchmark, results, **extra):
+    report = OrderedDict([('benchmark', benchmark),
+                          ('timestamp', time.strftime('%Y-%m-%dT%H:%M:%S')),
+                          ('python', platform.python_version()),
+                          ('machine', platform.machine())])
+    report.update(extra)
+    report['results'] = results
+    return report
+
+
+def _flatten(results, prefix=()):
+    for name, value in results.items():
+        if isinstance(value, dict):
+            for item in _flatten(value, prefix + (name,)):
+                yield item
+        else:
+            yield prefix + (name,), value
+
+
+def regressions(results, baseline, key, threshold):
+    """Return (name, before, after) for each result whose key value is larger
+       than in the baseline by more than the fractional threshold.
+    """
+    before = dict((path, value) for path, value in _flatten(baseline['results'])
+                  if path[-1] == key)
+    found = []
+    for path, after in _flatten(results):
+        if path in before and after > before[path] * (1 + threshold):
+            found.append(("/".join(path[:-1]), before[path], after))
+    return found
+
+
+def output(report, path=None, baseline_path=None, key='seconds', threshold=0.2):
+    """Print the report, optionally write it to path and compare it with the
+       report in baseline_path. Exits with status 1 if there are regressions.
+    """
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text)
+    print text
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        found = regressions(report['results'], baseline, key, threshold)
+        for name, before, after in found:
+            print >> sys.stderr, "REGRESSION {} {}: {:.4f} -> {:.4f}".format(
+                name, key, before, after)
+        if found:
+            sys.exit(1)
+
+
+def add_arguments(parser):
+    parser.add_argument('--output', help='write the JSON results to this file')
+    parser.add_argument('--baseline', help='compare with the JSON results in this file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='fractional slowdown reported as a regression '
+                             '(default: %(default)s)')
@@ -0,0 +1,240 @@
+#! /usr/bin/python
+''' End to end benchmark of the download, decompress and verify path
+
+A local build server stands in for the internet. For each scenario the
+command line script download.py is run against it, then the same build
+goes through the FileProgress, DecompressProgress and verify chain used by
+the add-on, and is copied to and back from an archive on a network share
+with ARCHIVE_LATENCY and ARCHIVE_BANDWIDTH. Every stage reports its wall
+time, CPU time, bytes processed and throughput.
+
+    python -m benchmarks.transfer --output results.json
+'''
+
+from __future__ import division
+
+import os
+import sys
+import time
+import shutil
+import resource
+import tempfile
+import threading
+import subprocess
+import multiprocessing
+from collections import OrderedDict
+from argparse import ArgumentParser
+
+from . import buildserver, fixtures, report
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+STUBS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'kodistubs')
+
+# name: keyword arguments for the server Shaping. In the drop scenario the
+# download is expected to fail with a read error rather than stall.
+SCENARIOS = OrderedDict([
+    ('local', {}),
+    ('shaped', {'latency': 0.05, 'bandwidth': 8e6}),
+    ('drop', {'drop_after': 0.5, 'drops': 1}),
+])
+
+# The network share of the archive stages, e.g. SMB on a 100 Mbit/s network.
+ARCHIVE_LATENCY = 0.002
+ARCHIVE_BANDWIDTH = 12.5e6
+
+
+def _cpu_seconds(who):
+    usage = resource.getrusage(who)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Stage(object):
+    """Context manager which measures one stage of the transfer."""
+    def __init__(self, results, name, who=resource.RUSAGE_SELF):
+        self._results = results
+        self._name = name
+        self._who = who
+        self.bytes_written = 0
+
+    def __enter__(self):
+        self._cpu = _cpu_seconds(self._who)
+        self._start = time.time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        seconds = time.time() - self._start
+        result = OrderedDict([
+            ('seconds', seconds),
+            ('cpu_seconds', _cpu_seconds(self._who) - self._cpu),
+            ('bytes_written', self.bytes_written),
+            ('mb_per_second', self.bytes_written / seconds / 1e6)])
+        if exc_type is not None:
+            result['error'] = "{}: {}".format(exc_type.__name__, exc_value)
+        self._results[self._name] = result
+        return exc_type is not None and issubclass(exc_type, Exception)
+
+
+def run_download_script(url, timeout):
+    """Run download.py choosing the newest build and return the stage results."""
+    home = tempfile.mkdtemp(prefix='devupdate-home-')
+    env = dict(os.environ, HOME=home)
+    results = OrderedDict()
+    try:
+        with Stage(results, 'download.py', resource.RUSAGE_CHILDREN) as stage:
+            process = subprocess.Popen(
+                [sys.executable, os.path.join(ROOT_DIR, 'download.py'),
+                 '--arch', fixtures.ARCH, '--source', url],
+                cwd=ROOT_DIR, env=env, stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            timer = threading.Timer(timeout, process.kill)
+            timer.start()
+            output = process.communicate('0\n')[0]
+            timer.cancel()
+
+            stage.bytes_written = sum(os.path.getsize(os.path.join(home, name))
+                                      for name in os.listdir(home)
+                                      if name.endswith('.tar'))
+            if process.returncode != 0:
+                raise RuntimeError("exit code {}: {}".format(process.returncode,
+                                                             output.strip()[-200:]))
+            if not stage.bytes_written:
+                raise RuntimeError("no tar file written")
+    finally:
+        shutil.rmtree(home)
+    return results
+
+
+def _run_chain(url, work_dir, queue):
+    sys.path.insert(0, STUBS_DIR)
+    os.environ['KODI_HOME'] = work_dir
+
+    import xbmcvfs
+    from resources.lib import builds, progress, openelec, verify
+    from . import replay
+
+    replay.use_cache_dir(work_dir)
+    builds.arch = fixtures.ARCH
+    results = OrderedDict()
+
+    build = builds.BuildsURL(url).latest()
+
+    with Stage(results, 'download') as stage:
+        remote_file = build.remote_file()
+        download_path = os.path.join(work_dir, build.filename)
+        tar_path = os.path.join(work_dir, build.tar_name)
+        with progress.FileProgress("Downloading", remote_file, download_path,
+                                   build.size) as downloader:
+            downloader.start()
+        stage.bytes_written = os.path.getsize(download_path)
+
+    if 'error' not in results['download']:
+        with Stage(results, 'decompress') as stage:
+            with progress.DecompressProgress("Decompressing", open(download_path, 'rb'),
+                                             tar_path, build.size) as decompressor:
+                decompressor.start()
+            stage.bytes_written = os.path.getsize(tar_path)
+
+    if 'error' not in results.get('decompress', {'error': None}):
+        with Stage(results, 'verify') as stage:
+            members = verify.find_images(tar_path, openelec.UPDATE_IMAGES)
+            md5sums = verify.hash_members(tar_path, members.values())
+            for update_image in openelec.UPDATE_IMAGES:
+                if md5sums.get(update_image) != members[update_image].md5sum:
+                    raise RuntimeError("{} md5 mismatch".format(update_image))
+                stage.bytes_written += members[update_image].size
+
+    if 'error' not in results.get('decompress', {'error': None}):
+        archive_path = 'smb://nas/archive/' + build.tar_name
+        xbmcvfs.mkdirs('smb://nas/archive/')
+        xbmcvfs.set_network(ARCHIVE_LATENCY, ARCHIVE_BANDWIDTH)
+        size = os.path.getsize(tar_path)
+        with Stage(results, 'archive') as stage:
+            with progress.FileProgress("Archiving", open(tar_path, 'rb'), archive_path,
+                                       size) as archiver:
+                archiver.start()
+            stage.bytes_written = size
+
+        if 'error' not in results['archive']:
+            with Stage(results, 'copy_from_archive') as stage:
+                os.remove(tar_path)
+                archive = xbmcvfs.File(archive_path)
+                with progress.FileProgress("Copying", archive, tar_path,
+                                           archive.size()) as extractor:
+                    extractor.start()
+                stage.bytes_written = os.path.getsize(tar_path)
+
+    queue.put(results)
+
+
+def run_chain(url, timeout):
+    """Run the add-on transfer chain in a separate process which is terminated
+       if it does not finish within timeout seconds.
+    """
+    work_dir = tempfile.mkdtemp(prefix='devupdate-kodi-')
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_chain, args=(url, work_dir, queue))
+    try:
+        process.start()
+        process.join(timeout)
+        if process.is_alive():
+            process.terminate()
+            process.join()
+            return {'error': "stalled for {} seconds".format(timeout)}
+        elif process.exitcode != 0:
+            return {'error': "exit code {}".format(process.exitcode)}
+        return queue.get()
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def run(names, directory, timeout):
+    results = OrderedDict()
+    for name in names:
+        server = buildserver.BuildServer(directory).start()
+        try:
+            server.shaping = buildserver.Shaping(**SCENARIOS[name])
+            scenario = run_download_script(server.url, timeout)
+            server.shaping = buildserver.Shaping(**SCENARIOS[name])
+            scenario['addon'] = run_chain(server.url, timeout)
+            scenario['server'] = OrderedDict([('bytes_sent', server.bytes_sent),
+                                              ('dropped', server.dropped)])
+        finally:
+            server.shutdown()
+            server.server_close()
+        results[name] = scenario
+    return results
+
+
+def main():
+    parser = ArgumentParser(description='Benchmark downloading, decompressing '
+                                        'and verifying a build from a local server')
+    parser.add_argument('scenarios', nargs='*', metavar='SCENARIO',
+                        help='scenarios to run (default: all): {}'.format(
+                            ", ".join(SCENARIOS)))
+    parser.add_argument('--system-mb', type=float, default=32,
+                        help='size of the SYSTEM image (default: %(default)s)')
+    parser.add_argument('--kernel-mb', type=float, default=4,
+                        help='size of the KERNEL image (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='seconds before a stalled run is stopped (default: %(default)s)')
+    report.add_arguments(parser)
+    args = parser.parse_args()
+
+    names = args.scenarios or list(SCENARIOS)
+    for name in names:
+        if name not in SCENARIOS:
+            parser.error('unknown scenario "{}"'.format(name))
+
+    system_size = int(args.system_mb * 1e6)
+    kernel_size = int(args.kernel_mb * 1e6)
+    directory = buildserver.make_builds([fixtures.ARCH], 1, system_size, kernel_size)
+
+    results = run(names, directory, args.timeout)
+    report.output(report.make('transfer', results, system_bytes=system_size,
+                              kernel_bytes=kernel_size),
+                  args.output, args.baseline, 'seconds', args.threshold)
+
+
+if __name__ == "__main__":
+    main()
@@ -21,18 +21,21 @@ from __future__ import division
 
 import os
 import sys
-import tarfile
-from contextlib import closing
 
 import xbmc, xbmcgui, xbmcaddon, xbmcvfs
-import requests
 
+# Modules which are slow to import (requests, tarfile, sqlite3 and the gui
+# module) or only needed to install a build are imported where they are used
+# so that the service and the build checks only load what they need.
 from resources.lib import (progress, script_exceptions, utils, builds, openelec,
-                           rpi, addon, log, gui, funcs)
+                           rpi, addon, log, funcs, scheduler, timing)
 from resources.lib.addon import L10n
 
 TEMP_PATH = xbmc.translatePath("special://temp/")
 
+# Appended to the name of a file while it is being copied.
+PART_EXT = '.part'
+
 
 class Main(object):
     def __enter__(self):
@@ -46,6 +49,7 @@ class Main(object):
 
         return already_running
 
+    @timing.timed('install')
     def start(self):
         if utils.is_running():
             raise script_exceptions.AlreadyRunning
@@ -59,8 +63,20 @@ class Main(object):
         if addon.get_bool_setting('set_timeout'):
             builds.timeout = float(addon.get_setting('timeout'))
 
+        builds.github_token = addon.get_setting('github_token') or None
+        builds.peer_finder = utils.get_peer_finder()
+        builds.archive_root = utils.get_archive_root()
+
         self.background = addon.get_bool_setting('background')
         self.verify_files = addon.get_bool_setting('verify_files')
+
+        # Statistics of how the build was obtained which are saved in the history.
+        self.origin = 'download'
+        self.mirror = None
+        self.phases = []
+        # The (algorithm, digest) of the update tar file computed while it is
+        # copied to or from the archive.
+        self.tar_digest = None
         
         funcs.create_directory(openelec.UPDATE_DIR)
 
@@ -69,7 +85,8 @@ class Main(object):
 
         self.installed_build = self.get_installed_build()
 
-        self.select_build()
+        if not self.maybe_bisect():
+            self.select_build()
 
         utils.remove_update_files()
 
@@ -83,18 +100,25 @@ class Main(object):
 
         utils.maybe_schedule_extlinux_update()
 
-        utils.maybe_run_backup()
+        with timing.span('backup'):
+            utils.maybe_run_backup()
 
         self.confirm()
 
-    def get_installed_build(self):        
+    @timing.timed('get_installed_build')
+    def get_installed_build(self):
+        import requests
+
         try:
             return builds.get_installed_build()
         except requests.ConnectionError as e:
             utils.connection_error(str(e))
             sys.exit(1)
 
+    @timing.timed('select_build')
     def select_build(self):
+        from resources.lib import gui
+
         build_select = gui.BuildSelectDialog(self.installed_build)
         build_select.doModal()
         
@@ -126,12 +150,90 @@ class Main(object):
             
         self.selected_build = selected_build
 
+    @timing.timed('bisect')
+    def maybe_bisect(self):
+        """Ask for the result of testing the candidate if a bisect is in
+           progress and choose the next one. Return False to choose a build
+           from the build select dialog instead.
+        """
+        from resources.lib import history, bisection
+
+        bisect = history.get_bisect()
+        if bisect is None:
+            return False
+
+        if bisect.candidate == self.installed_build.version:
+            heading = L10n(32089).format(bisect.candidate)
+            choices = [(bisection.GOOD, L10n(32083)),
+                       (bisection.BAD, L10n(32084)),
+                       (bisection.SKIP, L10n(32085))]
+        else:
+            # The candidate was not installed, e.g. the installation was cancelled.
+            heading = L10n(32087)
+            choices = [('install', L10n(32099))]
+        choices += [('stop', L10n(32086)), ('choose', L10n(32091))]
+
+        index = xbmcgui.Dialog().select(heading, [label for choice, label in choices])
+        if index < 0:
+            sys.exit(0)
+        choice = choices[index][0]
+        if choice == 'choose':
+            return False
+        if choice == 'stop':
+            history.finish_bisect(bisect)
+            bisection.remove_prefetched()
+            return False
+
+        import requests
+
+        try:
+            build_links = bisection.get_builds(bisect.source)
+        except requests.RequestException as e:
+            utils.connection_error(str(e))
+            sys.exit(1)
+
+        if choice != 'install':
+            history.add_bisect_step(bisect, choice)
+            bisect = history.get_bisect()
+
+        candidates = bisection.between(build_links or [], bisect.good, bisect.bad)
+        if candidates is None:
+            log.log("Bisect builds are no longer available from {}".format(bisect.source))
+            utils.ok(L10n(32087), L10n(32096).format(bisect.source))
+            history.finish_bisect(bisect)
+            bisection.remove_prefetched()
+            sys.exit(1)
+
+        candidate = bisection.midpoint(candidates, bisect.skipped)
+        if candidate is None:
+            log.log("Bisect finished: {} is good and {} is bad".format(bisect.good, bisect.bad))
+            utils.ok(L10n(32087), L10n(32093).format(bisect.good),
+                     L10n(32094).format(bisect.bad),
+                     L10n(32095).format(", ".join(build.version for build in candidates))
+                     if candidates else "")
+            history.finish_bisect(bisect)
+            bisection.remove_prefetched()
+            sys.exit(0)
+
+        history.set_bisect_candidate(bisect, candidate.version)
+        bisection.remove_prefetched(keep=candidate.version)
+        log.log("Bisect candidate: {}".format(candidate))
+
+        if not utils.yesno(L10n(32087), L10n(32090).format(utils.format_build(candidate)),
+                           L10n(32098).format(len(candidates), bisection.steps_left(candidates))):
+            sys.exit(0)
+
+        self.selected_source = bisect.source
+        self.selected_build = candidate
+        return True
+
     def check_archive(self):
-        self.archive = addon.get_bool_setting('archive')
+        self.archive_tar_path = None
+        # Builds from a local or network directory do not need archiving.
+        self.archive = (addon.get_bool_setting('archive') and
+                        not isinstance(self.selected_build, builds.ArchiveBuildLinkBase))
         if self.archive:
-            archive_root = addon.get_setting('archive_root')
-            self.archive_root = utils.ensure_trailing_slash(archive_root)
-            self.archive_tar_path = None
+            self.archive_root = utils.get_archive_root()
             self.archive_dir = os.path.join(self.archive_root, str(self.selected_source))
             log.log("Archive builds to " + self.archive_dir)
             if not xbmcvfs.exists(self.archive_root):
@@ -144,13 +246,25 @@ class Main(object):
                 utils.ok(L10n(32009), L10n(32012).format(self.archive_dir), L10n(32013))
                 sys.exit(1)
 
+    @timing.timed('maybe_download')
     def maybe_download(self):
+        if isinstance(self.selected_build, builds.ArchiveBuildLinkBase):
+            self.copy_archived_build()
+            return
+
+        import requests
+        from resources.lib import checksums
+
         try:
             remote_file = self.selected_build.remote_file()
         except requests.RequestException as e:
             utils.url_error(self.selected_build.url, str(e))
             sys.exit(1)
 
+        self.mirror = self.selected_build.mirror
+        if self.selected_build.from_peer:
+            self.origin = 'peer'
+
         filename = self.selected_build.filename
         tar_name = self.selected_build.tar_name
         size = self.selected_build.size
@@ -162,120 +276,209 @@ class Main(object):
             self.archive_tar_path = os.path.join(self.archive_dir, tar_name)
         
         if not self.copy_from_archive():
-            if (os.path.isfile(self.download_path) and
-                    os.path.getsize(self.download_path) == size):
-                    # Skip the download if the file exists with the correct size.
+            if self.selected_build.from_peer:
+                # The checksum on the server is for the compressed file, so the
+                # tar file from a peer, which could be any host on the network,
+                # is checked against the trusted checksum of the tar file which
+                # a peer is only used with.
+                checksum = self.selected_build.tar_checksum()
+            else:
+                checksum = self.selected_build.checksum()
+
+            if checksums.is_reusable(self.download_path, size, checksum):
+                # Skip the download if the file is complete and matches the checksum.
                 log.log("Skipping download")
+                remote_file.close()
+                self.origin = 'cache'
             else:
+                hasher = checksums.new_hasher(checksum)
                 try:
                     log.log("Starting download of {} to {}".format(self.selected_build.url,
                                                                    self.download_path))
-                    with progress.FileProgress(L10n(32014), remote_file, self.download_path,
-                                               size, self.background) as downloader:
-                        downloader.start()
+                    with timing.span('download', url=self.selected_build.url,
+                                     bytes=size) as span:
+                        with progress.FileProgress(L10n(32014), remote_file,
+                                                   self.download_path, size,
+                                                   self.background, hasher) as downloader:
+                            downloader.start()
+                    self.add_phase(span)
                     log.log("Completed download")
                 except script_exceptions.Canceled:
                     sys.exit(0)
-                except requests.RequestException as e:
+                except (requests.RequestException, script_exceptions.ReadError) as e:
                     utils.url_error(self.selected_build.url, str(e))
                     sys.exit(1)
                 except script_exceptions.WriteError as e:
                     utils.write_error(self.download_path, str(e))
                     sys.exit(1)
 
+                if checksum is not None and hasher.hexdigest() != checksum[1]:
+                    log.log("{} checksum mismatch".format(self.download_path))
+                    checksums.remove(self.download_path)
+                    utils.ok(L10n(32072), self.selected_build.filename, L10n(32073))
+                    sys.exit(1)
+                checksums.write_record(self.download_path, hasher.name.lower(),
+                                        hasher.hexdigest())
+
             if self.selected_build.compressed:
                 try:
                     bf = open(self.download_path, 'rb')
                     log.log("Starting decompression of " + self.download_path)
-                    with progress.DecompressProgress(L10n(32015),
-                                                     bf, self.temp_tar_path, size,
-                                                     self.background) as decompressor:
-                        decompressor.start()
+                    with timing.span('decompress') as span:
+                        with progress.DecompressProgress(L10n(32015),
+                                                         bf, self.temp_tar_path, size,
+                                                         self.background) as decompressor:
+                            decompressor.start()
+                        span.set(bytes=os.path.getsize(self.temp_tar_path))
+                    self.add_phase(span)
                     log.log("Completed decompression")
                 except script_exceptions.Canceled:
                     sys.exit(0)
                 except script_exceptions.WriteError as e:
                     utils.write_error(self.temp_tar_path, str(e))
                     sys.exit(1)
-                except script_exceptions.DecompressError as e:
+                except (script_exceptions.DecompressError, script_exceptions.ReadError) as e:
                     utils.decompress_error(self.download_path, str(e))
                     sys.exit(1)
                 finally:
-                    funcs.remove_file(self.download_path)
+                    checksums.remove(self.download_path)
 
             self.maybe_copy_to_archive()
         
             log.log("Moving tar file to " + self.update_tar_path)
             os.renames(self.temp_tar_path, self.update_tar_path)
+            if not self.selected_build.compressed:
+                funcs.remove_file(self.download_path + checksums.RECORD_EXT)
 
         addon.set_setting('update_pending', 'true')
 
+    def copy_archived_build(self):
+        """Copy a build from a local or network directory with no download."""
+        self.archive_tar_path = self.selected_build.url
+        self.update_tar_path = os.path.join(openelec.UPDATE_DIR,
+                                            self.selected_build.tar_name)
+        if not self.copy_from_archive():
+            log.log("Unable to access {}".format(self.archive_tar_path))
+            utils.ok(L10n(32009), L10n(32010).format(self.archive_tar_path))
+            sys.exit(1)
+        addon.set_setting('update_pending', 'true')
+
     def copy_from_archive(self):
-        if self.archive and xbmcvfs.exists(self.archive_tar_path):
+        from resources.lib import checksums
+
+        if self.archive_tar_path is not None and xbmcvfs.exists(self.archive_tar_path):
             log.log("Skipping download and decompression")
 
             archive = xbmcvfs.File(self.archive_tar_path)
+            # Copied to a temporary name so that the update file, which is
+            # served to peers, is only there when it is complete.
+            part_path = self.update_tar_path + PART_EXT
+            # Checked against the checksum recorded when the file was archived.
+            checksum = builds.ArchiveBuildLinkExtractor.archived_checksum(
+                self.archive_tar_path)
+            hasher = checksums.new_hasher(checksum)
             try:
-                with progress.FileProgress(L10n(32016),
-                                           archive, self.update_tar_path, archive.size(),
-                                           self.background) as extractor:
-                    extractor.start()
+                with timing.span('copy_from_archive', bytes=archive.size()) as span:
+                    with progress.FileProgress(L10n(32016),
+                                               archive, part_path, archive.size(),
+                                               self.background, hasher) as extractor:
+                        extractor.start()
+                self.add_phase(span)
+                self.tar_digest = (hasher.name.lower(), hasher.hexdigest())
+                self.origin = 'archive'
+                self.mirror = None
             except script_exceptions.Canceled:
-                funcs.remove_file(self.tar_path)
                 sys.exit(0)
+            except script_exceptions.ReadError as e:
+                log.log("Unable to read {}: {}".format(self.archive_tar_path, e))
+                utils.ok(L10n(32009), L10n(32010).format(self.archive_tar_path))
+                sys.exit(1)
             except script_exceptions.WriteError:
                 sys.exit(1)
+
+            if checksum is not None and hasher.hexdigest() != checksum[1]:
+                log.log("{} checksum mismatch".format(self.archive_tar_path))
+                funcs.remove_file(part_path)
+                if isinstance(self.selected_build, builds.ArchiveBuildLinkBase):
+                    utils.ok(L10n(32072), self.selected_build.filename, L10n(32153))
+                    sys.exit(1)
+                # Download the build again, which replaces the archived copy.
+                xbmcvfs.delete(self.archive_tar_path)
+                self.tar_digest = None
+                return False
+
+            os.rename(part_path, self.update_tar_path)
             return True
         return False
 
     def maybe_copy_to_archive(self):
+        from resources.lib import checksums
+
         if self.archive and not xbmcvfs.exists(self.archive_tar_path):
             log.log("Archiving tar file to {}".format(self.archive_tar_path))
 
             tar = open(self.temp_tar_path)
             size = os.path.getsize(self.temp_tar_path)
+            # Copied to a temporary name so that peers are never offered a
+            # partly copied file.
+            part_path = self.archive_tar_path + PART_EXT
+            hasher = checksums.new_hasher(None)
 
             try:
-                with progress.FileProgress(L10n(32017),
-                                           tar, self.archive_tar_path, size,
-                                           self.background) as extractor:
-                    extractor.start()
+                with timing.span('archive', bytes=size) as span:
+                    with progress.FileProgress(L10n(32017),
+                                               tar, part_path, size,
+                                               self.background, hasher) as extractor:
+                        extractor.start()
+                self.add_phase(span)
+                self.tar_digest = (hasher.name.lower(), hasher.hexdigest())
+                if not funcs.vfs_rename(part_path, self.archive_tar_path):
+                    raise script_exceptions.WriteError("Unable to rename {}".format(part_path))
             except script_exceptions.Canceled:
                 log.log("Archive copy canceled")
-                xbmcvfs.delete(self.archive_tar_path)
+                xbmcvfs.delete(part_path)
+            except script_exceptions.ReadError as e:
+                log.log("Unable to read {}: {}".format(self.temp_tar_path, e))
+                xbmcvfs.delete(part_path)
             except script_exceptions.WriteError as e:
                 utils.write_error(self.archive_tar_path, str(e))
-                xbmcvfs.delete(self.archive_tar_path)
+                xbmcvfs.delete(part_path)
+            else:
+                builds.ArchiveBuildLinkExtractor.add_build(
+                    self.archive_dir, self.selected_build.tar_name,
+                    self.selected_build, size, self.tar_digest)
 
     def maybe_verify(self):
         if not self.verify_files:
             return
 
+        from resources.lib import verify
+
         log.log("Verifying update file")
-        with closing(tarfile.open(self.update_tar_path, 'r')) as tf:
-            tar_names = tf.getnames()
+        with timing.span('verify') as span:
+            members = verify.find_images(self.update_tar_path, openelec.UPDATE_IMAGES)
+
+            if (self.archive_tar_path is not None and len(members) == len(openelec.UPDATE_IMAGES)
+                    and verify.is_verified(self.archive_tar_path, self.update_tar_path,
+                                           members.values(), self.tar_digest)):
+                log.log("{} was already verified".format(self.archive_tar_path))
+                span.set(skipped=True)
+                return
+
+            try:
+                md5sums = progress.hash_members(L10n(32018), self.update_tar_path,
+                                                members.values(), self.background)
+            except script_exceptions.Canceled:
+                return
 
             for update_image in openelec.UPDATE_IMAGES:
-                path_in_tar = next(name for name in tar_names
-                                   if name.endswith(os.path.join('target', update_image)))
-                ti = tf.extractfile(path_in_tar)
-                temp_image_path = os.path.join(TEMP_PATH, update_image)
                 try:
-                    with progress.FileProgress(L10n(32018), ti, temp_image_path, ti.size,
-                                               self.background) as extractor:
-                        extractor.start()
-                    log.log("Extracted " + temp_image_path)
-                except script_exceptions.Canceled:
-                    return
-                except script_exceptions.WriteError as e:
-                    utils.write_error(temp_image_path, str(e))
-                    return
-
-                md5sum = tf.extractfile(path_in_tar + '.md5').read().split()[0]
+                    md5sum = members[update_image].md5sum
+                except KeyError:
+                    md5sum = None
                 log.log("{}.md5 file = {}".format(update_image, md5sum))
-        
-                if not progress.md5sum_verified(md5sum, temp_image_path,
-                                                self.background):
+
+                if md5sum is None or md5sums.get(update_image) != md5sum:
                     log.log("{} md5 mismatch!".format(update_image))
                     utils.ok(L10n(32019).format(update_image),
                              self.selected_build.filename,
@@ -285,9 +488,23 @@ class Main(object):
                 else:
                     log.log("{} md5 is correct".format(update_image))
 
-                funcs.remove_file(temp_image_path)
+            span.set(bytes=sum(member.size for member in members.values()))
+
+            if (self.archive_tar_path is not None and self.tar_digest is not None
+                    and xbmcvfs.exists(self.archive_tar_path)):
+                verify.record_verified(self.archive_tar_path, members.values(),
+                                       self.tar_digest)
+
+        self.add_phase(span)
+
+    def add_phase(self, span):
+        self.phases.append((span.name, span.seconds, span.fields.get('bytes')))
 
     def confirm(self):
+        from resources.lib import history
+
+        history.add_transfer(self.selected_source, self.selected_build,
+                             self.origin, self.mirror, self.phases)
         funcs.create_notify_file(self.selected_source, self.selected_build)
 
         build_str = utils.format_build(self.selected_build)
@@ -336,16 +553,35 @@ def new_build_check():
         if addon.get_bool_setting('set_timeout'):
             builds.timeout = float(addon.get_setting('timeout'))
 
-        build_sources = builds.sources()
-        try:
-            build_url = build_sources[source]
-        except KeyError:
+        builds.archive_root = utils.get_archive_root()
+
+        build_url = builds.get_source(source)
+        if build_url is None:
             log.log("{} is not a valid source".format(source))
             return
 
         log.log("Checking {}".format(build_url.url))
 
-        latest = builds.latest_build(source)
+        if not scheduler.is_allowed(source):
+            log.log("Skipping build check - {} was checked recently".format(source))
+            return
+
+        import requests
+
+        try:
+            with timing.span('build_check', source=source, url=build_url.url) as span:
+                latest = build_url.latest()
+                span.set(latest=str(latest))
+        except builds.HostUnavailableError as e:
+            # No request was made so the check is retried at the next interval.
+            log.log("Skipping build check - {}".format(e))
+            return
+        except (requests.RequestException, builds.BuildURLError) as e:
+            log.log("Unable to check for a new build: {}".format(e))
+            scheduler.record_check(source, success=False)
+            return
+        scheduler.record_check(source, success=True)
+
         if latest and latest > installed_build:
             if utils.do_show_dialog():
                 log.log("New build {} is available, "
@@ -364,6 +600,87 @@ def new_build_check():
                              4000)
 
 
+def bisect_prefetch():
+    """Download the builds which could be tested after the installed bisect
+       candidate while it is being tested.
+    """
+    from resources.lib import history, bisection
+
+    bisect = history.get_bisect()
+    if bisect is None or bisect.candidate != builds.get_installed_build().version:
+        return
+
+    builds.arch = utils.get_arch()
+
+    if addon.get_bool_setting('set_timeout'):
+        builds.timeout = float(addon.get_setting('timeout'))
+
+    builds.peer_finder = utils.get_peer_finder()
+
+    import requests
+
+    try:
+        build_links = bisection.get_builds(bisect.source)
+    except requests.RequestException as e:
+        log.log("Unable to get the builds to prefetch: {}".format(e))
+        return
+
+    if build_links:
+        bisection.prefetch_next(build_links, bisect, TEMP_PATH)
+
+
+def archive_warmup():
+    """Download the newest builds of the selected source into the archive."""
+    from resources.lib import warmup
+
+    archive_root = utils.get_archive_root()
+    if archive_root is None or not addon.get_bool_setting('archive_warmup'):
+        return
+    if warmup.is_running():
+        log.log("Archive warm-up is already running")
+        return
+
+    builds.arch = utils.get_arch()
+
+    if addon.get_bool_setting('set_timeout'):
+        builds.timeout = float(addon.get_setting('timeout'))
+
+    source = addon.get_setting('source_name')
+    build_sources = builds.sources()
+    utils.add_custom_sources(build_sources)
+    try:
+        build_url = build_sources[source]
+    except KeyError:
+        log.log("{} is not a valid source".format(source))
+        return
+    if isinstance(build_url, builds.ArchiveBuildsURL):
+        # The builds are already in a local or network directory.
+        return
+
+    archive_dir = os.path.join(archive_root, source)
+    if not xbmcvfs.mkdir(archive_dir):
+        log.log("Unable to create {}".format(archive_dir))
+        return
+
+    import requests
+
+    try:
+        build_links = build_url.builds()
+    except (requests.RequestException, builds.BuildURLError) as e:
+        log.log("Unable to get the builds to archive: {}".format(e))
+        return
+
+    bandwidth = float(addon.get_setting('warmup_bandwidth') or 0)
+    warmer = warmup.ArchiveWarmup(archive_dir, TEMP_PATH, xbmc.Monitor(),
+                                  bandwidth * 1e6 or None,
+                                  addon.get_int_setting('warmup_jobs'))
+    warmup.set_running(True)
+    try:
+        warmer.run(build_links, addon.get_int_setting('warmup_count'))
+    finally:
+        warmup.set_running(False)
+
+
 log.log_version()
 log.log("Script arguments: {}".format(sys.argv))
 
@@ -392,7 +709,17 @@ if len(sys.argv) > 1:
             funcs.remove_notify_file()
         else:
             log.log("No new installation")
+
+    elif sys.argv[1] == 'prefetch':
+        bisect_prefetch()
+
+    elif sys.argv[1] == 'warmup':
+        archive_warmup()
 else:
-    with Main() as main:
+    profile = addon.get_bool_setting('profile')
+    if profile:
+        # Only profile a single run.
+        addon.set_setting('profile', 'false')
+    with timing.profiling('default', profile), Main() as main:
         main.start()
 
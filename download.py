@@ -30,15 +30,18 @@ add_deps_to_path()
 
 import requests
 
-from resources.lib import builds, openelec, funcs
+from resources.lib import builds, openelec, funcs, timing, checksums
 
 
 parser = ArgumentParser(description='Download an OpenELEC update')
 parser.add_argument('-a', '--arch',
                     help='Set the build type (e.g. Generic.x86_64, RPi.arm)')
-parser.add_argument('-s', '--source', help='Set the build source')
+parser.add_argument('-s', '--source',
+                    help='Set the build source (a source name, URL or directory)')
 parser.add_argument('-r', '--releases', action='store_true',
                     help='Look for unofficial releases instead of development builds')
+parser.add_argument('--profile', action='store_true',
+                    help='Profile the run and save the results in the home directory')
 
 args = parser.parse_args()
 
@@ -87,9 +90,11 @@ if args.source:
                                              extractor=builds.ReleaseLinkExtractor)
             else:
                 build_url = builds.BuildsURL(source)
+        elif os.path.isdir(source):
+            build_url = builds.ArchiveBuildsURL(source)
         else:
-            print ('"{}" is not in the list of available sources '
-                   'and is not a valid HTTP URL').format(args.source)
+            print ('"{}" is not in the list of available sources, '
+                   'a valid HTTP URL or a directory').format(args.source)
             print 'Valid options are:\n\t{}'.format("\n\t".join(urls.keys()))
             sys.exit(1)
 else:
@@ -113,61 +118,95 @@ print "Installed build: {}".format(installed_build)
 
 
 def read(f):
-    return f.read(131072)
+    data = f.read(131072)
+    if not data:
+        # e.g. the connection was closed, after which every read is empty.
+        raise IOError("Read ended after {}".format(size_fmt(f.tell())))
+    return data
 
 decompressor = bz2.BZ2Decompressor()
 def decompress(f):
     data = read(f)
     return decompressor.decompress(data)
 
-def process(fin, fout, size, read_func=read):
+def process(fin, fout, size, read_func=read, hasher=None):
     start_time = time.time()
     done = 0
     while done < size:
         data = read_func(fin)
         done = fin.tell()
         fout.write(data)
+        if hasher is not None:
+            hasher.update(data)
         percent = int(done * 100 / size)
         bytes_per_second = done / (time.time() - start_time)
         print "\r {0:3d}%   ({1}/s)   ".format(percent, size_fmt(bytes_per_second)),
         sys.stdout.flush()
     print
 
-try:
-    links = build_url.builds()
-except requests.RequestException as e:
-    print str(e)
-except builds.BuildURLError as e:
-    print str(e)
-else:
-    if links:
-        build = get_choice(links, build_suffix, reverse=True)
-        remote = build.remote_file()
-        file_path = os.path.join(openelec.UPDATE_DIR, build.filename)
-        print
-        print "Downloading {0} ...".format(build.url)
-        try:
-            with open(file_path, 'w') as out:
-                process(remote, out, build.size)
-        except KeyboardInterrupt:
-            os.remove(file_path)
-            print
-            print "Download cancelled"
-            sys.exit()
-
-        if build.compressed:
-            tar_path = os.path.join(openelec.UPDATE_DIR, build.tar_name)
-            size = os.path.getsize(file_path)
-            print
-            print "Decompressing {0} ...".format(file_path)
-            with open(file_path, 'r') as fin, open(tar_path, 'w') as fout:
-                process(fin, fout, size, decompress)
-            os.remove(file_path)
+with timing.profiling('download', args.profile):
+    try:
+        links = build_url.builds()
+    except requests.RequestException as e:
+        print str(e)
+    except builds.BuildURLError as e:
+        print str(e)
+    else:
+        if links:
+            build = get_choice(links, build_suffix, reverse=True)
+            remote = build.remote_file()
+            file_path = os.path.join(openelec.UPDATE_DIR, build.filename)
+            checksum = build.tar_checksum() if build.from_peer else build.checksum()
+            if checksums.is_reusable(file_path, build.size, checksum):
+                remote.close()
+                print
+                print "Using {0} which is already downloaded".format(file_path)
+            else:
+                print
+                print "Downloading {0} ...".format(build.url)
+                hasher = checksums.new_hasher(checksum)
+                try:
+                    with open(file_path, 'w') as out:
+                        process(remote, out, build.size, hasher=hasher)
+                except KeyboardInterrupt:
+                    os.remove(file_path)
+                    print
+                    print "Download cancelled"
+                    sys.exit()
+                except (requests.RequestException, IOError) as e:
+                    os.remove(file_path)
+                    print
+                    print "Download failed: {}".format(e)
+                    sys.exit(1)
+
+                if checksum is not None and hasher.hexdigest() != checksum[1]:
+                    checksums.remove(file_path)
+                    print
+                    print "The download does not match the {0} checksum".format(checksum[0])
+                    sys.exit(1)
+                checksums.write_record(file_path, hasher.name.lower(), hasher.hexdigest())
+
+            if build.compressed:
+                tar_path = os.path.join(openelec.UPDATE_DIR, build.tar_name)
+                size = os.path.getsize(file_path)
+                print
+                print "Decompressing {0} ...".format(file_path)
+                try:
+                    with open(file_path, 'r') as fin, open(tar_path, 'w') as fout:
+                        process(fin, fout, size, decompress)
+                except IOError as e:
+                    os.remove(tar_path)
+                    print
+                    print "Decompression failed: {}".format(e)
+                    sys.exit(1)
+                checksums.remove(file_path)
+            else:
+                funcs.remove_file(file_path + checksums.RECORD_EXT)
 
-        funcs.create_notify_file(source, build)
+            funcs.create_notify_file(source, build)
 
-        print
-        print "The update is ready to be installed. Please reboot."
-    else:
-        print
-        print "No builds available"
+            print
+            print "The update is ready to be installed. Please reboot."
+        else:
+            print
+            print "No builds available"
@@ -0,0 +1,114 @@
+#! /usr/bin/python
+''' Write the manifests of the builds in a mirror directory
+
+A source which publishes a manifest.json next to its builds is listed by
+the add-on with one small request instead of parsing the HTML listing,
+and the sizes and checksums in the manifest save a request for each build.
+The manifest has the same format as those of the archive, so a directory
+written by sync.py can be published as it is once its manifests are
+updated with the checksums.
+
+The compressed and decompressed build files in each directory are listed.
+The entry of a compressed file also has the checksums and size of the
+decompressed tar file, without which a peer is not used for the build. Existing
+entries are kept, which keeps the build dates from the source, and only
+new or changed files are hashed.
+
+    python manifest.py --recursive /srv/openelec
+'''
+
+import os
+import bz2
+import json
+import hashlib
+import sys
+from argparse import ArgumentParser
+
+from resources.lib import builds, checksums, funcs
+
+
+ALGORITHM = checksums.ALGORITHMS[0]
+
+
+def hash_decompressed(path, algorithm):
+    """Return the digest and size of the decompressed contents of a .bz2 file."""
+    hasher = hashlib.new(algorithm)
+    decompressor = bz2.BZ2Decompressor()
+    size = 0
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(checksums.BLOCK_SIZE), ''):
+            data = decompressor.decompress(data)
+            hasher.update(data)
+            size += len(data)
+    return hasher.hexdigest(), size
+
+
+def update_manifest(directory):
+    """Update the manifest of the build files in directory.
+       Return the number of entries and the number of files hashed.
+    """
+    extractor = builds.ArchiveBuildLinkExtractor
+    manifest_path = os.path.join(directory, extractor.MANIFEST_NAME)
+    manifest = funcs.read_json_file(manifest_path, {})
+    old_entries = dict((entry['filename'], entry) for entry in manifest.get('builds', []))
+
+    entries = []
+    hashed = 0
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if not os.path.isfile(path):
+            continue
+        entry = old_entries.get(filename)
+        if entry is None or entry['size'] != os.path.getsize(path):
+            entry = extractor.parse_filename(directory, filename)
+            if entry is None:
+                continue
+        missing_tar_checksum = (filename.endswith('.bz2') and
+                                (ALGORITHM not in entry.get('tar_checksums', {}) or
+                                 'tar_size' not in entry))
+        if ALGORITHM not in entry.get('checksums', {}) or missing_tar_checksum:
+            entry['checksums'] = {ALGORITHM: checksums.hash_file(path, ALGORITHM)}
+            if filename.endswith('.bz2'):
+                digest, entry['tar_size'] = hash_decompressed(path, ALGORITHM)
+                entry['tar_checksums'] = {ALGORITHM: digest}
+            hashed += 1
+        entries.append(entry)
+
+    manifest['builds'] = entries
+    # Replace the manifest in one step so that it is never served partly written.
+    temp_path = manifest_path + '.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.rename(temp_path, manifest_path)
+    return len(entries), hashed
+
+
+def main():
+    parser = ArgumentParser(description='Write the manifests of the OpenELEC builds '
+                                        'in a mirror directory')
+    parser.add_argument('directory', help='directory containing the builds')
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help='also write the manifests of the subdirectories, '
+                             'e.g. for each source of a mirror')
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        parser.error('"{}" is not a directory'.format(args.directory))
+
+    directories = [args.directory]
+    if args.recursive:
+        directories.extend(os.path.join(args.directory, d)
+                           for d in sorted(os.listdir(args.directory))
+                           if os.path.isdir(os.path.join(args.directory, d)))
+
+    for directory in directories:
+        try:
+            count, hashed = update_manifest(directory)
+        except (IOError, OSError) as e:
+            print "Unable to update the manifest of {}: {}".format(directory, e)
+            sys.exit(1)
+        print "{}: {} builds, {} hashed".format(directory, count, hashed)
+
+
+if __name__ == "__main__":
+    main()
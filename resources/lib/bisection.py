@@ -0,0 +1,146 @@
+''' Bisecting the builds of a source to find the build which broke something
+
+The user marks a good and a bad build of a source and the build halfway
+between them is installed to be tested. Each result halves the builds
+left, until the bad build is next to the good one. The bisect in progress
+is kept in the history database.
+
+While a candidate is being tested, the two builds which could be tested
+next, one for each result, are downloaded in the background to the
+directory which the main script downloads to, so whichever is chosen is
+installed without waiting for the download. The download of the build
+which is not chosen is removed.
+'''
+
+import os
+import math
+
+from . import builds, utils, log, funcs, checksums, progress, timing, script_exceptions
+from .addon import L10n
+
+
+GOOD = 'good'
+BAD = 'bad'
+SKIP = 'skip'
+
+# The paths of the prefetched downloads, keyed on the build version.
+STATE_FILE = os.path.join(funcs.CACHE_DIR, 'bisect_prefetch.json')
+
+
+def get_builds(source):
+    """Return the builds of source, newest first, or None if the source no
+       longer exists.
+    """
+    sources = builds.sources()
+    utils.add_custom_sources(sources)
+    try:
+        build_url = sources[source]
+    except KeyError:
+        return None
+    return build_url.builds()
+
+
+def between(build_links, good, bad):
+    """Return the builds between the versions good and bad in list order, or
+       None if either of them is not in build_links.
+    """
+    positions = [position for position, build in enumerate(build_links)
+                 if build.version in (good, bad)]
+    if len(positions) != 2:
+        return None
+    return build_links[positions[0] + 1:positions[1]]
+
+
+def midpoint(candidates, skipped=()):
+    """Return the build nearest the middle of candidates which was not
+       skipped, or None if there is none left to test.
+    """
+    middle = (len(candidates) - 1) / 2.0
+    testable = [position for position, build in enumerate(candidates)
+                if build.version not in skipped]
+    if not testable:
+        return None
+    return candidates[min(testable, key=lambda position: abs(position - middle))]
+
+
+def steps_left(candidates):
+    """Return the number of builds to test at most to finish bisecting candidates."""
+    return int(math.ceil(math.log(len(candidates) + 1, 2)))
+
+
+def next_builds(build_links, bisect):
+    """Return the build which would be tested next for each result of testing
+       the candidate of bisect, keyed on the result.
+    """
+    next_builds = {}
+    for result in (GOOD, BAD):
+        good = bisect.candidate if result == GOOD else bisect.good
+        bad = bisect.candidate if result == BAD else bisect.bad
+        candidates = between(build_links, good, bad)
+        if candidates:
+            build = midpoint(candidates, bisect.skipped)
+            if build is not None:
+                next_builds[result] = build
+    return next_builds
+
+
+def prefetch(build, directory):
+    """Download the compressed file of build to directory, where it is reused
+       by the main script if it is complete and matches the checksum.
+    """
+    remote_file = build.remote_file()
+    path = os.path.join(directory, build.filename)
+    # The checksum on the server is for the compressed file, not the tar
+    # file from a peer, which is only used if the source has a checksum of
+    # the tar file.
+    checksum = build.tar_checksum() if build.from_peer else build.checksum()
+
+    if checksums.is_reusable(path, build.size, checksum):
+        log.log("{} was already downloaded".format(path))
+        remote_file.close()
+    else:
+        # Download to a temporary name so that the main script never sees
+        # an incomplete file.
+        part_path = path + '.part'
+        hasher = checksums.new_hasher(checksum)
+        log.log("Prefetching {} to {}".format(build.url, path))
+        with timing.span('prefetch', url=build.url, bytes=build.size):
+            with progress.FileProgress(L10n(32097).format(build.version), remote_file,
+                                       part_path, build.size, True, hasher) as downloader:
+                downloader.start()
+
+        if checksum is not None and hasher.hexdigest() != checksum[1]:
+            log.log("{} checksum mismatch".format(part_path))
+            funcs.remove_file(part_path)
+            return
+        os.rename(part_path, path)
+        checksums.write_record(path, hasher.name.lower(), hasher.hexdigest())
+
+    state = funcs.read_json_file(STATE_FILE, {})
+    state[build.version] = path
+    funcs.write_json_file(STATE_FILE, state)
+
+
+def prefetch_next(build_links, bisect, directory):
+    """Prefetch the builds which could be tested after the candidate of bisect."""
+    import requests
+
+    for build in set(next_builds(build_links, bisect).values()):
+        try:
+            prefetch(build, directory)
+        except (requests.RequestException, script_exceptions.ReadError,
+                script_exceptions.WriteError) as e:
+            log.log("Unable to prefetch {}: {}".format(build.url, e))
+        except script_exceptions.Canceled:
+            log.log("Prefetch canceled")
+            return
+
+
+def remove_prefetched(keep=None):
+    """Remove the prefetched downloads except that of the version keep."""
+    state = funcs.read_json_file(STATE_FILE, {})
+    for version, path in state.items():
+        if version != keep:
+            checksums.remove(path)
+            del state[version]
+    funcs.write_json_file(STATE_FILE, state)
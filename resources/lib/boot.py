@@ -0,0 +1,94 @@
+''' Running of the service tasks at startup without delaying Kodi
+
+Only the critical tasks are run as soon as the service starts. The others
+are run in the background once Kodi has been idle for IDLE_SECONDS, or
+after at most MAX_DEFER seconds, and those which need the network only
+once it is up. Each task is timed as a span named after it, with the
+seconds it was deferred by, so the latency that each task adds to startup
+can be found in the timing log.
+'''
+
+import time
+import threading
+from collections import namedtuple
+
+import xbmc
+
+from . import log, timing
+
+
+IDLE_SECONDS = 10
+MAX_DEFER = 120
+
+POLL_INTERVAL = 2
+
+Task = namedtuple('Task', 'name func critical network')
+
+
+def network_ready():
+    """Return True if Kodi has a network address other than loopback."""
+    address = xbmc.getIPAddress()
+    return bool(address) and not address.startswith('127.')
+
+
+def wait_for_network(monitor, interval=POLL_INTERVAL):
+    """Wait until the network is up. Return False if Kodi exits first."""
+    if not network_ready():
+        log.log("Waiting for the network")
+        while not network_ready():
+            if monitor.waitForAbort(interval):
+                return False
+    return True
+
+
+class BootTasks(object):
+    """The tasks to run at startup in the order they were added.
+
+       The return value of each task is kept in results under its name.
+    """
+    def __init__(self, monitor):
+        self._monitor = monitor
+        self._tasks = []
+        self._start = time.time()
+        self.results = {}
+
+    def add(self, name, func, critical=False, network=False):
+        self._tasks.append(Task(name, func, critical, network))
+
+    def run(self):
+        """Run the critical tasks now and start a thread for the others."""
+        for task in self._tasks:
+            if task.critical:
+                self._run(task)
+
+        deferred = [task for task in self._tasks if not task.critical]
+        if deferred:
+            thread = threading.Thread(target=self._run_deferred, args=(deferred,),
+                                      name="Boot tasks")
+            thread.daemon = True
+            thread.start()
+
+    def _run(self, task):
+        deferred = time.time() - self._start
+        with timing.span(task.name, critical=task.critical, deferred=round(deferred, 3)):
+            try:
+                self.results[task.name] = task.func()
+            except Exception as e:
+                log.log_error("Boot task {} failed: {}".format(task.name, e))
+
+    def _is_idle(self):
+        return (xbmc.getGlobalIdleTime() >= IDLE_SECONDS or
+                time.time() - self._start >= MAX_DEFER)
+
+    def _run_deferred(self, tasks):
+        while tasks:
+            if self._is_idle():
+                for task in list(tasks):
+                    if task.network and not network_ready():
+                        continue
+                    self._run(task)
+                    tasks.remove(task)
+                    if self._monitor.abortRequested():
+                        return
+            if tasks and self._monitor.waitForAbort(POLL_INTERVAL):
+                return
@@ -7,27 +7,147 @@ import _strptime
 import time
 import re
 import os
+import threading
 import urlparse
+import codecs
+import HTMLParser
 from datetime import datetime
-from collections import OrderedDict
-from urllib2 import unquote
+from collections import OrderedDict, MutableMapping
+from contextlib import contextmanager
+from urllib2 import quote, unquote
 
-from bs4 import BeautifulSoup, SoupStrainer
-import requests
-import html2text
-
-import openelec, funcs, log
+import openelec, funcs, log, timing, checksums, health, metrics
 
 
 timeout = None
+github_token = None
+# Function returning the URL and size of a build tar file on a peer, or None.
+peer_finder = None
+# Directory containing the archived builds in a subdirectory for each source.
+archive_root = None
 arch = openelec.ARCH
 date_fmt = '%d %b %y'
 
+# Settings which override the defaults above for the current thread.
+_context = threading.local()
+
+# All requests go through one session so that connections are reused.
+# The session is created on first use because requests is slow to import.
+_session = None
+
+
+@contextmanager
+def context(**settings):
+    """Use settings, e.g. arch and timeout, instead of the module defaults
+       for the calls made in the current thread within the context, so that
+       several arches can be listed concurrently:
+
+           with builds.context(arch='RPi2.arm', timeout=30):
+               links = builds.sources()["Milhouse Builds"].builds()
+    """
+    previous = dict(_context.__dict__)
+    _context.__dict__.update(settings)
+    try:
+        yield
+    finally:
+        _context.__dict__.clear()
+        _context.__dict__.update(previous)
+
+
+def get_arch():
+    return getattr(_context, 'arch', arch)
+
+
+def get_timeout():
+    return getattr(_context, 'timeout', timeout)
+
+
+def get_session():
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    return _session
+
+
+def _soup(html, parse_only=None):
+    """Parse html with BeautifulSoup, which is only imported when first needed."""
+    from bs4 import BeautifulSoup
+    return BeautifulSoup(html, 'html.parser', parse_only=parse_only)
+
+
+def _strainer(*args, **kwargs):
+    from bs4 import SoupStrainer
+    return SoupStrainer(*args, **kwargs)
+
+
+class _DivParser(HTMLParser.HTMLParser):
+    """Incremental parser which keeps the markup of the first limit divs whose
+       attributes are accepted by match, and ignores the rest of the page.
+    """
+    def __init__(self, match, limit):
+        HTMLParser.HTMLParser.__init__(self)
+        self._match = match
+        self._limit = limit
+        self._parts = None
+        self._depth = 0
+        self.divs = []
+
+    @property
+    def done(self):
+        return len(self.divs) >= self._limit
+
+    def handle_starttag(self, tag, attrs):
+        if self._parts is None:
+            if tag != 'div' or self.done or not self._match(dict(attrs)):
+                return
+            self._parts = []
+        if tag == 'div':
+            self._depth += 1
+        self._parts.append(self.get_starttag_text())
+
+    def handle_startendtag(self, tag, attrs):
+        if self._parts is not None:
+            self._parts.append(self.get_starttag_text())
+
+    def handle_endtag(self, tag):
+        if self._parts is None:
+            return
+        self._parts.append("</{}>".format(tag))
+        if tag == 'div':
+            self._depth -= 1
+            if self._depth == 0:
+                self.divs.append(u"".join(self._parts))
+                self._parts = None
+
+    def _add(self, text):
+        if self._parts is not None:
+            self._parts.append(text)
+
+    def handle_data(self, data):
+        self._add(data)
+
+    def handle_entityref(self, name):
+        self._add(u"&{};".format(name))
+
+    def handle_charref(self, name):
+        self._add(u"&#{};".format(name))
+
+
+def _post_body_match(attrs, id=None):
+    return ('post-body' in attrs.get('class', '').split() and
+            (id is None or attrs.get('id') == id))
+
 
 class BuildURLError(Exception):
     pass
 
 
+class HostUnavailableError(BuildURLError):
+    """Raised without making a request while the circuit breaker of a host is open."""
+    pass
+
+
 class Build(object):
     """Holds information about an OpenELEC build and defines how to compare them,
        produce a unique hash for dictionary keys, and print them.
@@ -71,6 +191,10 @@ class Build(object):
     def date(self):
         return self._datetime.strftime(date_fmt)
 
+    @property
+    def datetime(self):
+        return self._datetime
+
     @property
     def version(self):
         return self._version
@@ -112,8 +236,7 @@ class Release(Build):
 
     @classmethod
     def get_tags_page_dict(cls, html):
-        soup = BeautifulSoup(html, 'html.parser',
-                             parse_only=SoupStrainer(cls.tag_match))
+        soup = _soup(html, _strainer(cls.tag_match))
         iter_contents = iter(soup.contents)
         return dict((unicode(iter_contents.next().string), tag['datetime'])
                     for tag in iter_contents)
@@ -122,18 +245,17 @@ class Release(Build):
     def maybe_get_tags(cls):
         if cls.tags is None:
             cls.tags = {}
-            html = requests.get("http://github.com/OpenELEC/OpenELEC.tv/releases").text
+            html = get_session().get("http://github.com/OpenELEC/OpenELEC.tv/releases").text
             while True:
                 cls.tags.update(cls.get_tags_page_dict(html))
-                soup = BeautifulSoup(html, 'html.parser',
-                                     parse_only=SoupStrainer(cls.pagination_match))
+                soup = _soup(html, _strainer(cls.pagination_match))
                 next_page_link = soup.find('a', text='Next')
                 if next_page_link:
                     href = next_page_link['href']
                     version = [int(p) for p in href.split('=')[-1].split('.')]
                     if version < cls.MIN_VERSION:
                         break
-                    html = requests.get(href).text
+                    html = get_session().get(href).text
                 else:
                     break
 
@@ -143,6 +265,12 @@ class Release(Build):
 
 class BuildLinkBase(object):
     """Base class for links to builds"""
+    # The host the build was downloaded from and whether it was a peer,
+    # which are set by remote_file.
+    mirror = None
+    from_peer = False
+    resumed = False
+
     def __init__(self, baseurl, link):
         # Set the absolute URL
         link = link.strip()
@@ -159,23 +287,109 @@ class BuildLinkBase(object):
                                             None, None, None))
             self.url = link
 
-    def remote_file(self):
-        response = requests.get(self.url, stream=True, timeout=timeout,
-                                headers={'Accept-Encoding': None})
+    @property
+    def archive_name(self):
+        """The name of the decompressed tar file as it is stored in the archive."""
+        name = unquote(os.path.basename(urlparse.urlparse(self.url).path))
+        return name[:-len('.bz2')] if name.endswith('.bz2') else name
+
+    def remote_file(self, offset=0):
+        """Return a file object for the build. If offset is given the download
+           resumes from it if the server supports it, which sets resumed.
+        """
+        headers = {'Accept-Encoding': None}
+        if offset:
+            headers['Range'] = "bytes={}-".format(offset)
+        response = get_session().get(self.url, stream=True, timeout=get_timeout(),
+                                     headers=headers)
+        if offset:
+            response.raise_for_status()
+        self.resumed = response.status_code == 206
         try:
             self.size = int(response.headers['Content-Length'])
         except KeyError:
             self.size = 0
+        if self.resumed:
+            self.size += offset
 
         # Get the actual filename
         self.filename = unquote(os.path.basename(urlparse.urlparse(response.url).path))
+        self.mirror = urlparse.urlparse(response.url).netloc
+        self.from_peer = False
 
         name, ext = os.path.splitext(self.filename)
         self.tar_name = self.filename if ext == '.tar' else name
         self.compressed = ext == '.bz2'
 
+        if peer_finder is not None and not offset:
+            peer_file = self._peer_file()
+            if peer_file is not None:
+                response.close()
+                return peer_file
+
+        return response.raw
+
+    def _peer_file(self):
+        """Return the decompressed tar file from a peer on the local network,
+           or None to download it from the source. As any host on the network
+           can answer, a peer is only used if the source gives a checksum of
+           the tar file which the copy is checked against.
+        """
+        import requests
+
+        if self.tar_checksum() is None:
+            return None
+        peer = peer_finder(self.tar_name, self.tar_size())
+        if peer is None:
+            return None
+        url, size = peer
+        log.log("Downloading {} from peer {}".format(self.tar_name, url))
+        try:
+            response = get_session().get(url, stream=True, timeout=get_timeout())
+            response.raise_for_status()
+        except requests.RequestException as e:
+            log.log("Unable to download from peer {}: {}".format(url, e))
+            return None
+        self.size = size
+        self.filename = self.tar_name
+        self.compressed = False
+        self.mirror = urlparse.urlparse(url).netloc
+        self.from_peer = True
         return response.raw
 
+    def checksum(self):
+        """Return the (algorithm, digest) from a checksum file next to the build
+           on the server, or None if there is none.
+        """
+        import requests
+
+        for algorithm in checksums.ALGORITHMS:
+            url = "{}.{}".format(self.url, algorithm)
+            try:
+                response = get_session().get(url, timeout=get_timeout())
+            except requests.RequestException as e:
+                log.log("Unable to get {}: {}".format(url, e))
+                continue
+            if response.status_code == 200:
+                digest = checksums.parse(response.text, algorithm)
+                if digest is not None:
+                    log.log("{} = {}".format(url, digest))
+                    return algorithm, digest
+        return None
+
+    def tar_checksum(self):
+        """Return the (algorithm, digest) of the decompressed tar file from a
+           trusted source, used to check a tar file from a peer, or None if
+           it is not known.
+        """
+        return None
+
+    def tar_size(self):
+        """Return the size of the decompressed tar file from a trusted source,
+           or None if it is not known.
+        """
+        return None
+
 
 class BuildLink(Build, BuildLinkBase):
     """Holds information about a link to an OpenELEC build."""
@@ -191,6 +405,96 @@ class ReleaseLink(Release, BuildLinkBase):
         Release.__init__(self, release)
 
 
+class ArchiveBuildLinkBase(BuildLinkBase):
+    """Base class for links to decompressed build tar files in a local or
+       network directory. The size and checksums, if the file was hashed
+       when it was stored, are known in advance from the manifest.
+    """
+    def __init__(self, path, size, digests=None):
+        self.url = path
+        self.size = size
+        self.filename = self.tar_name = os.path.basename(path)
+        self.compressed = False
+        self._digests = digests or {}
+
+    @property
+    def archive_name(self):
+        return self.filename
+
+    def remote_file(self, offset=0):
+        f = funcs.vfs_open(self.url)
+        if offset:
+            f.seek(offset)
+            self.resumed = True
+        return f
+
+    def checksum(self):
+        return checksums.preferred(self._digests)
+
+
+class ArchiveBuildLink(Build, ArchiveBuildLinkBase):
+    def __init__(self, path, size, _datetime, version, digests=None):
+        ArchiveBuildLinkBase.__init__(self, path, size, digests)
+        Build.__init__(self, _datetime, version)
+
+
+class ArchiveReleaseLink(Release, ArchiveBuildLinkBase):
+    """Link to an archived release. The date comes from the manifest so that
+       the release tags are not needed.
+    """
+    def __init__(self, path, size, _datetime, release, digests=None):
+        ArchiveBuildLinkBase.__init__(self, path, size, digests)
+        Build.__init__(self, _datetime, release)
+        self.release_str = release
+        self.release = [int(p) for p in release.split('.')]
+        self._has_date = True
+
+
+class ManifestBuildLinkBase(BuildLinkBase):
+    """Base class for links to builds listed in the manifest of a source, which
+       gives the size and checksums of the file without further requests.
+       The checksums of the decompressed tar file are also given for a
+       compressed file if the manifest has them.
+    """
+    def __init__(self, baseurl, entry):
+        BuildLinkBase.__init__(self, baseurl, quote(entry['filename']))
+        self.size = entry['size']
+        self._checksums = entry.get('checksums') or {}
+        if entry['filename'].endswith('.tar'):
+            self._tar_checksums = self._checksums
+            self._tar_size = self.size
+        else:
+            self._tar_checksums = entry.get('tar_checksums') or {}
+            self._tar_size = entry.get('tar_size')
+
+    def checksum(self):
+        return checksums.preferred(self._checksums)
+
+    def tar_checksum(self):
+        return checksums.preferred(self._tar_checksums)
+
+    def tar_size(self):
+        return self._tar_size
+
+
+class ManifestBuildLink(Build, ManifestBuildLinkBase):
+    def __init__(self, baseurl, entry, _datetime):
+        ManifestBuildLinkBase.__init__(self, baseurl, entry)
+        Build.__init__(self, _datetime, entry['version'])
+
+
+class ManifestReleaseLink(Release, ManifestBuildLinkBase):
+    """Link to a release listed in a manifest, which has the date so that the
+       release tags are not needed.
+    """
+    def __init__(self, baseurl, entry, _datetime):
+        ManifestBuildLinkBase.__init__(self, baseurl, entry)
+        Build.__init__(self, _datetime, entry['version'])
+        self.release_str = entry['version']
+        self.release = [int(p) for p in entry['version'].split('.')]
+        self._has_date = True
+
+
 class BaseExtractor(object):
     """Base class for all extractors."""
     url = None
@@ -199,16 +503,66 @@ class BaseExtractor(object):
         if url is not None:
             self.url = url
 
-    def _response(self):
-        response = requests.get(self.url, timeout=timeout)
+    @property
+    def metrics_url(self):
+        """The URL which the metrics of the requests are recorded under."""
+        return self.url
+
+    def _response(self, stream=False, headers=None):
+        import requests
+
+        if not health.allow_request(self.url, get_timeout()):
+            msg = "{} is unavailable".format(health.host(self.url))
+            metrics.record_error(self.metrics_url, msg)
+            raise HostUnavailableError(msg)
+
+        start = time.time()
+        try:
+            response = get_session().get(self.url, stream=stream, timeout=get_timeout(),
+                                         headers=headers)
+        except requests.RequestException as e:
+            health.record_failure(self.url)
+            metrics.record_error(self.metrics_url, e)
+            raise
+        if response.status_code >= 500:
+            health.record_failure(self.url)
+        else:
+            health.record_success(self.url, time.time() - start)
+
         if not response:
             msg = "Build URL error: status {}".format(response.status_code)
+            metrics.record_error(self.metrics_url, msg)
             raise BuildURLError(msg)
+
+        if not stream:
+            # The body has been downloaded already.
+            metrics.record_fetch(self.metrics_url, time.time() - start,
+                                 len(response.content))
         return response
 
     def _text(self):
         return self._response().text
 
+    def _find_divs(self, match, limit, chunk_size=16384):
+        """Return soups of the first limit divs of the page for which
+           match(attrs) is True, reading no further than the last of them.
+        """
+        start = time.time()
+        response = self._response(stream=True)
+        decoder = codecs.getincrementaldecoder(response.encoding or 'utf-8')('replace')
+        parser = _DivParser(match, limit)
+        size = 0
+        try:
+            for chunk in response.iter_content(chunk_size):
+                size += len(chunk)
+                parser.feed(decoder.decode(chunk))
+                if parser.done:
+                    break
+        finally:
+            response.close()
+        metrics.record_fetch(self.metrics_url, time.time() - start, size)
+        return [_soup(div).div for div in parser.divs]
+
     def _json(self):
         return self._response().json()
 
@@ -228,15 +582,18 @@ class BuildLinkExtractor(BaseExtractor):
         if self.CSS_CLASS is not None:
             args.append(self.CSS_CLASS)
 
-        self.build_re = re.compile(self.BUILD_RE.format(arch=arch))
+        self.build_re = re.compile(self.BUILD_RE.format(arch=get_arch()))
 
-        soup = BeautifulSoup(html, 'html.parser',
-                             parse_only=SoupStrainer(*args, href=self.build_re))
+        start = time.time()
+        soup = _soup(html, _strainer(*args, href=self.build_re))
 
+        count = 0
         for link in soup.contents:
             l = self._create_link(link)
             if l:
+                count += 1
                 yield l
+        metrics.record_parse(self.url, time.time() - start, count)
 
     def _create_link(self, link):
         href = link['href']
@@ -274,6 +631,260 @@ class MilhouseBuildLinkExtractor(BuildLinkExtractor):
                 "Milhouse-(\d+)-(?:r|%23)(\d+[a-z]*)-g[0-9a-z]+\.tar(|\.bz2)")
 
 
+class ArchiveBuildLinkExtractor(BaseExtractor):
+    """Class for listing the builds in a local or network directory, such as the
+       archive or a USB stick, without using the network.
+
+       The builds in each directory are listed in a manifest file which is
+       stored in the directory. Only files which are not yet in the manifest
+       are examined, so a listing needs just one directory read. If subdirs
+       is True the subdirectories are also listed, e.g. for the archive root.
+    """
+    MANIFEST_NAME = "manifest.json"
+    DATE_FMT = '%Y-%m-%dT%H:%M:%S'
+    NAME_RES = [(re.compile(regex), release) for regex, release in (
+        (r"OpenELEC-(?P<arch>[^-]+)-(?:\d+\.\d+-|)Milhouse-(?P<date>\d{14})"
+         r"-(?:r|#|%23)(?P<version>\d+[a-z]*)-g[0-9a-z]+\.tar(?:\.bz2|)$", False),
+        (r"OpenELEC-(?P<arch>[^-]+)-(?:\d+\.\d+-|)[a-zA-Z]+-(?P<date>\d{14})"
+         r"-r\d+[a-z]*-g(?P<version>[0-9a-z]+)\.tar(?:\.bz2|)$", False),
+        (r"OpenELEC-(?P<arch>[^-]+?)(?:\.DA|)-(?P<version>[\d\.]+)\.tar(?:\.bz2|)$", True))]
+
+    # Serialises the updates of manifests by threads of this process.
+    _manifest_lock = threading.Lock()
+
+    def __init__(self, url=None, subdirs=False):
+        super(ArchiveBuildLinkExtractor, self).__init__(url)
+        self.subdirs = subdirs
+
+    def __iter__(self):
+        directories = [self.url]
+        if self.subdirs:
+            directories.extend(os.path.join(self.url, d)
+                               for d in funcs.vfs_listdir(self.url)[0])
+
+        start = time.time()
+        filenames = set()
+        for directory in directories:
+            for entry in self.entries(directory):
+                if entry['arch'] == get_arch() and entry['filename'] not in filenames:
+                    filenames.add(entry['filename'])
+                    yield self._create_link(directory, entry)
+        metrics.record_parse(self.url, time.time() - start, len(filenames))
+
+    def _create_link(self, directory, entry):
+        path = os.path.join(directory, entry['filename'])
+        _datetime = datetime.strptime(entry['date'], self.DATE_FMT)
+        link_class = ArchiveReleaseLink if entry['release'] else ArchiveBuildLink
+        return link_class(path, entry['size'], _datetime, entry['version'],
+                          entry.get('checksums'))
+
+    @classmethod
+    def entries(cls, directory):
+        """Return a list of the manifest entries for the build tar files in the
+           directory, updating the manifest if files were added or removed.
+        """
+        manifest_path = os.path.join(directory, cls.MANIFEST_NAME)
+        with cls._manifest_lock:
+            manifest = funcs.vfs_read_json_file(manifest_path, {})
+            old_entries = dict((entry['filename'], entry)
+                               for entry in manifest.get('builds', []))
+
+            entries = {}
+            for filename in funcs.vfs_listdir(directory)[1]:
+                if filename in old_entries:
+                    entries[filename] = old_entries[filename]
+                elif filename.endswith('.tar'):
+                    entry = cls.parse_filename(directory, filename)
+                    if entry is not None:
+                        entries[filename] = entry
+
+            if entries != old_entries:
+                manifest['builds'] = sorted(entries.values(), key=lambda e: e['filename'])
+                funcs.vfs_write_json_file(manifest_path, manifest)
+        return entries.values()
+
+    @classmethod
+    def parse_filename(cls, directory, filename):
+        """Return the manifest entry for the build file in the directory, or None
+           if the file name is not that of a build.
+        """
+        for regex, release in cls.NAME_RES:
+            m = regex.match(filename)
+            if m:
+                break
+        else:
+            return None
+
+        size, mtime = funcs.vfs_stat(os.path.join(directory, filename))
+        groups = m.groupdict()
+        if 'date' in groups:
+            date = datetime.strptime(groups['date'], Build.DATETIME_FMT)
+        else:
+            # The release date is not in the file name.
+            date = datetime.fromtimestamp(mtime)
+        return cls.make_entry(filename, groups['arch'], groups['version'], release,
+                              date, size)
+
+    @classmethod
+    def make_entry(cls, filename, arch, version, release, date, size, checksums=None):
+        return {'filename': filename,
+                'arch': arch,
+                'version': version,
+                'release': release,
+                'date': date.strftime(cls.DATE_FMT),
+                'size': size,
+                'checksums': checksums or {}}
+
+    @classmethod
+    def add_build(cls, directory, filename, build, size, checksum=None):
+        """Add or replace the manifest entry for a build which has been copied to
+           the directory, keeping the build date and version of the source.
+           checksum is the (algorithm, digest) of the file if it was hashed.
+        """
+        manifest_path = os.path.join(directory, cls.MANIFEST_NAME)
+        with cls._manifest_lock:
+            manifest = funcs.vfs_read_json_file(manifest_path, {})
+            entries = [entry for entry in manifest.get('builds', [])
+                       if entry['filename'] != filename]
+            entries.append(cls.make_entry(filename, get_arch(), build.version,
+                                          isinstance(build, Release), build.datetime, size,
+                                          dict([checksum]) if checksum else None))
+            manifest['builds'] = sorted(entries, key=lambda e: e['filename'])
+            funcs.vfs_write_json_file(manifest_path, manifest)
+
+    @classmethod
+    def archived_names(cls, directory):
+        """Return the set of build tar file names in the directory. Only the
+           directory is listed, so the manifest is not updated.
+        """
+        try:
+            return set(filename for filename in funcs.vfs_listdir(directory)[1]
+                       if filename.endswith('.tar'))
+        except (IOError, OSError) as e:
+            log.log("Unable to list archived builds in {}: {}".format(directory, e))
+            return set()
+
+    @classmethod
+    def archived_checksum(cls, path):
+        """Return the (algorithm, digest) recorded in the manifest for the
+           archived tar file at path, or None if it has none.
+        """
+        directory, filename = os.path.split(path)
+        manifest = funcs.vfs_read_json_file(os.path.join(directory, cls.MANIFEST_NAME), {})
+        for entry in manifest.get('builds', []):
+            if entry['filename'] == filename:
+                return checksums.preferred(entry.get('checksums') or {})
+        return None
+
+
+class ManifestBuildLinkExtractor(BaseExtractor):
+    """Class for listing the builds of a source from a manifest published next
+       to the builds, in the same format as the manifests of the archive, so
+       that the builds are listed with one small request instead of parsing
+       the HTML listing. The manifest of a mirror is written by manifest.py.
+
+       The manifests are kept in a persistent cache and revalidated with a
+       conditional GET. That a source has no manifest is also cached, for
+       MISSING_SECONDS, so that the HTML listing is used without asking again.
+    """
+    CACHE_FILE = os.path.join(funcs.CACHE_DIR, 'manifests.json')
+    MISSING_SECONDS = 24 * 60 * 60
+
+    # Serialises the updates of the cache file by threads of this process.
+    _lock = threading.Lock()
+
+    def __init__(self, source_url):
+        if not source_url.endswith('/'):
+            source_url += '/'
+        super(ManifestBuildLinkExtractor, self).__init__(
+            urlparse.urljoin(source_url, ArchiveBuildLinkExtractor.MANIFEST_NAME))
+        self.source_url = source_url
+        # The cache entry of the manifest, kept so that a shared extractor
+        # reads the cache file only once.
+        self._cached = None
+
+    def builds(self):
+        """Return the links to the builds in the manifest of the source, or None
+           if the source does not publish a manifest.
+        """
+        manifest = self._manifest()
+        if manifest is None:
+            return None
+
+        start = time.time()
+        links = []
+        for entry in manifest['builds']:
+            try:
+                if entry['arch'] == get_arch():
+                    links.append(self._create_link(entry))
+            except (KeyError, ValueError, TypeError, AttributeError) as e:
+                # Skip an entry which is incomplete or malformed.
+                log.log("Invalid entry {} in {}: {}".format(entry, self.url, e))
+        metrics.record_parse(self.url, time.time() - start, len(links))
+        return links
+
+    def _create_link(self, entry):
+        _datetime = datetime.strptime(entry['date'], ArchiveBuildLinkExtractor.DATE_FMT)
+        link_class = ManifestReleaseLink if entry['release'] else ManifestBuildLink
+        return link_class(self.source_url, entry, _datetime)
+
+    def _manifest(self):
+        import requests
+
+        with self._lock:
+            if self._cached is None:
+                self._cached = funcs.read_json_file(self.CACHE_FILE, {}).get(self.url, {})
+            cached = self._cached
+        if cached.get('missing_until', 0) > time.time():
+            return None
+
+        headers = {}
+        if 'etag' in cached:
+            headers['If-None-Match'] = cached['etag']
+        if 'last_modified' in cached:
+            headers['If-Modified-Since'] = cached['last_modified']
+
+        try:
+            response = self._response(headers=headers)
+            if response.status_code == 304:
+                log.log("Manifest {} is up to date".format(self.url))
+                return cached['manifest']
+            manifest = response.json()
+            if not isinstance(manifest, dict) or not isinstance(manifest.get('builds'), list):
+                raise ValueError("not a manifest")
+        except HostUnavailableError:
+            if 'manifest' not in cached:
+                raise
+            # Fail fast with the builds from the last time.
+            log.log("Using the cached manifest {}".format(self.url))
+            return cached['manifest']
+        except requests.Timeout as e:
+            # The manifest is optional so a slow one does not fail the listing,
+            # but it is asked for again next time.
+            log.log("Timed out getting {}: {}".format(self.url, e))
+            return None
+        except (BuildURLError, ValueError, KeyError) as e:
+            log.log("No manifest at {}: {}".format(self.url, e))
+            metrics.record_error(self.url, e)
+            self._update_cache({'missing_until': time.time() + self.MISSING_SECONDS})
+            return None
+
+        cached = {'manifest': manifest}
+        if 'ETag' in response.headers:
+            cached['etag'] = response.headers['ETag']
+        if 'Last-Modified' in response.headers:
+            cached['last_modified'] = response.headers['Last-Modified']
+        self._update_cache(cached)
+        return manifest
+
+    def _update_cache(self, cached):
+        with self._lock:
+            self._cached = cached
+            cache = funcs.read_json_file(self.CACHE_FILE, {})
+            cache[self.url] = cached
+            funcs.write_json_file(self.CACHE_FILE, cache)
+
+
 class BuildInfo(object):
     """Class to hold the short summary of a build and the full details."""
     def __init__(self, summary, details=None):
@@ -294,12 +905,21 @@ class MilhouseBuildDetailsExtractor(BuildDetailsExtractor):
     """Class for extracting the full build details for a Milhouse build.
        from the release post on the Kodi forum.
     """
+    # The highlights and details are lists, converted to "- " or "1. " items.
+    ITEM_RE = re.compile(r"^\s*(?:-|\d+\.)\s", re.MULTILINE)
+
+    @property
+    def metrics_url(self):
+        # One entry for the posts of all builds.
+        return urlparse.urljoin(self.url, urlparse.urlparse(self.url).path)
+
     def get_text(self):
-        soup = BeautifulSoup(self._text(), 'html.parser')
         pid = urlparse.parse_qs(urlparse.urlparse(self.url).query)['pid'][0]
         post_div_id = "pid_{}".format(pid)
-        post = soup.find('div', 'post-body', id=post_div_id)
+        post = self._find_divs(lambda attrs: _post_body_match(attrs, post_div_id), 1)[0]
 
+        start = time.time()
+        import html2text
         text_maker = html2text.HTML2Text()
         text_maker.ignore_links = True
         text_maker.ul_item_mark = '-'
@@ -309,6 +929,8 @@ class MilhouseBuildDetailsExtractor(BuildDetailsExtractor):
         text = re.search(r"(Build Highlights:.*)", text, re.DOTALL).group(1)
         text = re.sub(r"(Build Highlights:)", r"[B]\1[/B]", text)
         text = re.sub(r"(Build Details:)", r"[B]\1[/B]", text)
+        metrics.record_parse(self.metrics_url, time.time() - start,
+                             len(self.ITEM_RE.findall(text)))
 
         return text
 
@@ -326,8 +948,10 @@ class MilhouseBuildInfoExtractor(BuildInfoExtractor):
     URL_FMT = "http://forum.kodi.tv/showthread.php?tid={}"
     R = re.compile("#(\d{4}[a-z]?).*?\((.+)\)")
 
-    def _get_info(self, soup):
-        for post in soup.find_all('div', 'post-body', limit=3):
+    POSTS = 3
+
+    def _get_info(self, posts):
+        for post in posts:
             for ul in post('ul'):
                 for li in ul('li'):
                     m = self.R.match(li.get_text())
@@ -337,8 +961,11 @@ class MilhouseBuildInfoExtractor(BuildInfoExtractor):
                                                     MilhouseBuildDetailsExtractor(url))
 
     def get_info(self):
-        soup = BeautifulSoup(self._text(), 'html.parser')
-        return dict(self._get_info(soup))
+        posts = self._find_divs(_post_body_match, self.POSTS)
+        start = time.time()
+        info = dict(self._get_info(posts))
+        metrics.record_parse(self.url, time.time() - start, len(info))
+        return info
 
     @classmethod
     def from_thread_id(cls, thread_id):
@@ -348,7 +975,7 @@ class MilhouseBuildInfoExtractor(BuildInfoExtractor):
 
 
 def get_milhouse_build_info_extractors():
-    if arch.startswith("RPi"):
+    if get_arch().startswith("RPi"):
         threads = (224025, 231092, 250817)
     else:
         threads = (238393,)
@@ -359,13 +986,135 @@ def get_milhouse_build_info_extractors():
 
 class CommitInfoExtractor(BuildInfoExtractor):
     """Class used by development build sources for extracting the git commit messages
-       for a commit hash as the summary. Full build details are set to None."""
-    url = "https://api.github.com/repositories/1093060/commits?per_page=100"
+       for a commit hash as the summary. Full build details are set to None.
+
+       The commit summaries are kept in a persistent cache which is extended with
+       only the new commits on each call and revalidated using the ETag.
+       GitHub requests are skipped while the rate limit is nearly exhausted.
+    """
+    url = "https://api.github.com/repositories/1093060/commits"
+    CACHE_FILE = os.path.join(funcs.CACHE_DIR, 'commits.json')
+    PER_PAGE = 100
+    MAX_PAGES = 5
+    MAX_COMMITS = 2000
+    RATE_LIMIT_RESERVE = 5
+
+    # Shared by all instances so that sources using the same repository
+    # only cause one update per process.
+    _commits = None
+    _lock = threading.Lock()
 
     def get_info(self):
-        return dict((commit['sha'][:7],
-                     BuildInfo(commit['commit']['message'].split('\n\n')[0], None))
-                     for commit in self._json())
+        import requests
+
+        with self._lock:
+            if CommitInfoExtractor._commits is None:
+                cache = funcs.read_json_file(self.CACHE_FILE, {})
+                cache.setdefault('commits', {})
+                try:
+                    self._update_cache(cache)
+                except (requests.RequestException, BuildURLError, ValueError) as e:
+                    metrics.record_error(self.url, e)
+                    if not cache['commits']:
+                        raise
+                    log.log("Using cached commits: {}".format(e))
+                finally:
+                    funcs.write_json_file(self.CACHE_FILE, cache)
+                CommitInfoExtractor._commits = cache['commits']
+            commits = CommitInfoExtractor._commits
+
+        start = time.time()
+        info = dict((sha, BuildInfo(summary, None))
+                    for sha, summary in commits.iteritems())
+        metrics.record_parse(self.url, time.time() - start, len(info))
+        return info
+
+    def _update_cache(self, cache):
+        if cache['commits']:
+            # Fetch only the commits since the newest cached commit.
+            params = {'since': cache['newest']}
+        else:
+            params = {}
+        self._fetch_pages(cache, params, revalidate=True)
+
+        if (cache['commits'] and not cache.get('complete') and
+                len(cache['commits']) < self.MAX_COMMITS and
+                self._rate_limit_ok(cache, reserve=self.RATE_LIMIT_RESERVE * 2)):
+            # Extend the cache back in time by one page per update.
+            count = self._fetch_pages(cache, {'until': cache['oldest']}, max_pages=1)
+            cache['complete'] = count < self.PER_PAGE
+
+    def _fetch_pages(self, cache, params, revalidate=False, max_pages=MAX_PAGES):
+        headers = {'Accept': "application/vnd.github.v3+json"}
+        if github_token:
+            headers['Authorization'] = "token {}".format(github_token)
+
+        params = dict(params, per_page=self.PER_PAGE)
+        if revalidate and 'etag' in cache and params == cache.get('etag_params'):
+            headers['If-None-Match'] = cache['etag']
+
+        url = self.url
+        count = 0
+        start = time.time()
+        size = None
+        for page in range(max_pages):
+            if not self._rate_limit_ok(cache):
+                log.log("GitHub rate limit reached until {}"
+                        .format(time.ctime(cache['rate_reset'])))
+                break
+
+            response = get_session().get(url, params=params, headers=headers,
+                                         timeout=get_timeout())
+            size = (size or 0) + len(response.content)
+            self._update_rate_limit(cache, response.headers)
+
+            if response.status_code == 304:
+                log.log("Commit cache is up to date")
+                break
+            elif not response:
+                msg = "Build URL error: status {}".format(response.status_code)
+                raise BuildURLError(msg)
+
+            if revalidate and page == 0 and 'ETag' in response.headers:
+                cache['etag'] = response.headers['ETag']
+                cache['etag_params'] = params
+
+            commits = response.json()
+            self._add_commits(cache, commits)
+            count += len(commits)
+
+            try:
+                url = response.links['next']['url']
+            except KeyError:
+                break
+            # The next page URL already includes the query parameters.
+            params = None
+            headers.pop('If-None-Match', None)
+
+        if size is not None:
+            metrics.record_fetch(self.url, time.time() - start, size)
+        return count
+
+    @staticmethod
+    def _add_commits(cache, commits):
+        for commit in commits:
+            sha = commit['sha'][:7]
+            cache['commits'][sha] = commit['commit']['message'].split('\n\n')[0]
+            date = commit['commit']['committer']['date']
+            cache['newest'] = max(cache.get('newest', date), date)
+            cache['oldest'] = min(cache.get('oldest', date), date)
+
+    @staticmethod
+    def _update_rate_limit(cache, headers):
+        try:
+            cache['rate_remaining'] = int(headers['X-RateLimit-Remaining'])
+            cache['rate_reset'] = int(headers['X-RateLimit-Reset'])
+        except (KeyError, ValueError):
+            pass
+
+    def _rate_limit_ok(self, cache, reserve=RATE_LIMIT_RESERVE):
+        return (cache.get('rate_remaining', reserve + 1) > reserve or
+                cache.get('rate_reset', 0) < time.time())
 
 
 class BuildsURL(object):
@@ -378,9 +1127,20 @@ class BuildsURL(object):
 
         self._extractor = extractor
         self.info_extractors = info_extractors
+        self._manifest_extractor = ManifestBuildLinkExtractor(self.url)
 
     def builds(self):
-        return sorted(self._extractor(self.url), reverse=True)
+        """Return the builds of the source, newest first, from the manifest of
+           the source if it publishes one or else from its HTML listing.
+        """
+        links = self._manifest_extractor.builds()
+        if links is None:
+            links = self._extractor(self.url)
+        return sorted(links, reverse=True)
+
+    @property
+    def manifest_url(self):
+        return self._manifest_extractor.url
 
     def __iter__(self):
         return iter(self.builds())
@@ -413,15 +1173,29 @@ class MilhouseBuildsURL(BuildsURL):
     def __init__(self, subdir="master"):
         self.subdir = subdir
         super(MilhouseBuildsURL, self).__init__(
-            "http://milhouse.openelec.tv/builds/", os.path.join(subdir, arch.split('.')[0]),
+            "http://milhouse.openelec.tv/builds/", os.path.join(subdir, get_arch().split('.')[0]),
             MilhouseBuildLinkExtractor, list(get_milhouse_build_info_extractors()))
 
     def __repr__(self):
         return "{}('{}')".format(self.__class__.__name__, self.subdir)
 
 
-dual_audio_builds = BuildsURL("http://openelec-dualaudio.subcarrier.de/OpenELEC-DualAudio/",
-                              subdir=arch, extractor=DualAudioReleaseLinkExtractor)
+class ArchiveBuildsURL(BuildsURL):
+    """Source of builds in a local or network directory."""
+    def __init__(self, path, subdirs=False):
+        super(ArchiveBuildsURL, self).__init__(path)
+        self.subdirs = subdirs
+
+    def builds(self):
+        return sorted(ArchiveBuildLinkExtractor(self.url, self.subdirs), reverse=True)
+
+    def add_subdir(self, subdir):
+        self.url = os.path.join(self.url, subdir)
+
+
+def dual_audio_builds():
+    return BuildsURL("http://openelec-dualaudio.subcarrier.de/OpenELEC-DualAudio/",
+                     subdir=get_arch(), extractor=DualAudioReleaseLinkExtractor)
 
 
 def get_installed_build():
@@ -444,43 +1218,151 @@ def get_installed_build():
         return Release(version)
 
 
-def sources():
-    """Return an ordered dictionary of the sources as BuildsURL objects.
-       Only return sources which are relevant for the system.
-       The GUI will show the sources in the order defined here.
+ARCHIVE_SOURCE = "Archived Builds"
+
+
+def _source_factories():
+    """Return an ordered dictionary of the functions creating each source,
+       keyed on the source name. Only sources which are relevant for the
+       system are included. The GUI will show the sources in the order
+       defined here.
     """
-    _sources = OrderedDict()
+    factories = OrderedDict()
 
-    builds_url = BuildsURL("http://snapshots.openelec.tv",
-                           info_extractors=[CommitInfoExtractor()])
-    _sources["Official Snapshot Builds"] = builds_url
+    factories["Official Snapshot Builds"] = lambda: BuildsURL(
+        "http://snapshots.openelec.tv", info_extractors=[CommitInfoExtractor()])
 
-    _sources["Milhouse Builds"] = MilhouseBuildsURL()
+    factories["Milhouse Builds"] = MilhouseBuildsURL
 
     if openelec.debug_system_partition():
-        _sources["Milhouse Builds (debug)"] = MilhouseBuildsURL(subdir="debug")
+        factories["Milhouse Builds (debug)"] = lambda: MilhouseBuildsURL(subdir="debug")
+
+    if get_arch().startswith("RPi"):
+        factories["Chris Swan RPi Builds"] = lambda: BuildsURL(
+            "http://resources.pichimney.com/OpenELEC/dev_builds",
+            info_extractors=[CommitInfoExtractor()])
+
+    factories["Official Releases"] = lambda: BuildsURL(
+        "http://openelec.mirrors.uk2.net", extractor=OfficialReleaseLinkExtractor)
+    factories["Official Archive"] = lambda: BuildsURL(
+        "http://archive.openelec.tv", extractor=ReleaseLinkExtractor)
+
+    if archive_root is not None:
+        factories[ARCHIVE_SOURCE] = lambda: ArchiveBuildsURL(archive_root, subdirs=True)
+
+    return factories
+
+
+class SourceRegistry(object):
+    """The sources for one arch and archive root, each of which is created on
+       first access and then shared, along with its extractors, by all callers
+       in the process.
+    """
+    def __init__(self):
+        self._factories = _source_factories()
+        self._sources = {}
+
+    def names(self):
+        return self._factories.keys()
+
+    def get(self, name):
+        """Return the source called name or None if there is no such source."""
+        with _registry_lock:
+            try:
+                return self._sources[name]
+            except KeyError:
+                pass
+            try:
+                factory = self._factories[name]
+            except KeyError:
+                return None
+            source = self._sources[name] = factory()
+            return source
 
-    if arch.startswith("RPi"):
-        builds_url = BuildsURL("http://resources.pichimney.com/OpenELEC/dev_builds",
-                               info_extractors=[CommitInfoExtractor()])
-        _sources["Chris Swan RPi Builds"] = builds_url
 
-    _sources["Official Releases"] = BuildsURL("http://openelec.mirrors.uk2.net",
-                                              extractor=OfficialReleaseLinkExtractor)
-    _sources["Official Archive"] = BuildsURL("http://archive.openelec.tv",
-                                             extractor=ReleaseLinkExtractor)
+# The source registries keyed on the arch and archive root, which are the
+# settings the sources depend on.
+_registries = {}
+_registry_lock = threading.Lock()
 
-    return _sources
+
+def registry():
+    """Return the source registry for the current arch and archive root."""
+    key = (get_arch(), archive_root)
+    with _registry_lock:
+        try:
+            return _registries[key]
+        except KeyError:
+            pass
+    # Created outside the lock as it probes the system.
+    new_registry = SourceRegistry()
+    with _registry_lock:
+        return _registries.setdefault(key, new_registry)
+
+
+def get_source(name):
+    """Return the BuildsURL of the source called name or None if there is no
+       such source.
+    """
+    return registry().get(name)
+
+
+class SourceMapping(MutableMapping):
+    """Ordered mapping of source names to BuildsURL objects in which each
+       source of the registry is only created when it is looked up. Other
+       sources, e.g. the custom ones, can be added to it.
+    """
+    def __init__(self, _registry):
+        self._registry = _registry
+        self._names = list(_registry.names())
+        self._added = {}
+
+    def __getitem__(self, name):
+        if name in self._added:
+            return self._added[name]
+        if name not in self._names:
+            raise KeyError(name)
+        return self._registry.get(name)
+
+    def __setitem__(self, name, source):
+        if name not in self._names:
+            self._names.append(name)
+        self._added[name] = source
+
+    def __delitem__(self, name):
+        if name not in self._names:
+            raise KeyError(name)
+        self._names.remove(name)
+        self._added.pop(name, None)
+
+    def __contains__(self, name):
+        # Without creating the source.
+        return name in self._names
+
+    def __iter__(self):
+        return iter(self._names)
+
+    def __len__(self):
+        return len(self._names)
+
+
+def sources():
+    """Return an ordered mapping of the sources as BuildsURL objects.
+       Only return sources which are relevant for the system.
+
+       The mapping is new on each call so that callers can add their own
+       sources to it, but the sources in it are shared and only created
+       when they are looked up.
+    """
+    return SourceMapping(registry())
 
 
 def latest_build(source):
     """Return the most recent build for the provided source name or None if
        there is an error. This is used by the service to check for a new build.
     """
-    build_sources = sources()
-    try:
-        build_url = build_sources[source]
-    except KeyError:
+    build_url = get_source(source)
+    if build_url is None:
         return None
     else:
         return build_url.latest()
@@ -495,9 +1377,22 @@ def get_build_from_notify_file():
 
 
 def main():
-    """Test function to print all available builds when executing the module."""
+    """Test function to print all available builds when executing the module.
+       Pass --profile to profile the run.
+    """
     import sys
 
+    profile = '--profile' in sys.argv
+    if profile:
+        sys.argv.remove('--profile')
+
+    with timing.profiling('builds', profile):
+        _print_builds(sys.argv[1:])
+
+
+def _print_builds(args):
+    import requests
+
     installed_build = get_installed_build()
 
     def get_info(build_url):
@@ -529,8 +1424,8 @@ def main():
 
     urls = sources()
 
-    if len(sys.argv) > 1:
-        name = sys.argv[1]
+    if args:
+        name = args[0]
         if name not in urls:
             print '"{}" not in URL list'.format(name)
         else:
@@ -0,0 +1,112 @@
+''' Checksums of downloaded build files
+
+Build servers may publish a .sha256 or .md5 file next to a build. The
+download is hashed as it is transferred and the result is recorded in a
+.hash file next to the local file, along with the size and modification
+time of the file when it was hashed. A local file is only reused if its
+hash matches the one from the server or, if there is none, if it has a
+record from a completed download.
+'''
+
+import os
+import hashlib
+
+import funcs, log
+
+
+# Checksum files looked for on the server in order of preference.
+ALGORITHMS = ('sha256', 'md5')
+
+RECORD_EXT = '.hash'
+
+BLOCK_SIZE = 1048576
+
+
+def parse(text, algorithm):
+    """Return the hex digest from the contents of a checksum file, or None
+       if it does not start with one.
+    """
+    try:
+        digest = text.split()[0].lower()
+    except IndexError:
+        return None
+    if (len(digest) == hashlib.new(algorithm).digest_size * 2 and
+            all(c in '0123456789abcdef' for c in digest)):
+        return digest
+    return None
+
+
+def preferred(digests):
+    """Return the (algorithm, digest) for the most preferred algorithm in the
+       dictionary digests keyed on algorithm, or None if there is none.
+    """
+    for algorithm in ALGORITHMS:
+        if digests.get(algorithm):
+            return algorithm, digests[algorithm]
+    return None
+
+
+def new_hasher(checksum):
+    """Return a hash object for the algorithm of checksum, an (algorithm,
+       digest) tuple or None.
+    """
+    return hashlib.new(checksum[0] if checksum is not None else ALGORITHMS[0])
+
+
+def hash_file(path, algorithm):
+    hasher = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(BLOCK_SIZE), ''):
+            hasher.update(data)
+    return hasher.hexdigest()
+
+
+def _file_key(path):
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime': int(st.st_mtime)}
+
+
+def read_record(path):
+    """Return the recorded (algorithm, digest) of the file at path if it has
+       not changed since it was recorded, otherwise None.
+    """
+    record = funcs.read_json_file(path + RECORD_EXT)
+    try:
+        if record is not None and dict(record, **_file_key(path)) == record:
+            return record['algorithm'], record['digest']
+    except (OSError, KeyError):
+        pass
+    return None
+
+
+@log.with_logging(msg_error="Unable to record the hash of {}")
+def write_record(path, algorithm, digest):
+    record = _file_key(path)
+    record.update(algorithm=algorithm, digest=digest)
+    funcs.write_json_file(path + RECORD_EXT, record)
+
+
+def remove(path):
+    """Remove the file at path and its record."""
+    funcs.remove_file(path)
+    funcs.remove_file(path + RECORD_EXT)
+
+
+def is_reusable(path, size, checksum):
+    """Return True if the file at path is a complete copy of a download of
+       size bytes with checksum, an (algorithm, digest) tuple or None.
+    """
+    if not os.path.isfile(path) or os.path.getsize(path) != size:
+        return False
+
+    record = read_record(path)
+    if checksum is None:
+        return record is not None
+
+    algorithm, digest = checksum
+    if record is None or record[0] != algorithm:
+        # e.g. a file left by an interrupted run which was complete.
+        log.log("Hashing {}".format(path))
+        record = algorithm, hash_file(path, algorithm)
+        write_record(path, *record)
+    return record[1] == digest
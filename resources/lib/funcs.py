@@ -4,14 +4,23 @@ import os
 import sys
 import stat
 import glob
+import json
+import tempfile
 
 import log, openelec
 
+try:
+    import xbmcvfs
+except ImportError:
+    # Only local paths can be used outside Kodi.
+    xbmcvfs = None
+
 
 TEMP_DIR = os.path.expanduser('~')
 
 UPDATE_EXTLINUX_FILE = os.path.join(TEMP_DIR, '.update_extlinux')
 NOTIFY_FILE = os.path.join(TEMP_DIR, '.installed_build')
+CACHE_DIR = os.path.join(TEMP_DIR, '.cache', 'devupdate')
 
 STRFTIME_FMTS = [('YYYY', '%Y'),
                  ('YY', '%y'),
@@ -65,6 +74,100 @@ def read_notify_file():
         return None
 
 
+def read_json_file(path, default=None):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return default
+
+
+@log.with_logging(msg_error="Unable to write {}")
+def write_json_file(path, data):
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    # Write to a temporary file first so that a reader never sees a partial file.
+    # Its name is unique so that another process writing the file at the same
+    # time does not replace or remove it.
+    fd, temp_path = tempfile.mkstemp(prefix=os.path.basename(path), dir=directory)
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.rename(temp_path, path)
+    except:
+        os.remove(temp_path)
+        raise
+
+
+def vfs_listdir(path):
+    """Return the lists of (directories, files) in path, which can be any path
+       supported by Kodi when running in Kodi.
+    """
+    if xbmcvfs is not None:
+        return xbmcvfs.listdir(path if path.endswith('/') else path + '/')
+    try:
+        return next(os.walk(path))[1:]
+    except StopIteration:
+        return [], []
+
+
+def vfs_stat(path):
+    """Return the (size, mtime) of a file."""
+    if xbmcvfs is not None:
+        st = xbmcvfs.Stat(path)
+        return st.st_size(), st.st_mtime()
+    st = os.stat(path)
+    return st.st_size, st.st_mtime
+
+
+def vfs_open(path, mode='r'):
+    if xbmcvfs is not None:
+        return xbmcvfs.File(path, mode)
+    return open(path, mode + 'b')
+
+
+def vfs_rename(path, new_path):
+    """Rename a file, returning False if it failed, e.g. across filesystems."""
+    if xbmcvfs is not None:
+        return bool(xbmcvfs.rename(path, new_path))
+    try:
+        os.rename(path, new_path)
+    except OSError:
+        return False
+    return True
+
+
+def vfs_delete(path):
+    if xbmcvfs is not None:
+        return bool(xbmcvfs.delete(path))
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
+
+
+def vfs_read_json_file(path, default=None):
+    try:
+        f = vfs_open(path)
+        try:
+            return json.loads(f.read() or 'null') or default
+        finally:
+            f.close()
+    except (IOError, OSError, ValueError):
+        return default
+
+
+@log.with_logging(msg_error="Unable to write {}")
+def vfs_write_json_file(path, data):
+    f = vfs_open(path, 'w')
+    try:
+        f.write(json.dumps(data, indent=1, sort_keys=True))
+    finally:
+        f.close()
+
+
 def schedule_extlinux_update():
     create_empty_file(UPDATE_EXTLINUX_FILE)
 
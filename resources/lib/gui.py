@@ -1,9 +1,13 @@
+import os
+import bisect
 import threading
+from datetime import datetime
+from collections import namedtuple, defaultdict
 
 import xbmcgui
 import requests
 
-from . import addon, builds, utils, log, history, funcs
+from . import addon, builds, utils, log, history, funcs, timing, health, metrics, bisection
 from .addon import L10n
 
 
@@ -30,25 +34,110 @@ class InfoDialog(BaseInfoDialog):
 
 
 class HistoryDialog(BaseInfoDialog):
+    """Shows the install history, newest first. Further pages are loaded
+       when the selection gets near the end of the list.
+    """
+    LOAD_MARGIN = 10
+
     def __new__(cls, *args):
         return super(HistoryDialog, cls).__new__(
             cls, "script-devupdate-history.xml", addon.src_path)
 
-    def __init__(self, history):
-        self._history = history
+    def __init__(self):
+        self._last_install = None
+        self._complete = False
 
     def onInit(self):
-        if self._history is not None:
+        page = history.get_install_history_page()
+        if page is not None:
             self.getControl(1).setLabel(L10n(32031))
-            install_list = self.getControl(2)
-            for install in reversed(self._history):
-                li = xbmcgui.ListItem()
-                for attr in ('source', 'version'):
-                    li.setProperty(attr, str(getattr(install, attr)))
-                li.setProperty('timestamp', install.timestamp.strftime("%Y-%m-%d %H:%M"))
-                install_list.addItem(li)
+            self._install_list = self.getControl(2)
+            self._add_page(page)
         else:
             self.getControl(1).setLabel(L10n(32032))
+            self._complete = True
+
+    def onAction(self, action):
+        if (action.getId() in (xbmcgui.ACTION_MOVE_DOWN, xbmcgui.ACTION_PAGE_DOWN)
+                and not self._complete
+                and (self._install_list.getSelectedPosition() >=
+                     self._install_list.size() - self.LOAD_MARGIN)):
+            self._add_page(history.get_install_history_page(self._last_install))
+        super(HistoryDialog, self).onAction(action)
+
+    def _add_page(self, page):
+        if not page:
+            self._complete = True
+            return
+        items = []
+        for install in page:
+            li = xbmcgui.ListItem()
+            for attr in ('source', 'version'):
+                li.setProperty(attr, str(getattr(install, attr)))
+            li.setProperty('timestamp', install.timestamp.strftime("%Y-%m-%d %H:%M"))
+            items.append(li)
+        self._install_list.addItems(items)
+        self._last_install = page[-1]
+        self._complete = len(page) < history.PAGE_SIZE
+
+
+# The contents of a row of the build list.
+_BuildRow = namedtuple('BuildRow', 'version date archived icon bisect')
+
+
+class BuildIndex(object):
+    """Index of a build list for filtering on the version and jumping to a date.
+
+       Positions are those of the builds in the list, which is newest first.
+       The index is built once per list so that each change of the filter
+       text only checks the candidates from the index, or the matches of the
+       previous text when the new text contains it, and a date is found by
+       bisecting the sorted build dates.
+    """
+    def __init__(self, build_links):
+        self._versions = [build.version.lower() for build in build_links]
+
+        # Positions of the versions containing each character and pair of characters.
+        self._ngrams = defaultdict(set)
+        for position, version in enumerate(self._versions):
+            for n in (1, 2):
+                for i in xrange(len(version) - n + 1):
+                    self._ngrams[version[i:i+n]].add(position)
+
+        self._datetimes = sorted((build.datetime, position)
+                                 for position, build in enumerate(build_links))
+
+        self._last_text = ""
+        self._last_matches = range(len(self._versions))
+
+    def filter(self, text):
+        """Return the positions of the versions which contain text in list order."""
+        text = text.strip().lower()
+        if not text:
+            matches = range(len(self._versions))
+        elif self._last_text and self._last_text in text:
+            # Narrow the previous matches.
+            matches = [p for p in self._last_matches if text in self._versions[p]]
+        else:
+            candidates = min((self._ngrams.get(text[i:i+2], ())
+                              for i in xrange(max(len(text) - 1, 1))), key=len)
+            matches = sorted(p for p in candidates if text in self._versions[p])
+
+        self._last_text = text
+        self._last_matches = matches
+        return matches
+
+    def jump(self, date, positions):
+        """Return the index in positions of the newest build on or before date,
+           or of the oldest build if they are all newer.
+        """
+        if not positions:
+            return None
+        i = bisect.bisect_right(self._datetimes, (date, len(self._versions)))
+        position = self._datetimes[max(i - 1, 0)][1]
+        # The list is newest first so if the build is filtered out the next
+        # one shown is older.
+        return min(bisect.bisect_left(positions, position), len(positions) - 1)
 
 
 class BuildSelectDialog(xbmcgui.WindowXMLDialog):
@@ -59,6 +148,8 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
     SETTINGS_BUTTON_ID = 30
     HISTORY_BUTTON_ID = 40
     CANCEL_BUTTON_ID = 50
+    FILTER_EDIT_ID = 60
+    JUMP_BUTTON_ID = 70
 
     def __new__(cls, *args):
         return super(BuildSelectDialog, cls).__new__(
@@ -67,6 +158,13 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
     def __init__(self, installed_build):
         self._installed_build = installed_build
 
+        # The versions marked good and bad for bisecting, keyed on source name.
+        self._bisect_marks = defaultdict(dict)
+        bisect = history.get_bisect()
+        if bisect is not None:
+            self._bisect_marks[bisect.source] = {bisection.GOOD: bisect.good,
+                                                 bisection.BAD: bisect.bad}
+
         self._sources = builds.sources()
         utils.add_custom_sources(self._sources)
 
@@ -77,6 +175,18 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
             self._build_url = self._sources.itervalues().next()
             self._initial_source = self._sources.iterkeys().next()
         self._builds = self._get_build_links(self._build_url)
+        self._rows = self._make_rows(self._builds, self._initial_source)
+
+        # Build links and rows of each source already shown, keyed on source name.
+        self._source_builds = {}
+
+        # All the builds of the selected source, of which the filtered ones are shown.
+        self._all_builds = []
+        self._all_rows = []
+        self._index = BuildIndex([])
+        self._positions = []
+        self._filter_text = ""
+        self._list_lock = threading.Lock()
 
         self._build_infos = {}
 
@@ -95,16 +205,21 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
 
         self._info_textbox = self.getControl(self.INFO_TEXTBOX_ID)
 
+        self._filter_edit = self.getControl(self.FILTER_EDIT_ID)
+        self._filter_edit.setLabel(L10n(32068))
+        self.getControl(self.JUMP_BUTTON_ID).setLabel(L10n(32069))
+
         if self._builds:
             self._selected_source_position = self._sources.keys().index(self._initial_source)
 
-            self._set_builds(self._builds)
+            rows, self._rows = self._rows, []
+            self._set_builds(self._builds, rows, self._initial_source)
         else:
             self._selected_source_position = 0
             self._initial_source = self._sources.iterkeys().next()
             self.setFocusId(self.SOURCE_LIST_ID)
 
-        self._selected_source = self._initial_source
+        self._selected_source = self._clicked_source = self._initial_source
 
         self._sources_list.selectItem(self._selected_source_position)
 
@@ -117,6 +232,7 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
 
         threading.Thread(target=self._get_and_set_build_info,
                          args=(self._build_url,)).start()
+        threading.Thread(target=self._probe_sources).start()
 
     @property
     def selected_build(self):
@@ -132,27 +248,33 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
             self.close()
         elif controlID == self.SOURCE_LIST_ID:
             self._build_url = self._get_build_url()
-            build_links = self._get_build_links(self._build_url)
-
-            if build_links:
-                self._selected_source_item.setLabel2('')
-                self._selected_source_item = self._sources_list.getSelectedItem()
-                self._selected_source_position = self._sources_list.getSelectedPosition()
-                self._selected_source_item.setLabel2('selected')
-                self._selected_source = self._selected_source_item.getLabel()
-
-                self._set_builds(build_links)
-
-                threading.Thread(target=self._get_and_set_build_info,
-                                 args=(self._build_url,)).start()
+            source = self._sources_list.getSelectedItem().getLabel()
+            position = self._sources_list.getSelectedPosition()
+            self._clicked_source = source
+            try:
+                # Show the builds from the last time straight away
+                # and update them in the background.
+                build_links, rows = self._source_builds[source]
+            except KeyError:
+                # Fetched and made into rows off the GUI thread.
+                threading.Thread(target=self._load_source,
+                                 args=(self._build_url, source, position)).start()
             else:
-                self._sources_list.selectItem(self._selected_source_position)
+                self._select_source(self._build_url, source, position, build_links, rows)
+                # A source whose host is down keeps its last builds.
+                if not health.is_open(self._build_url.url):
+                    threading.Thread(target=self._refresh_builds,
+                                     args=(self._build_url, source)).start()
         elif controlID == self.SETTINGS_BUTTON_ID:
             self.close()
             addon.open_settings()
         elif controlID == self.HISTORY_BUTTON_ID:
-            dialog = HistoryDialog(history.get_full_install_history())
+            dialog = HistoryDialog()
             dialog.doModal()
+        elif controlID == self.FILTER_EDIT_ID:
+            self._maybe_filter()
+        elif controlID == self.JUMP_BUTTON_ID:
+            self._jump_to_date()
         elif controlID == self.CANCEL_BUTTON_ID:
             if utils.remove_update_files():
                 utils.notify(L10n(32034))
@@ -166,6 +288,8 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
                          xbmcgui.ACTION_PAGE_DOWN, xbmcgui.ACTION_PAGE_UP,
                          xbmcgui.ACTION_MOUSE_MOVE):
             self._set_build_info()
+            if self.getFocusId() == self.SOURCE_LIST_ID:
+                self._set_source_info()
 
         elif action_id == xbmcgui.ACTION_SHOW_INFO:
             build_version = self._build_list.getSelectedItem().getLabel()
@@ -185,9 +309,17 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
                             dialog = InfoDialog(build, details)
                             dialog.doModal()
 
+        elif (action_id == xbmcgui.ACTION_CONTEXT_MENU and
+              self.getFocusId() == self.BUILD_LIST_ID):
+            self._mark_bisect_build()
+
         elif action_id in (xbmcgui.ACTION_PREVIOUS_MENU, xbmcgui.ACTION_NAV_BACK):
             self.close()
 
+        elif self.getFocusId() == self.FILTER_EDIT_ID:
+            # Narrow the list as each character is typed.
+            self._maybe_filter()
+
     def onFocus(self, controlID):
         if controlID != self.BUILD_LIST_ID:
             self._info_textbox.setText("")
@@ -197,25 +329,35 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
             self._builds_focused = True
             self._set_build_info()
         elif controlID == self.SOURCE_LIST_ID:
-            self._info_textbox.setText("[COLOR=white]{}[/COLOR]".format(L10n(32141)))
+            self._set_source_info()
         elif controlID == self.SETTINGS_BUTTON_ID:
             self._info_textbox.setText("[COLOR=white]{}[/COLOR]".format(L10n(32036)))
         elif controlID == self.HISTORY_BUTTON_ID:
             self._info_textbox.setText("[COLOR=white]{}[/COLOR]".format(L10n(32037)))
         elif controlID == self.CANCEL_BUTTON_ID:
             self._info_textbox.setText("[COLOR=white]{}[/COLOR]".format(L10n(32038)))
+        elif controlID == self.FILTER_EDIT_ID:
+            self._info_textbox.setText("[COLOR=white]{}[/COLOR]".format(L10n(32070)))
+        elif controlID == self.JUMP_BUTTON_ID:
+            self._info_textbox.setText("[COLOR=white]{}[/COLOR]".format(L10n(32071)))
 
     @utils.showbusy
     def _get_build_links(self, build_url):
         links = []
         try:
-            links = build_url.builds()
+            with timing.span('build_links', url=build_url.url) as span:
+                links = build_url.builds()
+                span.set(count=len(links))
+        except builds.HostUnavailableError as e:
+            utils.notify(L10n(32075).format(health.host(build_url.url)), error=True)
         except requests.ConnectionError as e:
             utils.connection_error(str(e))
         except builds.BuildURLError as e:
             utils.bad_url(build_url.url, str(e))
         except requests.RequestException as e:
             utils.url_error(build_url.url, str(e))
+        except (IOError, OSError) as e:
+            utils.bad_url(build_url.url, str(e))
         else:
             if not links:
                 utils.bad_url(build_url.url, L10n(32039).format(builds.arch))
@@ -224,11 +366,13 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
     def _get_build_infos(self, build_url):
         log.log("Retrieving build information")
         info = {}
-        for info_extractor in build_url.info_extractors:
-            try:
-                info.update(info_extractor.get_info())
-            except Exception as e:
-                log.log("Unable to retrieve build info: {}".format(str(e)))
+        with timing.span('build_info', url=build_url.url) as span:
+            for info_extractor in build_url.info_extractors:
+                try:
+                    info.update(info_extractor.get_info())
+                except Exception as e:
+                    log.log("Unable to retrieve build info: {}".format(str(e)))
+            span.set(count=len(info))
         return info
 
     def _set_build_info(self):
@@ -237,6 +381,7 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
             try:
                 build_version = selected_item.getLabel()
             except AttributeError:
+                info = ""
                 log.log("Unable to get selected build name")
             else:
                 try:
@@ -259,20 +404,279 @@ class BuildSelectDialog(xbmcgui.WindowXMLDialog):
         log.log("Full URL = " + build_url.url)
         return build_url
 
-    def _set_builds(self, builds):
-        self._builds = builds
-        self._build_list.reset()
-        for build in builds:
-            li = xbmcgui.ListItem()
-            li.setLabel(build.version)
-            li.setLabel2(build.date)
+    def _set_source_info(self):
+        """Show the metrics of the requests for the focused source."""
+        build_url = self._sources[self._sources_list.getSelectedItem().getLabel()]
+        lines = ["[COLOR=white]{}[/COLOR]".format(L10n(32141))]
+        parts = [(L10n(32076), build_url.url)]
+        # Read once for all the URLs of the source.
+        all_metrics = metrics.load()
+        manifest_metrics = all_metrics.get(build_url.manifest_url)
+        if manifest_metrics and not manifest_metrics.get('error'):
+            # A missing manifest is not worth showing as an error.
+            parts.append((L10n(32100), build_url.manifest_url))
+        parts.extend((L10n(32077), info_extractor.url)
+                     for info_extractor in build_url.info_extractors
+                     if info_extractor.url is not None)
+        for heading, url in parts:
+            source_metrics = all_metrics.get(url)
+            if not source_metrics:
+                continue
+            lines.append("")
+            lines.append("[B]{}[/B]".format(heading))
+            if 'fetched_at' in source_metrics:
+                lines.append(L10n(32078).format(funcs.size_fmt(source_metrics['bytes']),
+                                                source_metrics['fetch_seconds'],
+                                                int(metrics.age(source_metrics) // 60)))
+            if 'count' in source_metrics:
+                lines.append(L10n(32079).format(source_metrics['count'],
+                                                source_metrics['parse_seconds']))
+            if source_metrics.get('error'):
+                lines.append(L10n(32080).format(source_metrics['error']))
+        self._info_textbox.setText("\n".join(lines))
+
+    def _mark_unavailable_sources(self):
+        """Grey out the sources whose hosts have failed repeatedly."""
+        for position, build_url in enumerate(self._sources.itervalues()):
+            unavailable = L10n(32074) if health.is_tripped(build_url.url) else ""
+            self._sources_list.getListItem(position).setProperty('unavailable', unavailable)
+
+    def _probe_sources(self):
+        """Mark the unavailable sources and check whether they are back, in the
+           background as it creates all the sources.
+        """
+        self._mark_unavailable_sources()
+        for position, build_url in enumerate(self._sources.values()):
+            if health.is_tripped(build_url.url) and health.probe(build_url.url):
+                self._sources_list.getListItem(position).setProperty('unavailable', "")
+
+    def _archived_names(self, source):
+        """Return the names of the tar files from the source which are in the archive."""
+        if builds.archive_root is None:
+            return set()
+        archive_dir = os.path.join(builds.archive_root, source)
+        return builds.ArchiveBuildLinkExtractor.archived_names(archive_dir)
+
+    def _make_rows(self, build_links, source):
+        """Return the rows of the build list for build_links without calling Kodi,
+           so that the list control is only locked while the rows are added.
+        """
+        archived = self._archived_names(source)
+        marks = self._bisect_labels(source)
+        rows = []
+        for build in build_links:
             if build > self._installed_build:
                 icon = 'upgrade'
             elif build < self._installed_build:
                 icon = 'downgrade'
             else:
                 icon = 'installed'
-            li.setIconImage("{}.png".format(icon))
-            self._build_list.addItem(li)
+            # Archived builds are installed without downloading.
+            is_archived = (isinstance(build, builds.ArchiveBuildLinkBase) or
+                           build.archive_name in archived)
+            rows.append(_BuildRow(build.version, build.date, is_archived,
+                                  "{}.png".format(icon), marks.get(build.version, "")))
+        return rows
+
+    @staticmethod
+    def _make_item(row):
+        li = xbmcgui.ListItem(row.version, row.date, row.icon)
+        if row.archived:
+            li.setProperty('archived', L10n(32067))
+        if row.bisect:
+            li.setProperty('bisect', row.bisect)
+        return li
+
+    def _set_builds(self, build_links, rows, source):
+        with self._list_lock:
+            self._set_all_builds(build_links, rows)
+            self._source_builds[source] = (build_links, rows)
+            self._filter_text = ""
+            self._filter_edit.setText("")
+            self._show(range(len(rows)))
+            self._build_list.selectItem(0)
         self.setFocusId(self.BUILD_LIST_ID)
         self._builds_focused = True
+
+    def _apply_rows(self, rows):
+        """Change the build list from the current rows to rows.
+
+           Only the rows which differ are updated, new rows are added in one
+           batch and surplus rows are removed from the end, so refreshing an
+           unchanged source does not touch the list. The selection stays on
+           the same build if it is still in the list. If that would take more
+           calls than adding all the rows, e.g. when a filter leaves only a few
+           rows, the list is refilled instead.
+        """
+        old_rows = self._rows
+        changes = (sum(1 for old_row, row in zip(old_rows, rows) if row != old_row) +
+                   max(len(old_rows) - len(rows), 0))
+        if not old_rows or not rows or changes > len(rows):
+            self._build_list.reset()
+            self._build_list.addItems([self._make_item(row) for row in rows])
+            self._rows = rows
+            return
+
+        selected = old_rows[self._build_list.getSelectedPosition()].version
+
+        for position, (old_row, row) in enumerate(zip(old_rows, rows)):
+            if row != old_row:
+                li = self._build_list.getListItem(position)
+                li.setLabel(row.version)
+                li.setLabel2(row.date)
+                li.setIconImage(row.icon)
+                li.setProperty('archived', L10n(32067) if row.archived else "")
+                li.setProperty('bisect', row.bisect)
+
+        if len(rows) > len(old_rows):
+            self._build_list.addItems([self._make_item(row)
+                                       for row in rows[len(old_rows):]])
+        else:
+            for position in reversed(xrange(len(rows), len(old_rows))):
+                self._build_list.removeItem(position)
+
+        self._rows = rows
+        for position, row in enumerate(rows):
+            if row.version == selected:
+                self._build_list.selectItem(position)
+                break
+
+    def _load_source(self, build_url, source, position):
+        """Fetch the builds of a source which has not been shown yet and make
+           their rows, then show them if it is still the last source clicked.
+        """
+        build_links = self._get_build_links(build_url)
+        rows = self._make_rows(build_links, source)
+        if source != self._clicked_source:
+            if build_links:
+                with self._list_lock:
+                    self._source_builds[source] = (build_links, rows)
+        elif build_links:
+            self._select_source(build_url, source, position, build_links, rows)
+        else:
+            self._mark_unavailable_sources()
+            self._sources_list.selectItem(self._selected_source_position)
+
+    def _select_source(self, build_url, source, position, build_links, rows):
+        self._selected_source_item.setLabel2('')
+        self._selected_source_item = self._sources_list.getListItem(position)
+        self._selected_source_position = position
+        self._selected_source_item.setLabel2('selected')
+        self._selected_source = source
+
+        self._set_builds(build_links, rows, source)
+
+        threading.Thread(target=self._get_and_set_build_info,
+                         args=(build_url,)).start()
+
+    def _refresh_builds(self, build_url, source):
+        """Fetch the builds of source again and apply any changes to the list
+           if the source is still selected.
+        """
+        try:
+            build_links = build_url.builds()
+        except Exception as e:
+            log.log("Unable to refresh builds from {}: {}".format(build_url.url, e))
+            return
+        if not build_links:
+            return
+        rows = self._make_rows(build_links, source)
+
+        with self._list_lock:
+            self._source_builds[source] = (build_links, rows)
+            if source == self._selected_source and rows != self._all_rows:
+                log.log("Updating builds from {}".format(build_url.url))
+                self._set_all_builds(build_links, rows)
+                self._show(self._index.filter(self._filter_text))
+
+    def _set_all_builds(self, build_links, rows):
+        self._all_builds = build_links
+        self._all_rows = rows
+        self._index = BuildIndex(build_links)
+
+    def _show(self, positions):
+        """Show the builds at positions of the full list of the source."""
+        self._positions = positions
+        self._apply_rows([self._all_rows[p] for p in positions])
+        self._builds = [self._all_builds[p] for p in positions]
+
+    def _maybe_filter(self):
+        text = self._filter_edit.getText()
+        if text != self._filter_text:
+            with self._list_lock:
+                self._filter_text = text
+                self._show(self._index.filter(text))
+
+    def _bisect_labels(self, source):
+        """Return the labels of the builds of source marked for bisecting,
+           keyed on the version.
+        """
+        labels = {bisection.GOOD: L10n(32083), bisection.BAD: L10n(32084)}
+        return {version: labels[mark]
+                for mark, version in self._bisect_marks[source].iteritems()}
+
+    def _mark_bisect_build(self):
+        """Mark the selected build good or bad and offer to bisect the builds
+           between them once both are marked.
+        """
+        position = self._build_list.getSelectedPosition()
+        if position < 0:
+            return
+        build = self._builds[position]
+
+        marks = [(bisection.GOOD, L10n(32081)), (bisection.BAD, L10n(32082))]
+        index = xbmcgui.Dialog().select(build.version, [label for mark, label in marks])
+        if index < 0:
+            return
+        mark = marks[index][0]
+
+        source = self._selected_source
+        # Each mark is on one build and each build has one mark.
+        source_marks = {m: version for m, version in self._bisect_marks[source].iteritems()
+                        if m != mark and version != build.version}
+        source_marks[mark] = build.version
+        self._bisect_marks[source] = source_marks
+
+        labels = self._bisect_labels(source)
+        with self._list_lock:
+            rows = [row._replace(bisect=labels.get(row.version, "")) for row in self._all_rows]
+            self._all_rows = rows
+            self._source_builds[source] = (self._all_builds, rows)
+            self._show(self._positions)
+
+        if len(source_marks) == 2:
+            self._maybe_start_bisect(source, source_marks[bisection.GOOD],
+                                     source_marks[bisection.BAD])
+
+    def _maybe_start_bisect(self, source, good, bad):
+        candidates = bisection.between(self._all_builds, good, bad)
+        if not candidates:
+            utils.ok(L10n(32087), L10n(32092).format(good, bad))
+            return
+        if not utils.yesno(L10n(32087), L10n(32088).format(len(candidates), good, bad),
+                           L10n(32098).format(len(candidates),
+                                              bisection.steps_left(candidates))):
+            return
+
+        candidate = bisection.midpoint(candidates)
+        history.start_bisect(source, good, bad)
+        history.set_bisect_candidate(history.get_bisect(), candidate.version)
+        bisection.remove_prefetched()
+        log.log("Bisect candidate: {}".format(candidate))
+
+        self._selected_build = candidate
+        self.close()
+
+    def _jump_to_date(self):
+        date = xbmcgui.Dialog().numeric(1, L10n(32069))
+        try:
+            day, month, year = [int(part) for part in date.split('/')]
+            date = datetime(year, month, day, 23, 59, 59)
+        except ValueError:
+            return
+        with self._list_lock:
+            index = self._index.jump(date, self._positions)
+            if index is None:
+                return
+            self._build_list.selectItem(index)
+        self.setFocusId(self.BUILD_LIST_ID)
@@ -0,0 +1,201 @@
+''' Health of the hosts of the build sources
+
+The latency and consecutive failures of requests to each host are kept in
+a state file which is shared by the add-on processes. After FAILURE_LIMIT
+consecutive failures the circuit breaker of the host opens and requests to
+it fail immediately instead of waiting for the timeout. Once the breaker
+has been open for its retry delay it is half open: the first request, or
+background probe, from any process claims the probe slot and the others
+still fail until it finishes. If that succeeds the breaker closes,
+otherwise it stays open for twice as long, up to MAX_RETRY_DELAY.
+
+The state is read and written under a lock on LOCK_FILE so that the GUI
+and service processes do not overwrite each other's changes.
+
+    host           the network location of the source URL
+    failures       number of consecutive failed requests
+    latency        moving average of the request time in seconds, which is
+                   kept in memory and only written with the other fields
+    open_until     requests fail immediately before this time
+    retry_delay    seconds the breaker was last opened for
+    probing_until  other requests fail before this time while a probe,
+                   which ends by then, is in progress
+'''
+
+import os
+import time
+import fcntl
+import threading
+import urlparse
+from contextlib import contextmanager
+
+import funcs, log
+
+
+STATE_FILE = os.path.join(funcs.CACHE_DIR, 'host_health.json')
+LOCK_FILE = STATE_FILE + '.lock'
+
+FAILURE_LIMIT = 3
+
+RETRY_DELAY = 60
+MAX_RETRY_DELAY = 3600
+
+# Weight of the latest request in the average latency.
+LATENCY_WEIGHT = 0.3
+
+PROBE_TIMEOUT = 5
+
+# How long the probe slot is held if the request has no timeout, or if the
+# process holding it ends without recording the result.
+PROBE_SLOT = 60
+
+_lock = threading.Lock()
+
+# The average latency of each host in this process.
+_latencies = {}
+
+
+def host(url):
+    """Return the host of url, or None for a local path."""
+    return urlparse.urlparse(url).netloc or None
+
+
+def _load_state():
+    return funcs.read_json_file(STATE_FILE, {})
+
+
+@contextmanager
+def _locked_state():
+    """Yield the state, which is written when the block ends, while holding
+       the lock of this process and the lock file shared with the others.
+    """
+    with _lock:
+        if not os.path.isdir(funcs.CACHE_DIR):
+            os.makedirs(funcs.CACHE_DIR)
+        with open(LOCK_FILE, 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            state = _load_state()
+            yield state
+            funcs.write_json_file(STATE_FILE, state)
+
+
+def _is_open(host_state, now):
+    return (now < host_state.get('open_until', 0) or
+            now < host_state.get('probing_until', 0))
+
+
+def is_open(url):
+    """Return True if requests to the host of url should fail immediately."""
+    name = host(url)
+    if name is None:
+        return False
+    return _is_open(_load_state().get(name, {}), time.time())
+
+
+def allow_request(url, timeout=None):
+    """Return True if a request can be made to the host of url. If its
+       breaker is half open the request is the probe, which holds the probe
+       slot until it is recorded or its timeout has passed.
+    """
+    name = host(url)
+    if name is None:
+        return True
+    now = time.time()
+    host_state = _load_state().get(name, {})
+    if host_state.get('failures', 0) < FAILURE_LIMIT:
+        return True
+    if _is_open(host_state, now):
+        return False
+    # Checked again under the lock as another process may have claimed it.
+    with _locked_state() as state:
+        host_state = state.setdefault(name, {})
+        if _is_open(host_state, now):
+            return False
+        host_state['probing_until'] = now + (timeout or PROBE_SLOT)
+        log.log("Probing {}".format(name))
+        return True
+
+
+def is_tripped(url):
+    """Return True if the breaker of the host of url has opened and not yet
+       closed again, even if a retry is now allowed.
+    """
+    name = host(url)
+    return name is not None and _load_state().get(name, {}).get('failures', 0) >= FAILURE_LIMIT
+
+
+def _update_latency(name, seconds):
+    with _lock:
+        latency = _latencies.get(name, seconds)
+        _latencies[name] = latency + LATENCY_WEIGHT * (seconds - latency)
+
+
+def record_success(url, seconds):
+    name = host(url)
+    if name is None:
+        return
+    _update_latency(name, seconds)
+    # Most requests succeed with the breaker closed, which needs no write.
+    host_state = _load_state().get(name, {})
+    if not (host_state.get('failures') or host_state.get('probing_until') or
+            host_state.get('retry_delay')):
+        return
+    with _locked_state() as state:
+        host_state = state.setdefault(name, {})
+        if host_state.get('failures', 0) >= FAILURE_LIMIT:
+            log.log("{} is available again".format(name))
+        host_state.update(failures=0, open_until=0, retry_delay=0, probing_until=0,
+                          latency=_latencies[name])
+
+
+def record_failure(url):
+    name = host(url)
+    if name is None:
+        return
+    with _locked_state() as state:
+        host_state = state.setdefault(name, {})
+        failures = host_state.get('failures', 0) + 1
+        host_state['failures'] = failures
+        host_state['probing_until'] = 0
+        if name in _latencies:
+            host_state['latency'] = _latencies[name]
+        if failures >= FAILURE_LIMIT:
+            delay = min(host_state.get('retry_delay', 0) * 2 or RETRY_DELAY, MAX_RETRY_DELAY)
+            host_state['retry_delay'] = delay
+            host_state['open_until'] = time.time() + delay
+            log.log("{} failed {} times, not using it for {} seconds"
+                    .format(name, failures, delay))
+
+
+def latency(url):
+    """Return the average request time to the host of url, or None."""
+    name = host(url)
+    if name is None:
+        return None
+    with _lock:
+        if name in _latencies:
+            return _latencies[name]
+    return _load_state().get(name, {}).get('latency')
+
+
+def probe(url, timeout=PROBE_TIMEOUT):
+    """Make a request to url if its breaker allows a retry, record the result
+       and return True if the host is available.
+    """
+    from builds import get_session
+    import requests
+
+    if not allow_request(url, timeout):
+        return False
+    start = time.time()
+    try:
+        response = get_session().head(url, timeout=timeout, allow_redirects=True)
+    except requests.RequestException as e:
+        log.log("Probe of {} failed: {}".format(url, e))
+        record_failure(url)
+        return False
+    if response.status_code >= 500:
+        record_failure(url)
+        return False
+    record_success(url, time.time() - start)
+    return True
@@ -1,9 +1,12 @@
 #! /usr/bin/python
 
+from __future__ import division
+
 import os
+import threading
 from datetime import datetime
-import sqlite3
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
+from contextlib import contextmanager
 
 import log
 
@@ -15,83 +18,372 @@ else:
     HISTORY_FILE = os.path.join(addon.data_path, 'builds.db')
 
 
-FIELDS = ['source', 'version', 'timestamp']
+FIELDS = ['id', 'source', 'version', 'timestamp']
+
+# Where the tar file of a build came from.
+ORIGINS = ('download', 'peer', 'archive', 'cache')
+
+PAGE_SIZE = 50
+
 _Install = namedtuple('Install', FIELDS)
 def _row_factory(cursor, row):
     return _Install(*row)
 
+# The bisect in progress, with the versions of its builds. skipped is a tuple
+# of the versions which could not be tested.
+Bisect = namedtuple('Bisect', 'id source good bad candidate skipped')
+
+BISECT_QUERY = '''SELECT bisects.id, bisects.source, good.version, bad.version,
+                         candidate.version
+                  FROM bisects
+                  JOIN builds AS good ON good.id = good_id
+                  JOIN builds AS bad ON bad.id = bad_id
+                  LEFT JOIN builds AS candidate ON candidate.id = candidate_id
+                  WHERE finished IS NULL
+                  ORDER BY bisects.id DESC LIMIT 1'''
+
+INSTALL_QUERY = '''SELECT installs.id, source, version, timestamp
+                   FROM installs
+                   JOIN builds ON builds.id = build_id'''
+
+# Each migration upgrades the schema by one version, which is stored in the
+# user_version of the database.
+MIGRATIONS = [
+    # The original schema
+    ['''CREATE TABLE IF NOT EXISTS builds
+          (id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT NOT NULL,
+           version TEXT NOT NULL, marked INTEGER default 0, comments TEXT,
+           UNIQUE(source, version))''',
+     '''CREATE UNIQUE INDEX IF NOT EXISTS source_version
+          ON builds (source, version)''',
+     '''CREATE TABLE IF NOT EXISTS installs
+          (id INTEGER PRIMARY KEY AUTOINCREMENT,
+           build_id INTEGER REFERENCES builds(id),
+           timestamp TIMESTAMP NOT NULL)'''],
+
+    # How the tar file of a build was obtained. The install is set when
+    # the installation is confirmed after rebooting.
+    ['''CREATE TABLE IF NOT EXISTS transfers
+          (id INTEGER PRIMARY KEY AUTOINCREMENT,
+           build_id INTEGER NOT NULL REFERENCES builds(id),
+           install_id INTEGER REFERENCES installs(id),
+           timestamp TIMESTAMP NOT NULL,
+           origin TEXT NOT NULL, mirror TEXT)''',
+     '''CREATE TABLE IF NOT EXISTS transfer_phases
+          (transfer_id INTEGER NOT NULL REFERENCES transfers(id),
+           phase TEXT NOT NULL, seconds REAL NOT NULL, bytes INTEGER,
+           PRIMARY KEY (transfer_id, phase))'''],
+
+    # Indexes for finding the installs and transfers of a build
+    ['''CREATE INDEX IF NOT EXISTS installs_build_timestamp
+          ON installs (build_id, timestamp)''',
+     '''CREATE INDEX IF NOT EXISTS transfers_build
+          ON transfers (build_id, install_id)'''],
+
+    # Bisecting the builds of a source. The good and bad builds are narrowed
+    # down by the result of testing each candidate, which is kept as a step.
+    ['''CREATE TABLE IF NOT EXISTS bisects
+          (id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT NOT NULL,
+           good_id INTEGER NOT NULL REFERENCES builds(id),
+           bad_id INTEGER NOT NULL REFERENCES builds(id),
+           candidate_id INTEGER REFERENCES builds(id),
+           started TIMESTAMP NOT NULL, finished TIMESTAMP)''',
+     '''CREATE TABLE IF NOT EXISTS bisect_steps
+          (bisect_id INTEGER NOT NULL REFERENCES bisects(id),
+           build_id INTEGER NOT NULL REFERENCES builds(id),
+           result TEXT NOT NULL, timestamp TIMESTAMP NOT NULL)'''],
+]
+
+_connection = None
+_lock = threading.RLock()
+
+
+def _migrate(conn):
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    for i, statements in enumerate(MIGRATIONS[version:], version + 1):
+        with conn:
+            for statement in statements:
+                conn.execute(statement)
+            # PRAGMA does not accept parameters.
+            conn.execute('PRAGMA user_version = {:d}'.format(i))
+        log.log("Migrated install history database to version {}".format(i))
+
+
+def _get_connection():
+    """Return the connection to the history database, which is opened and
+       migrated to the current schema on first use.
+    """
+    global _connection
+    if _connection is None:
+        # Imported here as it is slow to import and the service only needs
+        # the database once there is a new installation or a bisect.
+        import sqlite3
 
-def maybe_create_database():
-    with sqlite3.connect(HISTORY_FILE) as conn:
-        conn.execute('''CREATE TABLE IF NOT EXISTS builds
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT, source TEXT NOT NULL,
-                         version TEXT NOT NULL, marked INTEGER default 0, comments TEXT,
-                         UNIQUE(source, version))''')
-        
-        conn.execute('''CREATE UNIQUE INDEX IF NOT EXISTS source_version
-                        ON builds (source, version)''')
+        conn = sqlite3.connect(HISTORY_FILE, detect_types=sqlite3.PARSE_DECLTYPES,
+                               check_same_thread=False)
+        # Readers do not block the writer, e.g. the history dialog and the service.
+        conn.execute('PRAGMA journal_mode=WAL')
+        _migrate(conn)
+        _connection = conn
+    return _connection
 
-        conn.execute('''CREATE TABLE IF NOT EXISTS installs
-                        (id INTEGER PRIMARY KEY AUTOINCREMENT,
-                         build_id INTEGER REFERENCES builds(id),
-                         timestamp TIMESTAMP NOT NULL)''')
+
+@contextmanager
+def _transaction():
+    with _lock:
+        conn = _get_connection()
+        with conn:
+            yield conn
+
+
+def _query(sql, params=()):
+    with _lock:
+        cursor = _get_connection().cursor()
+        cursor.row_factory = _row_factory
+        return cursor.execute(sql, params).fetchall()
+
+
+def close():
+    global _connection
+    with _lock:
+        if _connection is not None:
+            _connection.close()
+            _connection = None
+
+
+def _get_or_add_build_id(conn, source, version):
+    conn.execute('''INSERT OR IGNORE INTO builds (source, version)
+                    VALUES (?, ?)''', (source, version))
+    return conn.execute('''SELECT id FROM builds WHERE source = ? AND version = ?''',
+                        (source, version)).fetchone()[0]
 
 
 @log.with_logging("Added install {}|{} to database",
                   "Failed to add install {}|{} to database")
 def add_install(source, build):
-    maybe_create_database()
-    with sqlite3.connect(HISTORY_FILE) as conn:
-        conn.execute('''INSERT OR IGNORE INTO builds (source, version)
-                        VALUES (?, ?)''', (source, build.version))
+    with _transaction() as conn:
+        build_id = _get_or_add_build_id(conn, source, build.version)
+
+        install_id = conn.execute('''INSERT INTO installs (build_id, timestamp)
+                                     VALUES (?, ?)''', (build_id, datetime.now())).lastrowid
 
-        build_id = conn.execute('''SELECT last_insert_rowid()
-                                   FROM builds''').fetchone()[0]
-        if build_id == 0:
-            build_id = get_build_id(source, build.version)
+        conn.execute('''UPDATE transfers SET install_id = ?
+                        WHERE build_id = ? AND install_id IS NULL''',
+                     (install_id, build_id))
 
-        conn.execute('''INSERT INTO installs (build_id, timestamp)
-                        VALUES (?, ?)''', (build_id, datetime.now()))
+
+@log.with_logging("Added transfer of {}|{} to database",
+                  "Failed to add transfer of {}|{} to database")
+def add_transfer(source, build, origin, mirror, phases):
+    """Record how a build was obtained.
+
+       origin is one of ORIGINS, mirror is the host it was downloaded from
+       and phases is a list of (phase, seconds, bytes) tuples.
+    """
+    with _transaction() as conn:
+        build_id = _get_or_add_build_id(conn, source, build.version)
+
+        transfer_id = conn.execute('''INSERT INTO transfers
+                                      (build_id, timestamp, origin, mirror)
+                                      VALUES (?, ?, ?, ?)''',
+                                   (build_id, datetime.now(), origin, mirror)).lastrowid
+
+        conn.executemany('''INSERT INTO transfer_phases (transfer_id, phase, seconds, bytes)
+                            VALUES (?, ?, ?, ?)''',
+                         ((transfer_id,) + tuple(phase) for phase in phases))
 
 
 def get_build_id(source, version):
-    with sqlite3.connect(HISTORY_FILE) as conn:
-        return conn.execute('''SELECT id FROM builds WHERE source = ? AND version = ?''',
-                            (source, version)).fetchone()[0]
+    with _lock:
+        row = _get_connection().execute(
+            '''SELECT id FROM builds WHERE source = ? AND version = ?''',
+            (source, version)).fetchone()
+    return row[0] if row is not None else None
 
 
 @log.with_logging("Retrieved install history for source {}",
                   "Failed to retrieve install history for source {}")
 def get_source_install_history(source):
-    with sqlite3.connect(HISTORY_FILE, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
-        conn.row_factory = _row_factory
-        return conn.execute('''SELECT {}
-                               FROM installs
-                               JOIN builds ON builds.id = build_id
-                               WHERE source = ?'''.format(','.join(FIELDS)),
-                            (source,)).fetchall()
+    return _query(INSTALL_QUERY + ''' WHERE source = ?
+                                     ORDER BY installs.id''', (source,))
+
+
+@log.with_logging("Retrieved install history page",
+                  "Failed to retrieve install history page")
+def get_install_history_page(before=None, limit=PAGE_SIZE):
+    """Return up to limit installs, newest first, which are older than the
+       install before. Pass the last install of a page to get the next page.
+
+       Installs are added in time order so the id gives the same order as the
+       timestamp and the primary key index is used for each page.
+    """
+    if before is None:
+        return _query(INSTALL_QUERY + ''' ORDER BY installs.id DESC
+                                         LIMIT ?''', (limit,))
+    else:
+        return _query(INSTALL_QUERY + ''' WHERE installs.id < ?
+                                         ORDER BY installs.id DESC
+                                         LIMIT ?''', (before.id, limit))
+
+
+def iter_install_history(page_size=PAGE_SIZE):
+    """Yield all the installs, newest first, one page at a time."""
+    page = get_install_history_page(limit=page_size)
+    while page:
+        for install in page:
+            yield install
+        page = get_install_history_page(page[-1], page_size)
 
 
 @log.with_logging("Retrieved full install history",
                   "Failed to retrieve full install history")
 def get_full_install_history():
-    with sqlite3.connect(HISTORY_FILE, detect_types=sqlite3.PARSE_DECLTYPES) as conn:
-        conn.row_factory = _row_factory
-        return conn.execute('''SELECT {}
-                               FROM installs
-                               JOIN builds ON builds.id = build_id'''
-                            .format(','.join(FIELDS))).fetchall()
+    return _query(INSTALL_QUERY + ''' ORDER BY installs.id''')
 
 
 def is_previously_installed(source, build):
-    with sqlite3.connect(HISTORY_FILE) as conn:
-        return bool(conn.execute('''SELECT COUNT(*) FROM installs WHERE
-                                    source = ? AND version = ?''',
-                                 (source, build.version)).fetchone()[0])
+    with _lock:
+        return bool(_get_connection().execute(
+            '''SELECT EXISTS (SELECT 1 FROM installs
+                              JOIN builds ON builds.id = build_id
+                              WHERE source = ? AND version = ?)''',
+            (source, build.version)).fetchone()[0])
+
+
+def get_transfer_phases():
+    """Return (timestamp, source, origin, mirror, phase, seconds, bytes) for
+       every recorded transfer phase, oldest first.
+    """
+    with _lock:
+        return _get_connection().execute(
+            '''SELECT timestamp, source, origin, mirror, phase, seconds, bytes
+               FROM transfer_phases
+               JOIN transfers ON transfers.id = transfer_id
+               JOIN builds ON builds.id = build_id
+               ORDER BY transfers.id''').fetchall()
+
+
+@log.with_logging("Started bisect of {} from {} to {}",
+                  "Failed to start bisect of {} from {} to {}")
+def start_bisect(source, good, bad):
+    """Start bisecting the builds of source between the versions good and bad,
+       finishing any bisect in progress. Return the id of the bisect.
+    """
+    with _transaction() as conn:
+        now = datetime.now()
+        conn.execute('''UPDATE bisects SET finished = ? WHERE finished IS NULL''',
+                     (now,))
+        return conn.execute('''INSERT INTO bisects (source, good_id, bad_id, started)
+                               VALUES (?, ?, ?, ?)''',
+                            (source, _get_or_add_build_id(conn, source, good),
+                             _get_or_add_build_id(conn, source, bad), now)).lastrowid
+
+
+def get_bisect():
+    """Return the Bisect in progress or None."""
+    with _lock:
+        conn = _get_connection()
+        row = conn.execute(BISECT_QUERY).fetchone()
+        if row is None:
+            return None
+        skipped = conn.execute('''SELECT version FROM bisect_steps
+                                  JOIN builds ON builds.id = build_id
+                                  WHERE bisect_id = ? AND result = ?''',
+                               (row[0], 'skip')).fetchall()
+    return Bisect(*row, skipped=tuple(version for version, in skipped))
+
+
+@log.with_logging("Set bisect candidate to {1}",
+                  "Failed to set bisect candidate to {1}")
+def set_bisect_candidate(bisect, version):
+    with _transaction() as conn:
+        conn.execute('''UPDATE bisects SET candidate_id = ? WHERE id = ?''',
+                     (_get_or_add_build_id(conn, bisect.source, version), bisect.id))
+
+
+@log.with_logging("Added bisect result {1}",
+                  "Failed to add bisect result {1}")
+def add_bisect_step(bisect, result):
+    """Record the result of testing the candidate, which is 'good', 'bad' or
+       'skip', and make a good or bad candidate the new good or bad build.
+    """
+    with _transaction() as conn:
+        build_id = _get_or_add_build_id(conn, bisect.source, bisect.candidate)
+        conn.execute('''INSERT INTO bisect_steps (bisect_id, build_id, result, timestamp)
+                        VALUES (?, ?, ?, ?)''',
+                     (bisect.id, build_id, result, datetime.now()))
+        if result in ('good', 'bad'):
+            # The column name is one of two fixed strings.
+            conn.execute('''UPDATE bisects SET {}_id = ? WHERE id = ?'''.format(result),
+                         (build_id, bisect.id))
+        conn.execute('''UPDATE bisects SET candidate_id = NULL WHERE id = ?''',
+                     (bisect.id,))
+
+
+@log.with_logging("Finished bisect", "Failed to finish bisect")
+def finish_bisect(bisect):
+    with _transaction() as conn:
+        conn.execute('''UPDATE bisects SET finished = ? WHERE id = ?''',
+                     (datetime.now(), bisect.id))
+
+
+def percentile(values, fraction):
+    """Return the value at fraction of the sorted values, interpolating
+       between the nearest two.
+    """
+    values = sorted(values)
+    position = (len(values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (position - lower)
+
+
+PERIOD_FMTS = {'day': "%Y-%m-%d", 'week': "%Y-W%W", 'month': "%Y-%m"}
+
+
+def format_throughput_lines(phases, period='month'):
+    """Yield lines with the download throughput percentiles in MB/s for each
+       source and mirror in each period.
+    """
+    groups = OrderedDict()
+    for timestamp, source, origin, mirror, phase, seconds, size in phases:
+        if phase == 'download' and seconds > 0 and size:
+            key = (timestamp.strftime(PERIOD_FMTS[period]), source, mirror or origin)
+            groups.setdefault(key, []).append(size / seconds / 1e6)
+
+    yield "{:10s}  {:30s}  {:30s}  {:>5s}  {:>6s}  {:>6s}  {:>6s}".format(
+        period.capitalize(), "Source", "Mirror", "Count", "p10", "p50", "p90")
+    for (period_str, source, mirror), rates in sorted(groups.iteritems()):
+        yield "{:10s}  {:30s}  {:30s}  {:5d}  {:6.2f}  {:6.2f}  {:6.2f}".format(
+            period_str, source, mirror, len(rates),
+            percentile(rates, 0.1), percentile(rates, 0.5), percentile(rates, 0.9))
+
+
+def format_phase_lines(phases, count=10):
+    """Yield lines with the time taken by each phase and the slowest phases."""
+    by_phase = OrderedDict()
+    for row in phases:
+        by_phase.setdefault(row[4], []).append(row)
+
+    yield "{:20s}  {:>5s}  {:>8s}  {:>8s}  {:>8s}".format(
+        "Phase", "Count", "p50 (s)", "p90 (s)", "Max (s)")
+    for phase, rows in sorted(by_phase.iteritems()):
+        seconds = [row[5] for row in rows]
+        yield "{:20s}  {:5d}  {:8.1f}  {:8.1f}  {:8.1f}".format(
+            phase, len(rows), percentile(seconds, 0.5), percentile(seconds, 0.9),
+            max(seconds))
+
+    yield ""
+    yield "Slowest phases"
+    for timestamp, source, origin, mirror, phase, seconds, size in sorted(
+            phases, key=lambda row: row[5], reverse=True)[:count]:
+        yield "{:16s}  {:20s}  {:8.1f} s  {:>10s}  {:30s}  {}".format(
+            timestamp.strftime("%Y-%m-%d %H:%M"), phase, seconds,
+            "{:.1f} MB".format(size / 1e6) if size else "", source, mirror or origin)
 
 
 def format_history_lines(history):
-    for install in reversed(history):
+    for install in history:
         yield "{:16s}  {:>7s}  {:30s}".format(
             install.timestamp.strftime("%Y-%m-%d %H:%M"), install.version,
             install.source)
@@ -109,6 +401,14 @@ if __name__ == "__main__":
         default="/storage/.kodi/userdata/addon_data/script.openelec.devupdate/builds.db",
         help="path to the install history database \n (default: %(default)s)")
 
+    parser.add_argument(
+        '--report', action='store_true',
+        help="print download throughput and phase timings instead of the history")
+
+    parser.add_argument(
+        '--period', choices=sorted(PERIOD_FMTS), default='month',
+        help="period to group download throughput by (default: %(default)s)")
+
     parser.add_argument(
         '--logdebug', action='store_true',
         help="log all debug messages to the log file ({})".format(log.log_path))
@@ -125,6 +425,16 @@ if __name__ == "__main__":
     if args.logdebug:
         logging.getLogger().setLevel(logging.DEBUG)
 
-    history = get_full_install_history()
-    for line in format_history_lines(history):
+    if args.report:
+        phases = get_transfer_phases()
+        if not phases:
+            print "No transfers recorded"
+            sys.exit()
+        lines = list(format_throughput_lines(phases, args.period))
+        lines.append("")
+        lines.extend(format_phase_lines(phases))
+    else:
+        lines = format_history_lines(iter_install_history())
+
+    for line in lines:
         print line
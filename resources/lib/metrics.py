@@ -0,0 +1,123 @@
+''' Metrics of the requests to the build sources
+
+The extractors record how long each fetch and parse of a source URL took,
+how much was downloaded and how many builds or build infos were found,
+along with the last error. The metrics are kept in a state file so that
+the build select dialog can show them for each source and are also
+written to the log, to show which sources are slow.
+
+    fetch_seconds  time to download the last response
+    bytes          size of the last response
+    fetched_at     time of the last successful fetch
+    parse_seconds  time to extract the builds or infos from the response
+    count          number of builds or infos found
+    error          message of the last error since the last success
+    updated_at     time the metrics were last recorded
+
+The metrics are keyed on the URL of the source or of the page the
+extractor reads, except that the forum posts with the details of each
+build share one key. The metrics of
+a fetch are written together with those of the parse or the error which
+follows it, so the state file is written once for each fetch. Metrics
+which have not been updated for MAX_AGE are removed and at most
+MAX_ENTRIES are kept.
+'''
+
+import os
+import time
+import threading
+
+import funcs, log
+
+
+STATE_FILE = os.path.join(funcs.CACHE_DIR, 'source_metrics.json')
+
+MAX_AGE = 30 * 24 * 60 * 60
+MAX_ENTRIES = 50
+
+_lock = threading.Lock()
+
+# The metrics of fetches which are written with the next parse or error,
+# keyed on the URL.
+_pending = {}
+
+# The identity of the state file when it was last loaded and its contents.
+_loaded = (None, {})
+
+
+def _prune(state, now):
+    urls = sorted((url for url, metrics in state.iteritems()
+                   if now - metrics.get('updated_at', 0) < MAX_AGE),
+                  key=lambda url: state[url]['updated_at'], reverse=True)
+    return dict((url, state[url]) for url in urls[:MAX_ENTRIES])
+
+
+def _update(url, **fields):
+    """Write the fields and any pending fetch metrics of url and return all
+       its metrics.
+    """
+    now = time.time()
+    with _lock:
+        state = funcs.read_json_file(STATE_FILE, {})
+        metrics = state.setdefault(url, {})
+        metrics.update(_pending.pop(url, {}))
+        metrics.update(fields, updated_at=now)
+        funcs.write_json_file(STATE_FILE, _prune(state, now))
+    return metrics
+
+
+def record_fetch(url, seconds, size):
+    with _lock:
+        _pending[url] = dict(fetch_seconds=seconds, bytes=size, fetched_at=time.time(),
+                             error=None)
+
+
+def record_parse(url, seconds, count):
+    metrics = _update(url, parse_seconds=seconds, count=count)
+    log.log("{}: {}".format(url, summary(metrics)))
+
+
+def record_error(url, error):
+    _update(url, error=str(error))
+
+
+def load():
+    """Return the metrics of all the URLs, which must not be changed. The
+       state file is only read again when it has been replaced, as the build
+       select dialog asks for the metrics each time the focus moves.
+    """
+    global _loaded
+    try:
+        st = os.stat(STATE_FILE)
+    except OSError:
+        return {}
+    key = (st.st_ino, st.st_mtime, st.st_size)
+    with _lock:
+        if _loaded[0] != key:
+            _loaded = (key, funcs.read_json_file(STATE_FILE, {}))
+        return _loaded[1]
+
+
+def get(url):
+    """Return the metrics of url, which is empty if there are none."""
+    return load().get(url, {})
+
+
+def age(metrics):
+    """Return the seconds since the last successful fetch, or None."""
+    fetched_at = metrics.get('fetched_at')
+    return time.time() - fetched_at if fetched_at is not None else None
+
+
+def summary(metrics):
+    """Return the metrics as one line of text for the log."""
+    parts = []
+    if 'fetched_at' in metrics:
+        parts.append("fetched {} in {:.2f} s {:.0f} s ago".format(
+            funcs.size_fmt(metrics['bytes'] or 0), metrics['fetch_seconds'], age(metrics)))
+    if 'count' in metrics:
+        parts.append("parsed {} in {:.3f} s".format(
+            metrics['count'], metrics['parse_seconds']))
+    if metrics.get('error'):
+        parts.append("error: {}".format(metrics['error']))
+    return ", ".join(parts)
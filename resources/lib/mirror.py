@@ -0,0 +1,173 @@
+''' Downloading builds into the layout of the archive
+
+Used by sync.py to mirror builds and by the archive warm-up of the service.
+A build is downloaded to a part file, which is kept if the download is
+interrupted and resumed from where it stopped if the server supports it.
+The complete download is then decompressed straight into a source
+directory of the archive, which can be a network path when running in
+Kodi, and added to the manifest of the directory.
+'''
+
+from __future__ import division
+
+import os
+import bz2
+import time
+import threading
+import Queue
+
+import builds, checksums, funcs
+
+
+BLOCK_SIZE = 1048576
+PART_EXT = '.download'
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Budget(object):
+    """Limits the combined rate of the downloads of all threads.
+
+       Each block that is read reserves the next slot of time at the rate of
+       the budget, so the threads take turns and together stay within it.
+    """
+    def __init__(self, bytes_per_second=None):
+        self._rate = bytes_per_second
+        self._next = time.time()
+        self._lock = threading.Lock()
+
+    def take(self, size):
+        """Wait until size bytes can be transferred within the budget."""
+        if not self._rate:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(self._next, now)
+            self._next = start + size / self._rate
+        if start > now:
+            time.sleep(start - now)
+
+
+def run_parallel(func, items, jobs):
+    """Call func with each item using up to jobs threads and return the results."""
+    queue = Queue.Queue()
+    for i, item in enumerate(items):
+        queue.put((i, item))
+    results = [None] * len(items)
+
+    def worker():
+        while True:
+            try:
+                i, item = queue.get_nowait()
+            except Queue.Empty:
+                return
+            results[i] = func(item)
+
+    threads = [threading.Thread(target=worker) for _ in range(min(jobs, len(items)))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    for thread in threads:
+        # Join with a timeout so that Ctrl-C is handled.
+        while thread.is_alive():
+            thread.join(1)
+    return results
+
+
+def _hash_part(hasher, path):
+    with open(path, 'rb') as f:
+        for data in iter(lambda: f.read(BLOCK_SIZE), ''):
+            hasher.update(data)
+
+
+def download(build, part_path, budget=None, wait=None):
+    """Download build to the local part_path, resuming a previous attempt.
+       Return the offset the download was resumed from.
+
+       Each block read is taken from budget if given and wait, if given, is called
+       before each block, e.g. to pause the download. Raises DownloadError if
+       the download fails or does not match the checksum on the server.
+    """
+    import requests
+
+    offset = os.path.getsize(part_path) if os.path.isfile(part_path) else 0
+    try:
+        checksum = build.checksum()
+        try:
+            remote = build.remote_file(offset)
+        except requests.HTTPError:
+            # e.g. the previous download was complete but not decompressed.
+            offset = 0
+            remote = build.remote_file()
+        hasher = checksums.new_hasher(checksum)
+        if build.resumed:
+            _hash_part(hasher, part_path)
+            mode = 'ab'
+        else:
+            offset = 0
+            mode = 'wb'
+
+        with open(part_path, mode) as out:
+            while True:
+                if wait is not None:
+                    wait()
+                data = remote.read(BLOCK_SIZE)
+                if not data:
+                    break
+                if budget is not None:
+                    budget.take(len(data))
+                out.write(data)
+                hasher.update(data)
+        remote.close()
+    except (requests.RequestException, IOError) as e:
+        raise DownloadError(str(e))
+
+    size = os.path.getsize(part_path)
+    if size != build.size:
+        raise DownloadError("incomplete ({} of {})".format(funcs.size_fmt(size),
+                                                           funcs.size_fmt(build.size)))
+
+    if checksum is not None and hasher.hexdigest() != checksum[1]:
+        os.remove(part_path)
+        raise DownloadError("does not match its {} checksum".format(checksum[0]))
+
+    return offset
+
+
+def store(part_path, build, directory):
+    """Decompress the complete download at part_path into directory, remove it
+       and add the build to the manifest of the directory, with the checksum
+       of the tar file. Return the path.
+    """
+    tar_path = os.path.join(directory, build.archive_name)
+    hasher = checksums.new_hasher(None)
+    if not build.compressed:
+        # Hashed locally as the file may be renamed onto a network share.
+        _hash_part(hasher, part_path)
+    if build.compressed or not funcs.vfs_rename(part_path, tar_path):
+        # Files which are being written are not listed in the manifest.
+        temp_path = tar_path + '.tmp'
+        decompressor = bz2.BZ2Decompressor() if build.compressed else None
+        out = funcs.vfs_open(temp_path, 'w')
+        try:
+            with open(part_path, 'rb') as f:
+                for data in iter(lambda: f.read(BLOCK_SIZE), ''):
+                    if decompressor is not None:
+                        data = decompressor.decompress(data)
+                        hasher.update(data)
+                    out.write(data)
+        except:
+            out.close()
+            funcs.vfs_delete(temp_path)
+            raise
+        out.close()
+        if not funcs.vfs_rename(temp_path, tar_path):
+            raise IOError("Unable to rename {}".format(temp_path))
+        os.remove(part_path)
+
+    builds.ArchiveBuildLinkExtractor.add_build(directory, build.archive_name, build,
+                                               funcs.vfs_stat(tar_path)[0],
+                                               (hasher.name.lower(), hasher.hexdigest()))
+    return tar_path
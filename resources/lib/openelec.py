@@ -52,7 +52,19 @@ def update_extlinux():
     subprocess.call(['/usr/bin/extlinux', '--update', '/flash'])
 
 
+# Whether the System partition is large enough for debug builds, which is
+# probed on first use as it does not change while running.
+_debug_system_partition = None
+
+
 def debug_system_partition():
+    global _debug_system_partition
+    if _debug_system_partition is None:
+        _debug_system_partition = _probe_debug_system_partition()
+    return _debug_system_partition
+
+
+def _probe_debug_system_partition():
     try:
         partition = os.path.basename(os.readlink('/dev/disk/by-label/System'))
     except OSError:
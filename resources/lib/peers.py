@@ -0,0 +1,251 @@
+''' Sharing of downloaded builds between boxes on the local network
+
+A box serves the build tar files it already has over HTTP and answers UDP
+broadcast queries so that other boxes can find it. A box which is about to
+download a build first asks its peers whether one of them already has it.
+
+Builds are matched on the name of the decompressed tar file, which includes
+the build version, and on its size if the build source gives it. As any host
+on the network can answer, a peer is only asked for a build whose source
+gives a checksum of the tar file, which the copy is checked against.
+'''
+
+import re
+import uuid
+import time
+import socket
+import threading
+import SocketServer
+import BaseHTTPServer
+from urllib2 import quote, unquote
+
+import log
+
+
+PORT = 47800
+DISCOVERY_PORT = 47801
+
+QUERY = "DEVUPDATE-PEER?"
+REPLY = "DEVUPDATE-PEER"
+
+BLOCK_SIZE = 131072
+
+# Identifies this process so that it ignores its own broadcast queries.
+INSTANCE_ID = uuid.uuid4().hex
+
+
+class PeerRequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    """Serves /builds/<name> from the server index with Range support."""
+    protocol_version = "HTTP/1.1"
+    RANGE_RE = re.compile(r"bytes=(\d+)-(\d*)$")
+
+    def do_HEAD(self):
+        self._respond(send_body=False)
+
+    def do_GET(self):
+        self._respond(send_body=True)
+
+    def _respond(self, send_body):
+        prefix, _, name = self.path.partition('/builds/')
+        try:
+            path, size = self.server.index()[unquote(name)]
+        except KeyError:
+            self._send_headers(404, 0)
+            return
+
+        start, end = 0, size - 1
+        m = self.RANGE_RE.match(self.headers.get('Range', ''))
+        if m:
+            start = int(m.group(1))
+            if m.group(2):
+                end = min(int(m.group(2)), size - 1)
+            if start >= size:
+                self._send_headers(416, 0, {'Content-Range': "bytes */{}".format(size)})
+                return
+            self._send_headers(206, end - start + 1,
+                               {'Content-Range': "bytes {}-{}/{}".format(start, end, size)})
+        else:
+            self._send_headers(200, size)
+
+        if send_body:
+            log.log("Serving {} to peer {}".format(name, self.client_address[0]))
+            self._send_file(path, start, end - start + 1)
+
+    def _send_headers(self, status, length, extra={}):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/x-tar')
+        self.send_header('Content-Length', str(length))
+        self.send_header('Accept-Ranges', 'bytes')
+        for key, value in extra.items():
+            self.send_header(key, value)
+        self.end_headers()
+
+    def _send_file(self, path, start, length):
+        f = self.server.open_file(path)
+        try:
+            if start:
+                f.seek(start)
+            remaining = length
+            while remaining > 0:
+                data = f.read(min(BLOCK_SIZE, remaining))
+                if not data:
+                    break
+                self.wfile.write(data)
+                remaining -= len(data)
+        except socket.error:
+            pass
+        finally:
+            f.close()
+
+    def log_message(self, format, *args):
+        log.log("Peer server: " + format % args)
+
+
+class PeerServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    """HTTP server for the builds returned by index.
+
+       index is a function returning a dictionary of (path, size) tuples keyed
+       on the tar file name and open_file is a function returning a readable,
+       seekable file object for a path.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+    INDEX_TTL = 60
+
+    def __init__(self, index, open_file=open, port=PORT):
+        BaseHTTPServer.HTTPServer.__init__(self, ('', port), PeerRequestHandler)
+        self._index_func = index
+        self._index = None
+        self._index_time = 0
+        self._lock = threading.Lock()
+        self.open_file = open_file
+        self._responder = DiscoveryResponder(self.server_address[1])
+
+    def handle_error(self, request, client_address):
+        log.log("Peer server: error handling request from {}".format(client_address[0]))
+
+    def index(self):
+        with self._lock:
+            if self._index is None or time.time() - self._index_time > self.INDEX_TTL:
+                self._index = self._index_func()
+                self._index_time = time.time()
+            return self._index
+
+    def start(self):
+        for target in (self.serve_forever, self._responder.serve_forever):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+        log.log("Serving builds to peers on port {}".format(self.server_address[1]))
+        return self
+
+    def stop(self):
+        self._responder.stop()
+        self.shutdown()
+        self.server_close()
+
+
+class DiscoveryResponder(object):
+    """Answers broadcast queries with the port of the peer server."""
+    def __init__(self, http_port, port=DISCOVERY_PORT):
+        self._http_port = http_port
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind(('', port))
+        self._running = True
+
+    def serve_forever(self):
+        self._sock.settimeout(1)
+        while self._running:
+            try:
+                data, address = self._sock.recvfrom(1024)
+            except socket.timeout:
+                continue
+            except socket.error:
+                break
+            query, _, instance = data.partition(' ')
+            if query == QUERY and instance != INSTANCE_ID:
+                self._sock.sendto("{} {}".format(REPLY, self._http_port), address)
+
+    def stop(self):
+        self._running = False
+        self._sock.close()
+
+
+def discover(timeout=1.0, port=DISCOVERY_PORT):
+    """Broadcast a query and return the base URLs of the peers which reply
+       within timeout seconds.
+    """
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_BROADCAST, 1)
+    sock.settimeout(timeout)
+    peers = []
+    try:
+        sock.sendto("{} {}".format(QUERY, INSTANCE_ID), ('<broadcast>', port))
+        end_time = time.time() + timeout
+        while time.time() < end_time:
+            sock.settimeout(max(0.01, end_time - time.time()))
+            try:
+                data, address = sock.recvfrom(1024)
+            except socket.timeout:
+                break
+            reply, _, http_port = data.partition(' ')
+            if reply == REPLY and http_port.isdigit():
+                peers.append("http://{}:{}/".format(address[0], http_port))
+    except socket.error as e:
+        log.log("Peer discovery failed: {}".format(e))
+    finally:
+        sock.close()
+    return peers
+
+
+class PeerFinder(object):
+    """Callable which returns the URL and size of a build on a peer, or None.
+       A peer whose copy is not of the expected size, if that is known, is
+       skipped.
+
+       hosts is a list of configured peer addresses ("host" or "host:port")
+       which are tried in addition to any discovered peers.
+    """
+    def __init__(self, hosts=(), discover=False, timeout=1.0):
+        self._hosts = hosts
+        self._discover = discover
+        self._timeout = timeout
+
+    def peers(self):
+        urls = []
+        for host in self._hosts:
+            if ':' not in host:
+                host = "{}:{}".format(host, PORT)
+            urls.append("http://{}/".format(host))
+        if self._discover:
+            urls.extend(url for url in discover(self._timeout) if url not in urls)
+        return urls
+
+    def __call__(self, name, size=None):
+        import requests
+
+        for peer in self.peers():
+            url = "{}builds/{}".format(peer, quote(name))
+            try:
+                response = requests.head(url, timeout=self._timeout)
+            except requests.RequestException:
+                continue
+            if response.status_code != 200:
+                continue
+            try:
+                peer_size = int(response.headers['Content-Length'])
+            except (KeyError, ValueError):
+                log.log("Peer {} did not give the size of {}".format(peer, name))
+                continue
+            if size is not None and peer_size != size:
+                log.log("Peer {} has {} with size {} instead of {}"
+                        .format(peer, name, peer_size, size))
+                continue
+            log.log("Found {} on peer {}".format(name, peer))
+            return url, peer_size
+        return None
+
+
+def parse_hosts(hosts):
+    return [host.strip() for host in hosts.split(',') if host.strip()]
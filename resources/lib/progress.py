@@ -1,13 +1,15 @@
 from __future__ import division
 
 import os
+import sys
 import bz2
 import time
-import hashlib
+import Queue
+import threading
 
 import xbmc, xbmcgui, xbmcvfs
 
-from .script_exceptions import Canceled, WriteError, DecompressError
+from .script_exceptions import Canceled, WriteError, DecompressError, ReadError
 from .funcs import size_fmt
 from .addon import L10n
 
@@ -39,13 +41,34 @@ class ProgressBG(xbmcgui.DialogProgressBG):
         super(ProgressBG, self).update(percent)
 
 
+class _ReadFailure(object):
+    def __init__(self, exc_info):
+        self.exc_info = exc_info
+
+
 class FileProgress(object):
     """Wraps DialogProgress(BG) as a context manager to
-       handle the file progress"""
+       handle the file progress
+
+       Files of at least READ_AHEAD_MIN_SIZE are read ahead in a separate
+       thread into a bounded queue of READ_AHEAD_BUFFERS large blocks, so
+       that reading, e.g. from a network share, overlaps writing, e.g. to
+       the local disk, and the reverse. Smaller files are copied by reading
+       and writing in turn.
+
+       start raises ReadError if the input ends before size bytes are read.
+    """
 
     BLOCK_SIZE = 131072
 
-    def __init__(self, heading, infile, outpath, size, background=False):
+    READ_AHEAD_MIN_SIZE = 8388608
+    READ_AHEAD_BLOCK_SIZE = 1048576
+    READ_AHEAD_BUFFERS = 4
+
+    # Seconds between checks for cancelling while waiting for the reader.
+    POLL_INTERVAL = 0.2
+
+    def __init__(self, heading, infile, outpath, size, background=False, hasher=None):
         self._heading = heading
         self._in_f = infile
         self._outpath = outpath
@@ -58,6 +81,9 @@ class FileProgress(object):
         else:
             self._progress = Progress()       
         self._done = 0
+        # Updated with the data as it is read if given.
+        self._hasher = hasher
+        self._block_size = self.BLOCK_SIZE
  
     def __enter__(self):
         return self
@@ -80,25 +106,94 @@ class FileProgress(object):
         except Exception as e:
             raise WriteError(e)        
         
-        start_time = time.time()
-        while self._done < self._size:
-            if self._progress.iscanceled():
-                raise Canceled
-            data = self._read()
-            try:
-                self._out_f.write(data)
-            except Exception as e:
-                raise WriteError(e)
-            percent = int(self._done * 100 / self._size)
-            bytes_per_second = self._done / (time.time() - start_time)
-            self._progress.update(percent, "{0}/s".format(size_fmt(bytes_per_second)))
+        self._start_time = time.time()
+        if self._size >= self.READ_AHEAD_MIN_SIZE:
+            self._copy_read_ahead()
+        else:
+            while self._done < self._size:
+                if self._progress.iscanceled():
+                    raise Canceled
+                data = self._read()
+                self._write(data, self._done)
+
+    def _write(self, data, done):
+        try:
+            self._out_f.write(data)
+        except Exception as e:
+            raise WriteError(e)
+        percent = int(done * 100 / self._size)
+        bytes_per_second = done / (time.time() - self._start_time)
+        self._progress.update(percent, "{0}/s".format(size_fmt(bytes_per_second)))
+
+    def _copy_read_ahead(self):
+        """Write the blocks which the reader thread has read while it reads
+           the next ones. The progress dialog is only used from this thread.
+        """
+        self._block_size = self.READ_AHEAD_BLOCK_SIZE
+        blocks = Queue.Queue(self.READ_AHEAD_BUFFERS)
+        stop = threading.Event()
+        reader = threading.Thread(target=self._read_ahead, args=(blocks, stop),
+                                  name="Read ahead")
+        reader.daemon = True
+        reader.start()
+        try:
+            while True:
+                if self._progress.iscanceled():
+                    raise Canceled
+                try:
+                    block = blocks.get(timeout=self.POLL_INTERVAL)
+                except Queue.Empty:
+                    continue
+                if block is None:
+                    break
+                if isinstance(block, _ReadFailure):
+                    raise block.exc_info[0], block.exc_info[1], block.exc_info[2]
+                self._write(*block)
+        finally:
+            stop.set()
+            # The reader may be blocked in a read from a stalled share or server,
+            # which closing the file ends. As a daemon thread it is not waited
+            # for any longer than that, so Cancel and errors are not held up.
+            reader.join(self.POLL_INTERVAL)
+            if reader.is_alive():
+                self._in_f.close()
+                reader.join(self.POLL_INTERVAL)
+
+    def _read_ahead(self, blocks, stop):
+        """Read blocks into the queue until the file is read, followed by None,
+           or a _ReadFailure if reading failed. Stop early if stop is set.
+        """
+        def put(item):
+            while not stop.is_set():
+                try:
+                    blocks.put(item, timeout=self.POLL_INTERVAL)
+                    return True
+                except Queue.Full:
+                    pass
+            return False
+
+        try:
+            while self._done < self._size:
+                data = self._read()
+                if not put((data, self._done)):
+                    return
+            put(None)
+        except Exception:
+            put(_ReadFailure(sys.exc_info()))
 
     def _getdata(self):
-        return self._in_f.read(self.BLOCK_SIZE)
+        data = self._in_f.read(self._block_size)
+        if not data:
+            # e.g. the connection was closed, after which every read is empty.
+            raise ReadError("Read ended after {} of {}".format(size_fmt(self._done),
+                                                               size_fmt(self._size)))
+        return data
 
     def _read(self):
         data = self._getdata()
         self._done += len(data)
+        if self._hasher is not None:
+            self._hasher.update(data)
         return data
 
 
@@ -141,31 +236,27 @@ def reboot_countdown(title, line1, count):
     return timed_out
 
 
-def md5sum_verified(md5sum_compare, path, background):
+def hash_members(heading, tar_path, members, background):
+    """Hash the members of the tar file with verify.hash_members showing the progress.
+
+       Raises Canceled if the dialog is canceled.
+    """
     if background:
         verify_progress = ProgressBG()
     else:
         verify_progress = Progress()
 
-    verify_progress.create("Verifying", line1=os.path.basename(path))
-
-    BLOCK_SIZE = 8192
-
-    hasher = hashlib.md5()
-    f = open(path)
+    verify_progress.create(heading, line1=", ".join(m.name for m in members))
+    start_time = time.time()
 
-    done = 0
-    size = os.path.getsize(path)
-    while done < size:
-        if verify_progress.iscanceled():
-            verify_progress.close()
-            return True
-        data = f.read(BLOCK_SIZE)
-        done += len(data)
-        hasher.update(data)
-        percent = int(done * 100 / size)
-        verify_progress.update(percent)
-    verify_progress.close()
+    def update(done, total):
+        bytes_per_second = done / max(time.time() - start_time, 0.001)
+        verify_progress.update(int(done * 100 / max(total, 1)),
+                               "{0}/s".format(size_fmt(bytes_per_second)))
+        return verify_progress.iscanceled()
 
-    md5sum = hasher.hexdigest()
-    return md5sum == md5sum_compare
+    from . import verify
+    try:
+        return verify.hash_members(tar_path, members, update)
+    finally:
+        verify_progress.close()
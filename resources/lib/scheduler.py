@@ -0,0 +1,156 @@
+''' Scheduling of the automatic build checks
+
+Checks are spread out with random jitter so that many boxes restarted at the
+same time do not all contact the build sources at once. Each source has its
+own state which is kept across restarts:
+
+    last_check   time of the last check
+    failures     number of consecutive failed checks
+    next_check   time of the next periodic check
+    not_before   no check of the source is allowed before this time
+'''
+
+import os
+import time
+import random
+
+import xbmc
+
+from . import addon, funcs, log, utils, boot
+
+
+STATE_FILE = os.path.join(addon.data_path, 'build_check.json')
+
+# Seconds after startup within which the boot check is made.
+BOOT_JITTER = 300
+
+# Random delay added to every periodic check as a fraction of the interval.
+JITTER_FRACTION = 0.1
+MAX_JITTER = 1800
+
+# Minimum seconds between any two checks of the same source.
+MIN_RECHECK = 1800
+
+# Upper limit of the delay after repeated failures.
+MAX_BACKOFF = 24 * 3600
+
+POLL_INTERVAL = 60
+
+
+def _load_state():
+    return funcs.read_json_file(STATE_FILE, {})
+
+
+def _interval():
+    return addon.get_int_setting('check_interval') * 3600
+
+
+def _jitter(seconds):
+    return random.uniform(0, seconds)
+
+
+def _periodic_delay():
+    interval = _interval()
+    return interval + _jitter(min(interval * JITTER_FRACTION, MAX_JITTER))
+
+
+def is_allowed(source):
+    """Return True if the source may be checked now."""
+    return time.time() >= _load_state().get(source, {}).get('not_before', 0)
+
+
+def record_check(source, success):
+    """Record the result of a check of source and schedule the next one.
+
+       After a failure the next check is delayed exponentially longer
+       than the normal interval, up to MAX_BACKOFF.
+    """
+    state = _load_state()
+    source_state = state.setdefault(source, {})
+
+    now = time.time()
+    source_state['last_check'] = now
+    if success:
+        source_state['failures'] = 0
+        delay = _periodic_delay()
+        not_before = now + MIN_RECHECK
+    else:
+        failures = source_state.get('failures', 0) + 1
+        source_state['failures'] = failures
+        delay = min(_interval() * 2 ** failures, MAX_BACKOFF)
+        delay += _jitter(delay * JITTER_FRACTION)
+        not_before = now + max(delay, MIN_RECHECK)
+        log.log("Build check of {} failed {} time{}, next check in {:.0f} minutes"
+                .format(source, failures, 's' if failures > 1 else '', delay / 60))
+
+    source_state['next_check'] = now + delay
+    source_state['not_before'] = not_before
+    funcs.write_json_file(STATE_FILE, state)
+
+
+def _defer(source, when):
+    """Provisionally set the next check in case the check script does not
+       record a result, e.g. because an update is already pending.
+    """
+    state = _load_state()
+    state.setdefault(source, {})['next_check'] = when
+    funcs.write_json_file(STATE_FILE, state)
+
+
+def _boot_check_time(source):
+    source_state = _load_state().get(source, {})
+    return max(time.time() + _jitter(BOOT_JITTER), source_state.get('not_before', 0))
+
+
+def _periodic_check_time(source):
+    source_state = _load_state().get(source, {})
+    next_check = source_state.get('next_check')
+    if next_check is None:
+        next_check = time.time() + _periodic_delay()
+    return max(next_check, source_state.get('not_before', 0))
+
+
+def run_build_checks(monitor):
+    """Run the build checks until Kodi exits.
+
+       The first check is made shortly after the network is up and, unless only
+       checking on boot, further checks are made periodically.
+    """
+    # Remove the fixed alarm set by older versions.
+    xbmc.executebuiltin("CancelAlarm(devupdatecheck, silent)")
+
+    # The boot check is scheduled from when the network is up.
+    if not boot.wait_for_network(monitor):
+        return
+
+    source = addon.get_setting('source_name')
+    mode = 'checkonboot'
+    check_time = _boot_check_time(source)
+    log.log("Scheduled boot build check in {:.0f} seconds".format(check_time - time.time()))
+
+    while not monitor.waitForAbort(max(0, min(check_time - time.time(), POLL_INTERVAL))):
+        if time.time() < check_time:
+            continue
+
+        if addon.get_bool_setting('check') and is_allowed(source):
+            _defer(source, time.time() + _periodic_delay())
+            log.log("Running scheduled build check ({})".format(mode))
+            xbmc.executebuiltin(utils.make_runscript(mode))
+
+        if addon.get_bool_setting('archive') and addon.get_bool_setting('archive_warmup'):
+            log.log("Running archive warm-up")
+            xbmc.executebuiltin(utils.make_runscript('warmup'))
+
+        if addon.get_bool_setting('check_onbootonly'):
+            log.log("Only checking for builds on boot")
+            monitor.waitForAbort()
+            break
+
+        # Allow a few seconds for the check to record its result.
+        if monitor.waitForAbort(POLL_INTERVAL):
+            break
+
+        mode = 'checkperiodic'
+        source = addon.get_setting('source_name')
+        check_time = _periodic_check_time(source)
+        log.log("Next build check at {}".format(time.ctime(check_time)))
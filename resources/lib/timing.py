@@ -0,0 +1,187 @@
+''' Timing of the update phases and optional profiling
+
+Each timed phase is a span. When a span ends a JSON record is appended to
+the timing log with its duration, CPU time, bytes processed and any other
+fields, so that slow updates can be analysed afterwards:
+
+    with timing.span('download', url=build.url) as s:
+        ...
+        s.set(bytes=size)
+
+Spans can be nested and each record includes the name of its parent span
+and an id shared by all the spans of one run.
+'''
+
+import os
+import sys
+import json
+import time
+import resource
+import functools
+import threading
+import cStringIO
+from contextlib import contextmanager
+
+import log
+
+try:
+    import addon
+except ImportError:
+    LOG_DIR = os.path.expanduser('~')
+else:
+    LOG_DIR = addon.data_path
+
+try:
+    import tracemalloc
+except ImportError:
+    # Not available before Python 3.4.
+    tracemalloc = None
+
+
+LOG_FILE = os.path.join(LOG_DIR, 'timing.log')
+MAX_LOG_SIZE = 1024 * 1024
+
+RUN_ID = "{}-{}".format(int(time.time()), os.getpid())
+
+_local = threading.local()
+_write_lock = threading.Lock()
+
+
+def _cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def _stack():
+    try:
+        return _local.stack
+    except AttributeError:
+        _local.stack = []
+        return _local.stack
+
+
+class Span(object):
+    """A timed phase. Use span() to create one."""
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = fields
+
+    def set(self, **fields):
+        """Add fields, e.g. bytes or a count, to the record of the span."""
+        self.fields.update(fields)
+
+    def __enter__(self):
+        stack = _stack()
+        self.parent = stack[-1].name if stack else None
+        stack.append(self)
+        self._start = time.time()
+        self._cpu_start = _cpu_seconds()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.seconds = seconds = time.time() - self._start
+        _stack().remove(self)
+
+        record = {'run': RUN_ID,
+                  'script': os.path.basename(sys.argv[0]),
+                  'span': self.name,
+                  'parent': self.parent,
+                  'start': round(self._start, 3),
+                  'seconds': round(seconds, 3),
+                  'cpu_seconds': round(_cpu_seconds() - self._cpu_start, 3)}
+        if exc_type is not None:
+            record['error'] = exc_type.__name__
+        record.update(self.fields)
+        _write_record(record)
+
+        log.log("{} took {:.3f} seconds".format(self.name, seconds))
+
+
+def span(name, **fields):
+    return Span(name, fields)
+
+
+def timed(name):
+    """Decorator to time each call of a function as a span."""
+    def wrap(func):
+        @functools.wraps(func)
+        def timed_call(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return timed_call
+    return wrap
+
+
+@log.with_logging(msg_error="Unable to write timing record")
+def _write_record(record):
+    with _write_lock:
+        if not os.path.isdir(LOG_DIR):
+            os.makedirs(LOG_DIR)
+        try:
+            if os.path.getsize(LOG_FILE) > MAX_LOG_SIZE:
+                os.rename(LOG_FILE, LOG_FILE + '.1')
+        except OSError:
+            pass
+        with open(LOG_FILE, 'a') as f:
+            f.write(json.dumps(record, sort_keys=True) + '\n')
+
+
+def read_records(path=LOG_FILE):
+    """Return the timing records from the log, oldest first."""
+    records = []
+    for p in (path + '.1', path):
+        try:
+            with open(p) as f:
+                records.extend(json.loads(line) for line in f if line.strip())
+        except (IOError, ValueError):
+            pass
+    return records
+
+
+@contextmanager
+def profiling(name, enabled=True, directory=LOG_DIR):
+    """Profile the enclosed code with cProfile if enabled.
+
+       The profile is saved as <name>-<time>.prof, which can be loaded with
+       pstats, along with a text summary of the top functions and the memory
+       use in <name>-<time>.txt.
+    """
+    if not enabled:
+        yield
+        return
+
+    import cProfile
+    import pstats
+
+    log.log("Profiling {}".format(name))
+    if tracemalloc is not None:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+
+        base_path = os.path.join(directory, "{}-{}".format(
+            name, time.strftime('%Y%m%d%H%M%S')))
+        profiler.dump_stats(base_path + '.prof')
+
+        summary = cStringIO.StringIO()
+        stats = pstats.Stats(profiler, stream=summary)
+        stats.sort_stats('cumulative').print_stats(30)
+
+        # ru_maxrss is in kilobytes on Linux.
+        summary.write("Peak RSS: {} KB\n".format(
+            resource.getrusage(resource.RUSAGE_SELF).ru_maxrss))
+        if tracemalloc is not None:
+            current, peak = tracemalloc.get_traced_memory()
+            summary.write("Traced memory: {} KB, peak {} KB\n".format(
+                current // 1024, peak // 1024))
+            for stat in tracemalloc.take_snapshot().statistics('lineno')[:20]:
+                summary.write("{}\n".format(stat))
+            tracemalloc.stop()
+
+        with open(base_path + '.txt', 'w') as f:
+            f.write(summary.getvalue())
+        log.log("Saved profile to {}.prof".format(base_path))
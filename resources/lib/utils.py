@@ -7,9 +7,9 @@ import sys
 import functools
 from urlparse import urlparse
 
-import xbmc, xbmcaddon, xbmcgui
+import xbmc, xbmcaddon, xbmcgui, xbmcvfs
 
-from . import openelec, log, addon, funcs, history, builds
+from . import openelec, log, addon, funcs, builds
 from .addon import L10n
 
 
@@ -104,6 +104,13 @@ def ensure_trailing_slash(path):
     return path if path.endswith('/') else path + '/'
 
 
+def get_archive_root():
+    if addon.get_bool_setting('archive'):
+        return ensure_trailing_slash(addon.get_setting('archive_root'))
+    else:
+        return None
+
+
 @log.with_logging(msg_error="Unable to check if another instance is running")
 def is_running():
     running = xbmcgui.Window(10000).getProperty('DevUpdateRunning') == 'True'
@@ -171,22 +178,21 @@ def make_runscript(arg):
     return "RunScript({}, {})".format(addon.info('id'), arg)
 
 
-def format_build(build):
-    return "[COLOR=lightskyblue][B]{}[/COLOR][/B]".format(build)
+def maybe_prefetch_bisect_builds():
+    from . import history
+
+    # The main script downloads the builds as it needs to import requests.
+    if history.get_bisect() is not None:
+        xbmc.executebuiltin(make_runscript('prefetch'))
 
 
-def setup_build_check():
-    xbmc.executebuiltin(make_runscript('checkonboot'))
-    if not addon.get_bool_setting('check_onbootonly'):
-        interval = addon.get_int_setting('check_interval')
-        log.log("Starting build check timer for every {:d} hour{}"
-                .format(interval, 's' if interval > 1 else ''))
-        cmd = ("AlarmClock(devupdatecheck, {}, {:02d}:00:00, silent, loop)".
-               format(make_runscript('checkperiodic'), interval))
-        xbmc.executebuiltin(cmd)
+def format_build(build):
+    return "[COLOR=lightskyblue][B]{}[/COLOR][/B]".format(build)
 
 
 def maybe_confirm_installation(selected, installed_build):
+    from . import history
+
     source, selected_build = selected
     log.log("Selected build: {}".format(selected_build))
     log.log("Installed build: {}".format(installed_build))
@@ -225,7 +231,11 @@ def add_custom_sources(sources):
                 custom_url = addon.get_setting('custom_url' + suffix)
                 scheme, netloc = urlparse(custom_url)[:2]
                 if not scheme in ('http', 'https') or not netloc:
-                    bad_url(custom_url, L10n(32066))
+                    if custom_url and xbmcvfs.exists(ensure_trailing_slash(custom_url)):
+                        # A local or network directory, e.g. a USB stick.
+                        sources[custom_name] = builds.ArchiveBuildsURL(custom_url)
+                    else:
+                        bad_url(custom_url, L10n(32066))
                     continue
 
                 custom_extractors = (builds.BuildLinkExtractor,
@@ -238,4 +248,38 @@ def add_custom_sources(sources):
                 sources[custom_name] = builds.BuildsURL(
                     custom_url, extractor=custom_extractors[build_type_index], **kwargs)
             elif build_type_index == 3:
-                sources["DarkAngel2401 Dual Audio Builds"] = builds.dual_audio_builds
+                sources["DarkAngel2401 Dual Audio Builds"] = builds.dual_audio_builds()
+
+
+def _peer_index():
+    """Return the update and archived tar files which can be served to peers."""
+    index = dict((os.path.basename(path), (path, os.path.getsize(path)))
+                 for path in funcs.update_files())
+
+    archive_root = get_archive_root()
+    if archive_root is not None:
+        for source_dir in xbmcvfs.listdir(archive_root)[0]:
+            source_path = ensure_trailing_slash(os.path.join(archive_root, source_dir))
+            for name in xbmcvfs.listdir(source_path)[1]:
+                if name.endswith('.tar') and name not in index:
+                    path = os.path.join(source_path, name)
+                    index[name] = (path, xbmcvfs.Stat(path).st_size())
+    return index
+
+
+def maybe_start_peer_server():
+    if addon.get_bool_setting('peer_serve'):
+        from . import peers
+        try:
+            return peers.PeerServer(_peer_index, xbmcvfs.File).start()
+        except Exception as e:
+            log.log_error("Unable to start peer server: {}".format(e))
+    return None
+
+
+def get_peer_finder():
+    if addon.get_bool_setting('peer_download'):
+        from . import peers
+        hosts = peers.parse_hosts(addon.get_setting('peer_hosts'))
+        return peers.PeerFinder(hosts, addon.get_bool_setting('peer_discover'))
+    return None
@@ -0,0 +1,156 @@
+''' Verification of the update images in a build tar file
+
+The image members are found by reading the tar headers only as far as the
+last one needed, and each image is hashed straight from its offset in the
+tar file in its own thread. hashlib releases the GIL while hashing large
+blocks so the images are hashed at the same time.
+
+A successful verification of a copy of the tar file, e.g. in the archive,
+is recorded in a sidecar file next to it. The record is keyed on the size
+and modification time of the copy, the md5 sums in the tar and the digest
+of the whole tar file, which is computed while it is copied. A tar restored
+from the copy is not verified again if the digest of the data read from
+the copy matches, so a copy which was corrupted is verified again.
+'''
+
+import os
+import hashlib
+import tarfile
+import threading
+from collections import namedtuple
+from contextlib import closing
+
+import funcs, log
+from script_exceptions import Canceled
+
+
+BLOCK_SIZE = 1048576
+
+SIDECAR_EXT = '.verified'
+
+# An image in the tar file and the md5 sum from its .md5 file.
+Member = namedtuple('Member', 'name offset size md5sum')
+
+
+def find_images(tar_path, names):
+    """Return a dictionary of the Members for the image names which are in
+       the tar file along with their .md5 files.
+    """
+    wanted = {}
+    for name in names:
+        wanted[os.path.join('target', name)] = name
+        wanted[os.path.join('target', name + '.md5')] = name + '.md5'
+
+    found = {}
+    with closing(tarfile.open(tar_path, 'r')) as tf:
+        for ti in tf:
+            for suffix, name in wanted.iteritems():
+                if ti.name.endswith(suffix):
+                    if name.endswith('.md5'):
+                        found[name] = tf.extractfile(ti).read().split()[0]
+                    else:
+                        found[name] = ti
+                    break
+            if len(found) == len(wanted):
+                break
+
+    members = {}
+    for name in names:
+        if name in found and name + '.md5' in found:
+            ti = found[name]
+            members[name] = Member(name, ti.offset_data, ti.size, found[name + '.md5'])
+    return members
+
+
+class _Hasher(threading.Thread):
+    """Computes the md5 sum of a member by reading it from the tar file."""
+    def __init__(self, tar_path, member, stop):
+        super(_Hasher, self).__init__(name="Verify {}".format(member.name))
+        self.daemon = True
+        self._tar_path = tar_path
+        self._member = member
+        self._stop_event = stop
+        self.done = 0
+        self.md5sum = None
+        self.error = None
+
+    def run(self):
+        hasher = hashlib.md5()
+        remaining = self._member.size
+        try:
+            with open(self._tar_path, 'rb') as f:
+                f.seek(self._member.offset)
+                while remaining > 0 and not self._stop_event.is_set():
+                    data = f.read(min(BLOCK_SIZE, remaining))
+                    if not data:
+                        break
+                    hasher.update(data)
+                    remaining -= len(data)
+                    self.done += len(data)
+        except (IOError, OSError) as e:
+            self.error = e
+        else:
+            if remaining == 0:
+                self.md5sum = hasher.hexdigest()
+
+
+def hash_members(tar_path, members, progress=None, interval=0.2):
+    """Return a dictionary of the md5 sums of the members of the tar file,
+       which are None if a member could not be read completely.
+
+       progress is called from the calling thread every interval seconds
+       with the bytes hashed and the total bytes, and can return True to
+       stop hashing, which raises Canceled.
+    """
+    stop = threading.Event()
+    hashers = [_Hasher(tar_path, member, stop) for member in members]
+    for hasher in hashers:
+        hasher.start()
+
+    total = sum(member.size for member in members)
+    try:
+        alive = hashers
+        while alive:
+            if progress is not None and progress(sum(h.done for h in hashers), total):
+                raise Canceled
+            alive[0].join(interval)
+            alive = [hasher for hasher in alive if hasher.is_alive()]
+    finally:
+        stop.set()
+
+    for hasher in hashers:
+        if hasher.error is not None:
+            log.log("Unable to read {}: {}".format(hasher.name, hasher.error))
+    return dict((member.name, hasher.md5sum) for member, hasher in zip(members, hashers))
+
+
+def _sidecar_key(path, members, digest):
+    size, mtime = funcs.vfs_stat(path)
+    return {'size': size,
+            'mtime': int(mtime),
+            'md5sums': dict((member.name, member.md5sum) for member in members),
+            'digest': list(digest)}
+
+
+def is_verified(copy_path, tar_path, members, digest):
+    """Return True if a verification of copy_path was recorded which matches
+       it as it is now, the members of tar_path, its copy, and the
+       (algorithm, digest) of the data copied from it.
+    """
+    if digest is None:
+        return False
+    try:
+        key = _sidecar_key(copy_path, members, digest)
+    except (IOError, OSError):
+        return False
+    return (funcs.vfs_read_json_file(copy_path + SIDECAR_EXT) == key and
+            os.path.getsize(tar_path) == key['size'])
+
+
+@log.with_logging(msg_error="Unable to record verification of {}")
+def record_verified(copy_path, members, digest):
+    """Record that the tar file with the (algorithm, digest) and copy_path,
+       its copy, was verified.
+    """
+    funcs.vfs_write_json_file(copy_path + SIDECAR_EXT,
+                              _sidecar_key(copy_path, members, digest))
@@ -0,0 +1,97 @@
+''' Keeping the newest builds of a source in the archive
+
+After each build check the service runs the main script to warm up the
+archive: the newest builds of the selected source which are not in the
+archive are downloaded and stored in it in the same layout as an install
+does, so they can be installed or rolled back to without a download.
+
+The warm-up has a low priority. The downloads share one bandwidth budget,
+only a few run at the same time and they pause while a video is playing
+or a build is being installed. The part files are kept in the temp
+directory, as network files cannot be appended to, and an interrupted
+download is resumed on the next run.
+'''
+
+import os
+import time
+
+import xbmc, xbmcgui
+
+from . import builds, utils, log, mirror, timing, script_exceptions
+
+
+PAUSE_CHECK_INTERVAL = 5
+
+RUNNING_PROPERTY = 'DevUpdateWarmupRunning'
+
+
+def is_running():
+    return xbmcgui.Window(10000).getProperty(RUNNING_PROPERTY) == 'True'
+
+
+def set_running(running):
+    if running:
+        xbmcgui.Window(10000).setProperty(RUNNING_PROPERTY, 'True')
+    else:
+        xbmcgui.Window(10000).clearProperty(RUNNING_PROPERTY)
+
+
+def missing_builds(build_links, directory, count):
+    """Return those of the newest count builds which are not in directory."""
+    archived = builds.ArchiveBuildLinkExtractor.archived_names(directory)
+    return [build for build in build_links[:count] if build.archive_name not in archived]
+
+
+class ArchiveWarmup(object):
+    """Downloads builds into an archive directory in the background."""
+    def __init__(self, directory, part_dir, monitor, bytes_per_second=None, jobs=1):
+        self._directory = directory
+        self._part_dir = part_dir
+        self._monitor = monitor
+        self._budget = mirror.Budget(bytes_per_second)
+        self._jobs = jobs
+        self._next_check = 0
+
+    def _should_pause(self):
+        return xbmc.Player().isPlayingVideo() or utils.is_running()
+
+    def _wait(self):
+        """Pause while a video is playing or a build is being installed.
+           Raise Canceled if Kodi is exiting.
+        """
+        if self._monitor.abortRequested():
+            raise script_exceptions.Canceled
+        # Checked every few seconds rather than for every block.
+        if time.time() < self._next_check:
+            return
+        while self._should_pause():
+            if self._monitor.waitForAbort(PAUSE_CHECK_INTERVAL):
+                raise script_exceptions.Canceled
+        self._next_check = time.time() + PAUSE_CHECK_INTERVAL
+
+    def _download(self, build):
+        part_path = os.path.join(self._part_dir, build.archive_name + mirror.PART_EXT)
+        try:
+            with timing.span('warmup', url=build.url) as span:
+                offset = mirror.download(build, part_path, self._budget, self._wait)
+                tar_path = mirror.store(part_path, build, self._directory)
+                span.set(bytes=build.size - offset, resumed=bool(offset))
+        except mirror.DownloadError as e:
+            log.log("Download of {} failed: {}".format(build.url, e))
+        except (IOError, OSError) as e:
+            log.log("Unable to archive {}: {}".format(build.url, e))
+        except script_exceptions.Canceled:
+            log.log("Archive warm-up of {} stopped".format(build.url))
+        else:
+            log.log("Archived {}".format(tar_path))
+            return True
+        return False
+
+    def run(self, build_links, count):
+        """Archive those of the newest count builds which are not archived.
+           Return the number of builds archived.
+        """
+        missing = missing_builds(build_links, self._directory, count)
+        log.log("Archive warm-up: {} of the newest {} builds to download".format(
+            len(missing), count))
+        return mirror.run_parallel(self._download, missing, self._jobs).count(True)
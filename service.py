@@ -6,19 +6,34 @@ import _strptime
 
 import xbmc
 
-from resources.lib import utils, rpi, funcs, log
+from resources.lib import utils, rpi, funcs, log, scheduler, boot
 
 log.log_version()
 
-rpi.maybe_restore_config()
+monitor = xbmc.Monitor()
 
-funcs.maybe_update_extlinux()
+tasks = boot.BootTasks(monitor)
+
+# Restores the overclock settings and restarts, so has to run first.
+tasks.add('restore_config', rpi.maybe_restore_config, critical=True)
+
+tasks.add('update_extlinux', funcs.maybe_update_extlinux)
 
 # Need to call out to the main script here
 # because sys.path is only set when running the main script
 # and the builds module needs to import requests
-xbmc.executebuiltin(utils.make_runscript('confirm'))
+tasks.add('confirm', lambda: xbmc.executebuiltin(utils.make_runscript('confirm')))
+
+tasks.add('install_cmdline_script', utils.install_cmdline_script)
+
+tasks.add('peer_server', utils.maybe_start_peer_server, network=True)
+
+tasks.add('bisect_prefetch', utils.maybe_prefetch_bisect_builds, network=True)
+
+tasks.run()
 
-utils.setup_build_check()
+scheduler.run_build_checks(monitor)
 
-utils.install_cmdline_script()
+peer_server = tasks.results.get('peer_server')
+if peer_server is not None:
+    peer_server.stop()
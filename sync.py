@@ -0,0 +1,164 @@
+#! /usr/bin/python
+''' Mirror the builds of several arches and sources without interaction
+
+The builds are listed for every combination of arch and source at the same
+time. The builds which are not already in the mirror are downloaded in
+parallel, decompressed and stored in the same layout as the archive, a
+directory for each source containing the build tar files and a manifest,
+so the mirror can be used as an archive or a local directory source.
+
+Interrupted downloads are kept as .download files and resumed on the next
+run if the server supports it.
+
+    python sync.py --arch RPi.arm --arch RPi2.arm --source "Milhouse Builds" \\
+                   --count 5 /srv/openelec
+'''
+
+import sys
+import os
+import time
+import threading
+from argparse import ArgumentParser
+from urlparse import urlparse
+
+from resources.lib.funcs import size_fmt, add_deps_to_path
+add_deps_to_path()
+
+import requests
+
+from resources.lib import builds, mirror
+
+
+# Serialises the output of the worker threads.
+_print_lock = threading.Lock()
+
+
+def report(message):
+    with _print_lock:
+        print message
+        sys.stdout.flush()
+
+
+def get_build_url(source, releases):
+    """Return the name and BuildsURL of source, which is a source name or a URL,
+       for the arch of the current context, or None if it is not available.
+    """
+    urls = builds.sources()
+    if source in urls:
+        return source, urls[source]
+
+    parsed = urlparse(source)
+    if parsed.scheme in ('http', 'https') and parsed.netloc:
+        extractor = builds.ReleaseLinkExtractor if releases else builds.BuildLinkExtractor
+        return parsed.netloc, builds.BuildsURL(source, extractor=extractor)
+    return None
+
+
+class Job(object):
+    """A build to download into a source directory of the mirror."""
+    def __init__(self, arch, build, directory):
+        self.arch = arch
+        self.build = build
+        self.directory = directory
+
+    @property
+    def tar_path(self):
+        return os.path.join(self.directory, self.build.archive_name)
+
+    def __str__(self):
+        return "{} {}".format(self.arch, self.build.archive_name)
+
+
+def list_jobs(arch, source, args):
+    """Return the jobs for the builds of source for arch missing from the mirror."""
+    with builds.context(arch=arch, timeout=args.timeout):
+        build_url = get_build_url(source, args.releases)
+        if build_url is None:
+            report('"{}" is not available for {}'.format(source, arch))
+            return []
+        name, build_url = build_url
+
+        try:
+            links = build_url.builds()
+        except (requests.RequestException, builds.BuildURLError) as e:
+            report("Unable to list {} for {}: {}".format(name, arch, e))
+            return []
+
+        if args.count is not None:
+            links = links[:args.count]
+
+        directory = os.path.join(args.directory, name)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        mirrored = builds.ArchiveBuildLinkExtractor.archived_names(directory)
+
+    jobs = [Job(arch, build, directory) for build in links
+            if build.archive_name not in mirrored]
+    report("{} for {}: {} builds, {} to download".format(name, arch, len(links), len(jobs)))
+    return jobs
+
+
+def download(job, timeout):
+    """Download the build of job to the mirror, resuming a previous attempt.
+       Return True if successful.
+    """
+    build = job.build
+    part_path = job.tar_path + mirror.PART_EXT
+
+    with builds.context(arch=job.arch, timeout=timeout):
+        start_time = time.time()
+        try:
+            offset = mirror.download(build, part_path)
+        except mirror.DownloadError as e:
+            report("Download of {} failed: {}".format(job, e))
+            return False
+
+        size = build.size
+        seconds = time.time() - start_time
+        report("Downloaded {} ({}, {}/s{})".format(
+            job, size_fmt(size), size_fmt((size - offset) / max(seconds, 0.001)),
+            ", resumed from {}".format(size_fmt(offset)) if offset else ""))
+
+        try:
+            mirror.store(part_path, build, job.directory)
+        except (IOError, OSError) as e:
+            report("Unable to decompress {}: {}".format(job, e))
+            return False
+    return True
+
+
+def main():
+    parser = ArgumentParser(description='Mirror OpenELEC builds for several arches '
+                                        'and sources')
+    parser.add_argument('directory',
+                        help='mirror directory, with a subdirectory for each source')
+    parser.add_argument('-a', '--arch', action='append', required=True,
+                        help='build type to mirror (e.g. RPi2.arm), can be repeated')
+    parser.add_argument('-s', '--source', action='append', required=True,
+                        help='source name or URL to mirror, can be repeated')
+    parser.add_argument('-r', '--releases', action='store_true',
+                        help='source URLs have releases instead of development builds')
+    parser.add_argument('-n', '--count', type=int,
+                        help='mirror only the newest COUNT builds of each source '
+                             '(default: all)')
+    parser.add_argument('-j', '--jobs', type=int, default=4,
+                        help='parallel downloads (default: %(default)s)')
+    parser.add_argument('--timeout', type=float, default=30,
+                        help='network timeout in seconds (default: %(default)s)')
+    args = parser.parse_args()
+
+    targets = [(arch, source) for arch in args.arch for source in args.source]
+    jobs = mirror.run_parallel(lambda target: list_jobs(target[0], target[1], args),
+                        targets, len(targets))
+    jobs = [job for arch_jobs in jobs for job in arch_jobs]
+
+    results = mirror.run_parallel(lambda job: download(job, args.timeout), jobs, args.jobs)
+
+    failed = results.count(False)
+    print "{} builds downloaded, {} failed".format(len(jobs) - failed, failed)
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()